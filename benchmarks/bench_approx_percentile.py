@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Speed and accuracy of 'approx_percentile' compared to the exact
+'nanpercentile', for hourly grids and for daily percentiles made by merging
+the hourly sketches instead of summarizing a day of grids again.
+
+    python benchmarks/bench_approx_percentile.py [rows] [cols] [hours]
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from tablizer.summarizer import Summarizer
+from tablizer.tablizer import resample_sketches
+
+percentiles = [5, 95]
+
+
+def timed(function):
+    """Run function, returns (result, seconds)."""
+
+    start = time.perf_counter()
+    result = function()
+
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    cols = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    hours = int(sys.argv[3]) if len(sys.argv) > 3 else 24
+
+    rng = np.random.RandomState(0)
+    dates = pd.date_range('2019-01-01', periods=hours, freq='H')
+    grids = [rng.gamma(2.0, 3.0, size=(rows, cols)) - 2 for d in dates]
+
+    print('{} hourly {} x {} grids'.format(hours, rows, cols))
+
+    for method, kwargs in [('nanpercentile', {}),
+                           ('approx_percentile', {'keep_sketches': True})]:
+        summarizer = Summarizer([method], percentiles, 6, **kwargs)
+        result, seconds = timed(lambda: [summarizer(g, d)
+                                         for g, d in zip(grids, dates)])
+        frame = summarizer.to_frame()
+
+        print('{:>18}: {:8.4f} s/grid'.format(method, seconds / hours))
+
+        if method == 'nanpercentile':
+            exact = frame.values
+        else:
+            error = np.abs(frame.values - exact) / np.abs(exact)
+            print('{:>18}  max relative error {:.5f}'.format('', error.max()))
+
+    # daily percentiles, exact needs every grid again
+    stack = np.stack(grids)
+    exact, seconds = timed(lambda: np.nanpercentile(stack, percentiles))
+    print('{:>18}: {:8.4f} s/day'.format('daily exact', seconds))
+
+    daily, seconds = timed(lambda: resample_sketches(
+        summarizer.sketches(), 'D', percentiles, 6))
+    error = np.abs(daily.values[0] - exact) / np.abs(exact)
+    print('{:>18}: {:8.4f} s/day, max relative error {:.5f}'.format(
+          'daily merged', seconds, error.max()))
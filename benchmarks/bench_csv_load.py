@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Rows per second stored with one store() call per hourly result, into a
+sqlite database with the WAL profile inside bulk_load(), and into a csv
+database, then the time to read the run back from each.
+
+    python benchmarks/bench_csv_load.py [hours] [variables]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from tablizer import csvstore
+from tablizer.defaults import Units
+from tablizer.tablizer import store, bulk_load, get_existing_records
+
+functions = ['nanmean', 'nanmin', 'nanmax', 'nanstd', 'nanpercentile_25',
+             'nanpercentile_75']
+
+
+def load(database, location, hours, variables):
+    """Store one result row per hour and variable."""
+
+    rng = np.random.RandomState(0)
+    dates = pd.date_range('2018-10-01', periods=hours, freq='H')
+
+    for variable in sorted(Units.units)[:variables]:
+        for date in dates:
+            values = pd.DataFrame(rng.normal(size=(1, len(functions))),
+                                  index=[date], columns=functions)
+            store(values, variable, database, location, 'wy2019', 1, 1,
+                  date.to_pydatetime())
+
+
+if __name__ == '__main__':
+
+    hours = int(sys.argv[1]) if len(sys.argv) > 1 else 720
+    variables = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    rows = hours * variables * len(functions)
+
+    tmp = tempfile.mkdtemp()
+
+    try:
+        print('{} store() calls, {} rows'.format(hours * variables, rows))
+
+        for database, name in [('sqlite', 'results.db'), ('csv', 'results')]:
+            location = os.path.join(tmp, name)
+            start = time.perf_counter()
+
+            if database == 'sqlite':
+                with bulk_load(location, 'sqlite'):
+                    load(database, location, hours, variables)
+            else:
+                load(database, location, hours, variables)
+                csvstore.close(location)
+
+            seconds = time.perf_counter() - start
+            print('{:>8} store: {:8.2f} s, {:10.0f} rows/s'.format(
+                  database, seconds, rows / seconds))
+
+            start = time.perf_counter()
+            df = get_existing_records(location, database, run_name='wy2019')
+            print('{:>8} read: {:8.2f} s, {} records'.format(
+                  database, time.perf_counter() - start, len(df)))
+
+    finally:
+        shutil.rmtree(tmp)
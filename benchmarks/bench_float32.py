@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Time and peak memory of summarize() on a masked float32 grid, compared to
+the float64 mask multiplication summarize() used to do.
+
+Each case runs in its own process so the peak resident set size (RSS) of
+one case does not hide the other.
+
+    python benchmarks/bench_float32.py [rows] [cols]
+"""
+
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from tablizer.tablizer import summarize
+
+methods = ['nanmean', 'nanstd', 'nanmin', 'nanmax', 'nanpercentile']
+repeat = 5
+
+
+def legacy_summarize(array, mask):
+    """Float mask multiplication and one numpy call per method."""
+
+    mask = mask.astype('float')
+    mask[mask < 1] = np.nan
+    array = array * mask
+
+    results = [getattr(np, m)(array) for m in methods[:-1]]
+    results.append(np.nanpercentile(array, [25, 75]))
+
+    return results
+
+
+def run(case, rows, cols):
+    """Run one case, returns (seconds per call, peak rss MB)."""
+
+    rng = np.random.RandomState(0)
+    array = rng.gamma(2.0, 3.0, size=(rows, cols)).astype(np.float32)
+    mask = np.zeros((rows, cols), dtype=bool)
+    mask[:, :int(cols * 0.8)] = True
+
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+
+    for i in range(repeat):
+        if case == 'legacy':
+            legacy_summarize(array, mask)
+        else:
+            summarize(array, '2019-01-01', methods, masks=[mask])
+
+    seconds = (time.perf_counter() - start) / repeat
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base
+
+    return seconds, peak / 1024.0
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1 and sys.argv[1] in ['legacy', 'float32']:
+        seconds, peak = run(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
+        print('{} {}'.format(seconds, peak))
+        sys.exit(0)
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    cols = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+
+    print('{} x {} float32 grid, {} calls'.format(rows, cols, repeat))
+
+    for case in ['legacy', 'float32']:
+        out = subprocess.check_output([sys.executable, __file__, case,
+                                       str(rows), str(cols)])
+        seconds, peak = [float(x) for x in out.split()]
+        print('{:>8}: {:8.3f} s/call, {:8.1f} MB extra peak RSS'.format(
+              case, seconds, peak))
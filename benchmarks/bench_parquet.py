@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Time to store a multi-year hourly run and to read back every record of the
+run, and one variable of it, from a sqlite database and a parquet database.
+Needs pyarrow.
+
+    python benchmarks/bench_parquet.py [years] [variables]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from tablizer.defaults import Units
+from tablizer.tablizer import store_many, get_existing_records
+
+functions = ['nanmean', 'nanmin', 'nanmax', 'nanstd', 'nanpercentile_25',
+             'nanpercentile_75']
+
+
+def results(years, variables):
+    """Hourly results of every variable, variable as an index level."""
+
+    rng = np.random.RandomState(0)
+    dates = pd.date_range('2016-10-01', periods=8760 * years, freq='H')
+    frames = []
+
+    for variable in sorted(Units.units)[:variables]:
+        df = pd.DataFrame(rng.normal(size=(len(dates), len(functions))),
+                          index=dates, columns=functions)
+        df['variable'] = variable
+        frames.append(df.set_index('variable', append=True))
+
+    return pd.concat(frames).rename_axis(['date_time', 'variable'])
+
+
+def timed(function):
+    """Run function, returns (result, seconds)."""
+
+    start = time.perf_counter()
+    result = function()
+
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    variables = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    values = results(years, variables)
+    variable = sorted(Units.units)[0]
+    tmp = tempfile.mkdtemp()
+
+    print('{} years, {} records'.format(years, values.size))
+
+    try:
+        for database, name in [('sqlite', 'results.db'),
+                               ('parquet', 'results')]:
+            location = os.path.join(tmp, name)
+
+            count, seconds = timed(lambda: store_many(
+                values, database, location, 'wy2017_2019', 1, basin_id=1))
+            print('{:>8} store: {:7.2f} s'.format(database, seconds))
+
+            df, seconds = timed(lambda: get_existing_records(
+                location, database, run_name='wy2017_2019'))
+            print('{:>8} read run: {:7.2f} s, {} records'.format(
+                  database, seconds, len(df)))
+
+            df, seconds = timed(lambda: get_existing_records(
+                location, database, run_name='wy2017_2019',
+                variable=variable, start_date='2018-10-01'))
+            print('{:>8} read variable and year: {:7.2f} s, {} records'.format(
+                  database, seconds, len(df)))
+
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Memory of the DataFrame returned by get_existing_records(), with object
+columns and with categorical=True and value_dtype='float32', for hourly
+results of a water year in a temporary sqlite database.
+
+Each case runs in its own process so the peak resident set size (RSS) of
+one case does not hide the other.
+
+    python benchmarks/bench_records_memory.py [hours] [variables]
+"""
+
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from tablizer.defaults import Units
+from tablizer.tablizer import store_many, get_existing_records
+
+functions = ['nanmean', 'nanmin', 'nanmax', 'nanstd', 'nanpercentile_25',
+             'nanpercentile_75']
+cases = {'object': {},
+         'categorical': {'categorical': True, 'value_dtype': 'float32'}}
+
+
+def make_database(path, hours, variables):
+    """Store hours x variables x functions records."""
+
+    rng = np.random.RandomState(0)
+    dates = pd.date_range('2018-10-01', periods=hours, freq='H')
+
+    for variable in sorted(Units.units)[:variables]:
+        values = pd.DataFrame(rng.normal(size=(hours, len(functions))),
+                              index=dates, columns=functions)
+        store_many(values, 'sqlite', path, 'wy2019_tuolumne', 1, variable, 1)
+
+
+def run(case, path):
+    """Read every record, returns (seconds, frame MB, peak rss MB)."""
+
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+
+    df = get_existing_records(path, 'sqlite', **cases[case])
+
+    seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base
+    size = df.memory_usage(deep=True).sum()
+
+    return seconds, size / 1e6, peak / 1024.0
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1 and sys.argv[1] in cases:
+        print('{} {} {}'.format(*run(sys.argv[1], sys.argv[2])))
+        sys.exit(0)
+
+    hours = int(sys.argv[1]) if len(sys.argv) > 1 else 8760
+    variables = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'records.db')
+
+    try:
+        make_database(path, hours, variables)
+        print('{} records'.format(hours * variables * len(functions)))
+
+        for case in cases:
+            out = subprocess.check_output([sys.executable, __file__, case,
+                                           path])
+            seconds, size, peak = [float(x) for x in out.split()]
+            print('{:>12}: {:7.2f} s, {:8.1f} MB DataFrame, {:8.1f} MB extra '
+                  'peak RSS'.format(case, seconds, size, peak))
+
+    finally:
+        shutil.rmtree(tmp)
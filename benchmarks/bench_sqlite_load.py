@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Rows per second stored into a sqlite database with one store() call per
+hourly result, with the sqlite default rollback journal and
+synchronous=FULL, with the WAL profile, and with the WAL profile inside
+bulk_load().
+
+    python benchmarks/bench_sqlite_load.py [hours] [variables]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from tablizer.defaults import Units
+from tablizer.tablizer import store, bulk_load
+from tablizer.tools import make_cnx_string, set_sqlite_profile, dispose
+
+functions = ['nanmean', 'nanmin', 'nanmax', 'nanstd', 'nanpercentile_25',
+             'nanpercentile_75']
+
+
+def load(path, hours, variables):
+    """Store one result row per hour and variable."""
+
+    rng = np.random.RandomState(0)
+    dates = pd.date_range('2018-10-01', periods=hours, freq='H')
+
+    for variable in sorted(Units.units)[:variables]:
+        for date in dates:
+            values = pd.DataFrame(rng.normal(size=(1, len(functions))),
+                                  index=[date], columns=functions)
+            store(values, variable, 'sqlite', path, 'wy2019', 1, 1,
+                  date.to_pydatetime())
+
+
+if __name__ == '__main__':
+
+    hours = int(sys.argv[1]) if len(sys.argv) > 1 else 720
+    variables = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    rows = hours * variables * len(functions)
+
+    tmp = tempfile.mkdtemp()
+
+    try:
+        print('{} store() calls, {} rows'.format(hours * variables, rows))
+
+        for case in ['rollback journal', 'wal', 'wal + bulk_load']:
+            path = os.path.join(tmp, case.replace(' ', '_') + '.db')
+            location = make_cnx_string(path, 'sqlite')
+
+            if case == 'rollback journal':
+                set_sqlite_profile(location, journal_mode='DELETE',
+                                   synchronous='FULL', cache_size=None,
+                                   temp_store=None)
+
+            start = time.perf_counter()
+
+            if case == 'wal + bulk_load':
+                with bulk_load(path, 'sqlite'):
+                    load(path, hours, variables)
+            else:
+                load(path, hours, variables)
+
+            seconds = time.perf_counter() - start
+            dispose(location)
+
+            print('{:>18}: {:8.2f} s, {:10.0f} rows/s'.format(
+                  case, seconds, rows / seconds))
+
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Time of a model loop that makes one hourly result per variable and stores
+it with store(), against queueing it on a StoreWriter, into a temporary
+sqlite database. compute_ms of work per result stands in for the model.
+
+    python benchmarks/bench_store_writer.py [hours] [variables] [compute_ms]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from tablizer.defaults import Units
+from tablizer.tablizer import store
+from tablizer.writer import StoreWriter
+
+functions = ['nanmean', 'nanmin', 'nanmax', 'nanstd', 'nanpercentile_25',
+             'nanpercentile_75']
+
+
+def results(hours, variables, compute_ms):
+    """Generator of (variable, date, values), after compute_ms each."""
+
+    rng = np.random.RandomState(0)
+    dates = pd.date_range('2018-10-01', periods=hours, freq='H')
+
+    for date in dates:
+        for variable in sorted(Units.units)[:variables]:
+            time.sleep(compute_ms / 1000.0)
+            values = pd.DataFrame(rng.normal(size=(1, len(functions))),
+                                  index=[date], columns=functions)
+
+            yield variable, date.to_pydatetime(), values
+
+
+if __name__ == '__main__':
+
+    hours = int(sys.argv[1]) if len(sys.argv) > 1 else 720
+    variables = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    compute_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+    rows = hours * variables * len(functions)
+
+    tmp = tempfile.mkdtemp()
+
+    try:
+        print('{} results, {} rows, {} ms compute each'.format(
+              hours * variables, rows, compute_ms))
+
+        path = os.path.join(tmp, 'store.db')
+        start = time.perf_counter()
+
+        for variable, date, values in results(hours, variables, compute_ms):
+            store(values, variable, 'sqlite', path, 'wy2019', 1, 1, date)
+
+        seconds = time.perf_counter() - start
+        print('{:>12}: {:8.2f} s, {:10.0f} rows/s'.format(
+              'store', seconds, rows / seconds))
+
+        path = os.path.join(tmp, 'writer.db')
+        start = time.perf_counter()
+
+        with StoreWriter(path, 'sqlite', 'wy2019', 1) as writer:
+            for variable, date, values in results(hours, variables,
+                                                  compute_ms):
+                writer.put(values, variable, 1, date)
+
+        seconds = time.perf_counter() - start
+        print('{:>12}: {:8.2f} s, {:10.0f} rows/s, {} transactions'.format(
+              'StoreWriter', seconds, rows / seconds, writer.batches))
+
+    finally:
+        shutil.rmtree(tmp)
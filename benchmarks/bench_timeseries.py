@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Time to get a wide date_time x function frame of one variable and basin,
+by reading every record and pivoting in pandas, by reading filtered records
+and pivoting, and with get_timeseries(), from a temporary sqlite database.
+
+    python benchmarks/bench_timeseries.py [hours] [variables] [basins]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from tablizer.defaults import Units
+from tablizer.tablizer import store_many, get_existing_records, \
+    get_timeseries
+
+functions = ['nanmean', 'nanmin', 'nanmax', 'nanstd', 'nanpercentile_25',
+             'nanpercentile_75']
+repeat = 3
+
+
+def make_database(path, hours, variables, basins):
+    """Store hours x variables x basins x functions records."""
+
+    rng = np.random.RandomState(0)
+    dates = pd.date_range('2018-10-01', periods=hours, freq='H')
+
+    for variable in sorted(Units.units)[:variables]:
+        for basin_id in range(1, basins + 1):
+            values = pd.DataFrame(rng.normal(size=(hours, len(functions))),
+                                  index=dates, columns=functions)
+            store_many(values, 'sqlite', path, 'wy2019', 1, variable,
+                       basin_id)
+
+
+def read_all_pivot(path, variable):
+    """Read every record, then filter and pivot in pandas."""
+
+    df = get_existing_records(path, 'sqlite')
+    df = df[(df['run_name'] == 'wy2019') & (df['basin_id'] == 1) &
+            (df['variable'] == variable)]
+
+    return df.pivot('date_time', 'function', 'value')
+
+
+def read_filtered_pivot(path, variable):
+    """Read filtered records, then pivot in pandas."""
+
+    df = get_existing_records(path, 'sqlite', run_name='wy2019', basin_id=1,
+                              variable=variable)
+
+    return df.pivot('date_time', 'function', 'value')
+
+
+def timeseries(path, variable):
+    """Wide frame straight from the query rows."""
+
+    return get_timeseries(path, 'sqlite', 'wy2019', 1, variable)
+
+
+if __name__ == '__main__':
+
+    hours = int(sys.argv[1]) if len(sys.argv) > 1 else 8760
+    variables = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    basins = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'records.db')
+
+    try:
+        make_database(path, hours, variables, basins)
+        variable = sorted(Units.units)[0]
+        print('{} records, {} rows per time series'.format(
+              hours * variables * basins * len(functions),
+              hours * len(functions)))
+
+        expected = None
+
+        for function in [read_all_pivot, read_filtered_pivot, timeseries]:
+            start = time.perf_counter()
+
+            for i in range(repeat):
+                result = function(path, variable)
+
+            seconds = (time.perf_counter() - start) / repeat
+
+            if expected is None:
+                expected = result
+
+            np.testing.assert_allclose(result.values, expected.values)
+            print('{:>20}: {:7.3f} s'.format(function.__name__, seconds))
+
+    finally:
+        shutil.rmtree(tmp)
@@ -34,7 +34,14 @@ setup(
         'Programming Language :: Python :: 3.7',
     ],
     description="Summarizes DataFrames and 2D arrays to database or csv.",
+    entry_points={
+        'console_scripts': [
+            'tablizer=tablizer.batch:main',
+        ],
+    },
     install_requires=required,
+    extras_require={'parquet': ['pyarrow'],
+                    'async': ['SQLAlchemy>=1.4,<2.0', 'aiosqlite']},
     # long_description=readme + '\n\n' + history,
     include_package_data=True,
     keywords='tablizer',
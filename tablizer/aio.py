@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import concurrent.futures
+import functools
+import threading
+import weakref
+
+import pandas as pd
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool
+
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+except ImportError:
+    create_async_engine = None
+
+try:
+    import aiosqlite
+
+except ImportError:
+    aiosqlite = None
+
+try:
+    import aiomysql
+
+except ImportError:
+    aiomysql = None
+
+from tablizer.tablizer import DATABASES, FILE_DATABASES, store, store_many, \
+    store_statements, store_many_statements, get_existing_records, \
+    query_columns
+from tablizer.tools import make_cnx_string, inputs_select, shape_records, \
+    write_statements, is_bulk_loading, sqlite_profile, sqlite_pragmas
+
+# threads running the database calls of every event loop, at most
+MAX_WORKERS = 8
+
+# sqlalchemy drivers of the async engines, by dialect
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'mysql': 'mysql+aiomysql'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# one writer at a time for each sqlite database, by location
+_write_locks = {}
+
+# async engines by location and sqlite profile, and the locks of their
+# sqlite writers by event loop
+_async_engines = {}
+_async_write_locks = weakref.WeakKeyDictionary()
+
+
+def executor():
+    '''Thread pool of the database calls, made on first use.'''
+
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=MAX_WORKERS, thread_name_prefix='tablizer')
+
+        return _executor
+
+
+def shutdown():
+    '''Wait for the running database calls and stop the thread pool.'''
+
+    global _executor
+
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def async_url(location):
+    '''
+    Connection string of the async driver of a database, None without
+    sqlalchemy>=1.4 and the driver, or for in memory sqlite databases.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+
+    Returns
+    ------
+    url : str or None
+
+    '''
+
+    if create_async_engine is None:
+        return None
+
+    if ':memory:' in location or location == 'sqlite://':
+        return None
+
+    dialect = location.split(':', 1)[0].split('+', 1)[0]
+    drivers = {'sqlite': aiosqlite, 'mysql': aiomysql}
+
+    if drivers.get(dialect) is None:
+        return None
+
+    return ASYNC_DRIVERS[dialect] + location[location.index('://'):]
+
+
+def async_engine(location):
+    '''
+    Async engine of a sql or sqlite database, made on first use, None when
+    there is no async driver, see async_url().
+
+    Connections are not pooled, since a pooled connection belongs to the
+    event loop that made it. sqlite connections get the pragmas of
+    set_sqlite_profile().
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+
+    Returns
+    ------
+    engine : sqlalchemy AsyncEngine or None
+
+    '''
+
+    url = async_url(location)
+
+    if url is None:
+        return None
+
+    profile = None
+
+    if location.startswith('sqlite'):
+        profile = tuple(sorted(sqlite_profile(location).items()))
+
+    with _executor_lock:
+        engine = _async_engines.get((location, profile))
+
+        if engine is None:
+            engine = create_async_engine(url, poolclass=NullPool)
+
+            if profile is not None:
+                event.listen(engine.sync_engine, 'connect',
+                             sqlite_pragmas(dict(profile)))
+
+            _async_engines[(location, profile)] = engine
+
+    return engine
+
+
+def write_lock(location, database):
+    '''
+    Lock of the writers of a sqlite database, which take turns instead of
+    waiting on the database lock, None for the other databases.
+
+    Args
+    ------
+    location : str
+    database : str
+
+    Returns
+    ------
+    lock : threading.Lock or None
+
+    '''
+
+    if database != 'sqlite':
+        return None
+
+    location = make_cnx_string(location, database)
+
+    with _executor_lock:
+        return _write_locks.setdefault(location, threading.Lock())
+
+
+def async_write_lock(location, database):
+    '''
+    Lock of the async writers of a sqlite database in the running event
+    loop, see write_lock().
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+    database : str
+
+    Returns
+    ------
+    lock : asyncio.Lock or None
+
+    '''
+
+    if database != 'sqlite':
+        return None
+
+    loop = asyncio.get_running_loop()
+
+    with _executor_lock:
+        locks = _async_write_locks.setdefault(loop, {})
+
+        return locks.setdefault(location, asyncio.Lock())
+
+
+def run_write(lock, call, *args, **kwargs):
+    '''Run a write in a worker thread, holding lock when there is one.'''
+
+    if lock is None:
+        return call(*args, **kwargs)
+
+    with lock:
+        return call(*args, **kwargs)
+
+
+async def run(call, *args, **kwargs):
+    '''Await call(*args, **kwargs) running in the thread pool.'''
+
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(
+        executor(), functools.partial(call, *args, **kwargs))
+
+
+async def execute(location, database, statements, rows=0):
+    '''
+    Execute statements from record_statements() in one transaction on the
+    async engine of a database.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+    database : str
+    statements : list, (statement, parameters)
+    rows : int, rows written
+
+    '''
+
+    if not statements:
+        return
+
+    # writes of another thread raise while a BulkLoad is open
+    if is_bulk_loading(location):
+        await run(write_statements, location, statements, rows)
+        return
+
+    lock = async_write_lock(location, database)
+
+    if lock is None:
+        await transaction(location, statements)
+        return
+
+    async with lock:
+        await transaction(location, statements)
+
+
+async def transaction(location, statements):
+    '''Execute statements in one transaction of the async engine.'''
+
+    async with async_engine(location).begin() as connection:
+        for statement, parameters in statements:
+            if parameters is None:
+                await connection.execute(statement)
+            else:
+                await connection.execute(statement, parameters)
+
+
+async def astore(values, variable, database, location, run_name, basin_id,
+                 run_id, date_time, overwrite=True, units=None,
+                 compact=False):
+    '''
+    store() for asyncio. With sqlalchemy>=1.4 and an async driver
+    (pip install tablizer[async]) the records are written by the async
+    engine of the database, the tables, records and statements are made on
+    the thread pool. Otherwise, and for parquet and csv databases, store()
+    runs on the thread pool. Either way the event loop is not blocked, and
+    many basins can be stored concurrently.
+
+        await asyncio.gather(*[
+            astore(results[bid], value, 'sqlite', location, run_name, bid,
+                   rid, date) for bid in results])
+
+    Args
+    ------
+    see store()
+
+    '''
+
+    if database not in DATABASES:
+        raise Exception('database must be "sql", "sqlite", "parquet" or '
+                        '"csv"')
+
+    if (database in FILE_DATABASES or
+            async_engine(make_cnx_string(location, database)) is None):
+        await run(run_write, write_lock(location, database), store, values,
+                  variable, database, location, run_name, basin_id, run_id,
+                  date_time, overwrite, units, compact)
+        return
+
+    location, statements, count = await run(
+        store_statements, values, variable, database, location, run_name,
+        basin_id, run_id, date_time, overwrite, units, compact)
+
+    await execute(location, database, statements, count)
+
+
+async def astore_many(values, database, location, run_name, run_id,
+                      variable=None, basin_id=None, overwrite=True,
+                      units=None, compact=False):
+    '''
+    store_many() for asyncio, written by the async engine of the database
+    when there is one, see astore().
+
+    Args
+    ------
+    see store_many()
+
+    Returns
+    ------
+    count : int, rows inserted
+
+    '''
+
+    if database not in DATABASES:
+        raise Exception('database must be "sql", "sqlite", "parquet" or '
+                        '"csv"')
+
+    if (database in FILE_DATABASES or
+            async_engine(make_cnx_string(location, database)) is None):
+        return await run(run_write, write_lock(location, database),
+                         store_many, values, database, location, run_name,
+                         run_id, variable, basin_id, overwrite, units,
+                         compact)
+
+    location, statements, count = await run(
+        store_many_statements, values, database, location, run_name, run_id,
+        variable, basin_id, overwrite, units, compact)
+
+    await execute(location, database, statements, count)
+
+    return count
+
+
+async def aget_existing_records(location, database, query_dict=None,
+                                run_name=None, basin_id=None, variable=None,
+                                function=None, start_date=None,
+                                end_date=None, categorical=False,
+                                value_dtype=None):
+    '''
+    get_existing_records() for asyncio. The select is made on the thread
+    pool and read by the async engine of the database when there is one,
+    see astore(), otherwise get_existing_records() runs on the thread pool.
+    Reads run concurrently with each other and with writes.
+
+    Args
+    ------
+    see get_existing_records(), records are read into one DataFrame
+
+    Returns
+    ------
+    results : pd.DataFrame
+
+    '''
+
+    if database not in DATABASES:
+        raise Exception('database must be "sql", "sqlite", "parquet" or '
+                        '"csv"')
+
+    location = make_cnx_string(location, database)
+    engine = None
+
+    if database not in FILE_DATABASES:
+        engine = async_engine(location)
+
+    if engine is None:
+        return await run(get_existing_records, location, database,
+                         query_dict=query_dict, run_name=run_name,
+                         basin_id=basin_id, variable=variable,
+                         function=function, start_date=start_date,
+                         end_date=end_date, categorical=categorical,
+                         value_dtype=value_dtype)
+
+    statement = await run(inputs_select, location, query_columns(query_dict),
+                          run_name, basin_id, variable, function, start_date,
+                          end_date)
+
+    async with engine.connect() as connection:
+        result = await connection.execute(statement)
+        frame = pd.DataFrame.from_records(result.fetchall(),
+                                          columns=list(result.keys()),
+                                          coerce_float=True)
+
+    return shape_records(frame, categorical, value_dtype)
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+import argparse
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from tablizer.summarizer import Summarizer
+
+# Summarizer of each worker process, made once by _init_worker
+_summarizer = None
+_key = None
+
+
+def load_grid(path, key=None):
+    '''
+    Load a 2D grid from a .npy or .npz file, .npy files are memory mapped.
+
+    Args
+    ------
+    path : str, .npy or .npz file
+    key : str, array name in .npz files, default is the first array
+
+    Returns
+    ------
+    array : 2D array
+
+    '''
+
+    if path.endswith('.npz'):
+        with np.load(path) as npz:
+            return npz[key if key is not None else npz.files[0]]
+
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+
+    raise Exception('file {} must be .npy or .npz'.format(path))
+
+
+def file_dates(files, date_format=None):
+    '''
+    Dates of files from their names, for example 2019-01-01T23.npy or
+    air_temp_20190101_2300.npy with date_format='air_temp_%Y%m%d_%H%M'.
+
+    Args
+    ------
+    files : list, file paths
+    date_format : str, strftime format of the file name without extension
+
+    Returns
+    ------
+    dates : DatetimeIndex
+
+    '''
+
+    stems = [os.path.splitext(os.path.basename(f))[0] for f in files]
+
+    return pd.to_datetime(stems, format=date_format)
+
+
+def _init_worker(methods, percentiles, decimals, masks, mask_zero_values,
+                 key):
+    '''Make the Summarizer of a worker process once.'''
+
+    global _summarizer, _key
+
+    _summarizer = Summarizer(methods, percentiles, decimals, masks,
+                             mask_zero_values, capacity=1)
+    _key = key
+
+
+def _summarize_file(task):
+    '''Summarize one file in a worker, returns the result row.'''
+
+    i, path, date = task
+
+    start = time.perf_counter()
+    array = load_grid(path, _key)
+    loaded = time.perf_counter()
+
+    row = _summarizer(array, date)
+    _summarizer.reset()
+
+    return i, row, loaded - start, time.perf_counter() - loaded
+
+
+def summarize_files(files, methods, percentiles=[25, 75], decimals=3,
+                    masks=None, mask_zero_values=False, dates=None,
+                    date_format=None, key=None, processes=None):
+    '''
+    Summarize many grid files on a process pool.
+
+    Each worker makes one Summarizer with the masks, and sends back only
+    the row of results for each file, instead of a pickled DataFrame. Rows
+    are put together in one DataFrame by the calling process, so only that
+    process needs to connect to a database to store them.
+
+    Args
+    ------
+    files : list, .npy or .npz grid files
+    methods : list, (['mean','std']), see summarize()
+    percentiles : list, ([low, high])
+    decimals : int, rounding
+    masks : list, 2D mask arrays
+    mask_zero_values : bool, mask zero values in array
+    dates : list, date of each file, default is file_dates(files,
+        date_format)
+    date_format : str, strftime format of the file names
+    key : str, array name in .npz files
+    processes : int, worker processes, default is the number of cpus
+
+    Returns
+    ------
+    result : DataFrame, index = dates, columns = methods
+    report : dict, {'grids', 'seconds', 'load_seconds', 'summarize_seconds',
+        'grids_per_second'}, load and summarize seconds are summed over
+        the workers
+
+    '''
+
+    if dates is None:
+        dates = file_dates(files, date_format)
+
+    dates = pd.to_datetime(list(dates))
+
+    if len(dates) != len(files):
+        raise Exception('{} dates supplied for {} files'.format(len(dates),
+                                                                len(files)))
+
+    summarizer = Summarizer(methods, percentiles, decimals, capacity=1)
+    rows = np.full((len(files), len(summarizer.columns)), np.nan)
+    tasks = [(i, f, d) for i, (f, d) in enumerate(zip(files, dates))]
+    initargs = (methods, percentiles, decimals, masks, mask_zero_values, key)
+    load_seconds = 0.0
+    summarize_seconds = 0.0
+
+    start = time.perf_counter()
+
+    if processes == 1:
+        _init_worker(*initargs)
+        results = map(_summarize_file, tasks)
+        pool = None
+
+    else:
+        pool = multiprocessing.Pool(processes, _init_worker, initargs)
+        chunksize = max(1, len(tasks) // (4 * (processes or os.cpu_count())))
+        results = pool.imap_unordered(_summarize_file, tasks, chunksize)
+
+    try:
+        for i, row, loaded, summarized in results:
+            rows[i] = row
+            load_seconds += loaded
+            summarize_seconds += summarized
+
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    seconds = time.perf_counter() - start
+
+    result = pd.DataFrame(rows, index=dates, columns=summarizer.columns)
+    report = {'grids': len(files), 'seconds': seconds,
+              'load_seconds': load_seconds,
+              'summarize_seconds': summarize_seconds,
+              'grids_per_second': len(files) / seconds if seconds else np.nan}
+
+    return result, report
+
+
+def main(args=None):
+    '''Console script, run tablizer --help for the arguments.'''
+
+    from tablizer.tablizer import store_many, DATABASES
+
+    parser = argparse.ArgumentParser(
+        prog='tablizer',
+        description='Summarize .npy/.npz grid files on a process pool.')
+    parser.add_argument('files', nargs='+', help='.npy or .npz grid files')
+    parser.add_argument('-m', '--methods', nargs='+', required=True,
+                        help='methods, for example nanmean nanpercentile')
+    parser.add_argument('-p', '--percentiles', nargs=2, type=int,
+                        default=[25, 75], help='low and high percentiles')
+    parser.add_argument('-d', '--decimals', type=int, default=3)
+    parser.add_argument('--mask', action='append', default=None,
+                        help='.npy or .npz mask file, may be repeated')
+    parser.add_argument('--mask-zero-values', action='store_true')
+    parser.add_argument('--date-format', default=None,
+                        help='strftime format of the file names')
+    parser.add_argument('--key', default=None, help='array name in .npz')
+    parser.add_argument('-n', '--processes', type=int, default=None)
+    parser.add_argument('-o', '--output', default=None,
+                        help='write results to this csv file')
+    parser.add_argument('--database', choices=DATABASES,
+                        default=None, help='store results in a database')
+    parser.add_argument('--location', default=None)
+    parser.add_argument('--variable', default=None)
+    parser.add_argument('--run-name', default=None)
+    parser.add_argument('--run-id', type=int, default=None)
+    parser.add_argument('--basin-id', type=int, default=None)
+    parser.add_argument('--compact', action='store_true',
+                        help='make new databases with the compact schema')
+
+    args = parser.parse_args(args)
+
+    if args.database is not None:
+        for name in ['location', 'run_name', 'run_id', 'variable',
+                     'basin_id']:
+            if getattr(args, name) is None:
+                parser.error('--database needs --{}'.format(
+                    name.replace('_', '-')))
+
+    masks = None
+
+    if args.mask is not None:
+        masks = [np.asarray(load_grid(f, args.key)) for f in args.mask]
+
+    result, report = summarize_files(
+        args.files, args.methods, list(args.percentiles), args.decimals,
+        masks, args.mask_zero_values, date_format=args.date_format,
+        key=args.key, processes=args.processes)
+
+    print('summarized {grids} grids in {seconds:.2f} s, {grids_per_second:.1f}'
+          ' grids/s (load {load_seconds:.2f} s, summarize '
+          '{summarize_seconds:.2f} s)'.format(**report))
+
+    if args.output is not None:
+        result.to_csv(args.output, index_label='date_time')
+
+    if args.database is not None:
+        start = time.perf_counter()
+
+        store_many(result, args.database, args.location, args.run_name,
+                   args.run_id, args.variable, args.basin_id,
+                   compact=args.compact)
+
+        seconds = time.perf_counter() - start
+        print('stored {} rows in {:.2f} s, {:.1f} grids/s'.format(
+              len(result), seconds, len(result) / seconds))
+
+
+if __name__ == '__main__':
+    main()
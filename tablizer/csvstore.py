@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+import csv
+import os
+import threading
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+# Inputs fields, in the order of the Inputs table
+FIELDS = ['id', 'run_id', 'run_name', 'basin_id', 'date_time', 'variable',
+          'function', 'value', 'unit']
+
+# columns of the files, run_name and variable are in the file path
+COLUMNS = ['run_id', 'basin_id', 'date_time', 'function', 'value', 'unit']
+
+# write buffer of each open file
+BUFFER_SIZE = 2 ** 20
+
+# rows parsed at a time when reading
+READ_CHUNK_SIZE = 100000
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# open files of the process, by path, a csv database has one writer process
+_files = {}
+_files_lock = threading.Lock()
+
+
+class CsvFile():
+    '''
+    Results of one run and variable, appended to a csv file through a
+    buffered writer.
+
+    Records are never rewritten. When a key is stored again the new record
+    is appended, and the line of the old one is added to a small
+    <file>.deleted index, which reads skip. The line of every key is found
+    by reading the key columns of the file once, when it is opened.
+
+    One process writes to a csv database at a time. The file is opened
+    again and its keys read again when it was removed, replaced or appended
+    to by another process since the last append, but appends of two
+    processes at the same time can interleave and are not supported.
+
+    Args
+    ------
+    path : str, csv file
+
+    '''
+
+    def __init__(self, path):
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.open()
+
+    def open(self):
+        '''Read the line of every key and open the writer.'''
+
+        path = self.path
+        self.keys = {}
+        self.lines = 0
+
+        if os.path.isfile(path):
+            keys = pd.read_csv(path, usecols=['basin_id', 'date_time',
+                                              'function'])
+            dates = pd.to_datetime(keys['date_time']).values.astype(np.int64)
+
+            for line, key in enumerate(zip(keys['basin_id'].values, dates,
+                                           keys['function'].values)):
+                self.keys[key] = line
+
+            self.lines = len(keys)
+
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            # lines of a removed file
+            if os.path.isfile(path + '.deleted'):
+                os.remove(path + '.deleted')
+
+            with open(path, 'w', newline='') as f:
+                csv.writer(f, lineterminator='\n').writerow(COLUMNS)
+
+        self.handle = open(path, 'a', buffering=BUFFER_SIZE, newline='')
+        self.writer = csv.writer(self.handle, lineterminator='\n')
+        self.size = os.fstat(self.handle.fileno()).st_size
+
+    def stale(self):
+        '''
+        Check if the file was removed, replaced or appended to since the
+        last append.
+
+        Returns
+        ------
+        bool
+
+        '''
+
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+
+        opened = os.fstat(self.handle.fileno())
+
+        return (stat.st_ino != opened.st_ino or
+                stat.st_dev != opened.st_dev or stat.st_size != self.size)
+
+    def append(self, records, overwrite=True):
+        '''
+        Append records, flushing the buffer once at the end.
+
+        Args
+        ------
+        records : dict, 1D arrays of COLUMNS, date_time as datetime64[ns]
+        overwrite : bool, overwrite records of keys that are stored
+
+        Returns
+        ------
+        count : int, records written
+
+        '''
+
+        with self.lock:
+            if self.stale():
+                self.handle.close()
+                self.open()
+
+            keys = list(zip(records['basin_id'].tolist(),
+                            records['date_time'].astype(np.int64).tolist(),
+                            records['function'].tolist()))
+            write = []
+            deleted = []
+
+            for i, key in enumerate(keys):
+                line = self.keys.get(key)
+
+                if line is not None:
+                    if not overwrite:
+                        continue
+
+                    deleted.append(line)
+
+                write.append(i)
+
+            if not write:
+                return 0
+
+            if len(write) < len(keys):
+                records = {k: v[write] for k, v in records.items()}
+                keys = [keys[i] for i in write]
+
+            dates = np.char.replace(np.datetime_as_string(
+                records['date_time'], unit='s'), 'T', ' ')
+            values = [None if np.isnan(v) else v
+                      for v in records['value'].tolist()]
+
+            self.writer.writerows(zip(records['run_id'].tolist(),
+                                      records['basin_id'].tolist(),
+                                      dates.tolist(),
+                                      records['function'].tolist(), values,
+                                      records['unit'].tolist()))
+            self.handle.flush()
+            self.size = os.fstat(self.handle.fileno()).st_size
+
+            for i, key in enumerate(keys):
+                self.keys[key] = self.lines + i
+
+            self.lines += len(keys)
+
+            if deleted:
+                with open(self.path + '.deleted', 'a') as f:
+                    f.write(''.join('{}\n'.format(d) for d in deleted))
+
+            return len(keys)
+
+    def close(self):
+        '''Flush and close the writer.'''
+
+        with self.lock:
+            self.handle.close()
+
+
+def file_path(location, run_name, variable):
+    '''Csv file of a run and variable, names are percent encoded.'''
+
+    return os.path.join(location, quote(run_name, safe=''),
+                        quote(variable, safe='') + '.csv')
+
+
+def open_file(path):
+    '''Open csv file of the process, opening it on first use.'''
+
+    with _files_lock:
+        f = _files.get(path)
+
+        if f is None:
+            f = CsvFile(path)
+            _files[path] = f
+
+    return f
+
+
+def close(location=None):
+    '''
+    Flush and close the open files of a csv database.
+
+    Args
+    ------
+    location : str, csv database directory, default is every database
+
+    '''
+
+    with _files_lock:
+        for path in list(_files.keys()):
+            if location is None or path.startswith(
+                    os.path.join(location, '')):
+                _files.pop(path).close()
+
+
+def store_frame(location, frame, run_id, run_name, units, overwrite=True):
+    '''
+    Append records to the csv files of a database, one file per variable.
+
+    Args
+    ------
+    location : str, csv database directory
+    frame : pd.DataFrame or dict of 1D arrays, columns = ['date_time',
+        'variable', 'basin_id', 'function', 'value']
+    run_id : int
+    run_name : str
+    units : dict, {variable: unit}
+    overwrite : bool, overwrite existing records if they exist
+
+    Returns
+    ------
+    count : int, records written
+
+    '''
+
+    variables = np.asarray(frame['variable']).astype(str)
+    records = {'basin_id': np.asarray(frame['basin_id']).astype(np.int64),
+               'date_time': np.asarray(frame['date_time'],
+                                       dtype='datetime64[ns]'),
+               'function': np.asarray(frame['function']).astype(str),
+               'value': np.asarray(frame['value'], dtype=float)}
+    names = pd.unique(variables)
+    count = 0
+
+    for variable in names:
+        group = records
+
+        if len(names) > 1:
+            group = {k: v[variables == variable] for k, v in records.items()}
+
+        # records of a key in one write are stored in turn, the last one
+        # wins, or the first one without overwrite
+        keys = zip(group['basin_id'].tolist(),
+                   group['date_time'].astype(np.int64).tolist(),
+                   group['function'].tolist())
+        lines = {}
+
+        for i, key in enumerate(keys):
+            if overwrite or key not in lines:
+                lines[key] = i
+
+        if len(lines) < len(group['value']):
+            keep = np.sort(list(lines.values()))
+            group = {k: v[keep] for k, v in group.items()}
+
+        group['run_id'] = np.full(len(group['value']), int(run_id))
+        group['unit'] = np.full(len(group['value']), units[variable],
+                                dtype=object)
+
+        f = open_file(file_path(location, run_name, variable))
+        count += f.append(group, overwrite)
+
+    return count
+
+
+def deleted_lines(path):
+    '''Lines of a csv file that were overwritten.'''
+
+    if not os.path.isfile(path + '.deleted'):
+        return np.array([], dtype=np.int64)
+
+    return np.loadtxt(path + '.deleted', dtype=np.int64, ndmin=1)
+
+
+def files(location, run_name=None, variable=None):
+    '''(path, run_name, variable) of the files of a csv database.'''
+
+    if not os.path.isdir(location):
+        return []
+
+    run_names = run_name
+    variables = variable
+
+    if run_names is not None and type(run_names) not in [list, tuple, set]:
+        run_names = [run_names]
+
+    if variables is not None and type(variables) not in [list, tuple, set]:
+        variables = [variables]
+
+    results = []
+
+    for run in sorted(os.listdir(location)):
+        directory = os.path.join(location, run)
+
+        if not os.path.isdir(directory):
+            continue
+
+        if run_names is not None and unquote(run) not in run_names:
+            continue
+
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.csv'):
+                continue
+
+            var = unquote(name[:-4])
+
+            if variables is None or var in variables:
+                results.append((os.path.join(directory, name), unquote(run),
+                                var))
+
+    return results
+
+
+def check_columns(columns):
+    '''Inputs fields to read, default is every field.'''
+
+    if columns is None:
+        return list(FIELDS)
+
+    for c in columns:
+        if c not in FIELDS:
+            raise Exception('column "{}" must be one of {}'.format(c, FIELDS))
+
+    return list(columns)
+
+
+def read_chunks(location, chunksize, columns=None, run_name=None,
+                basin_id=None, variable=None, function=None, start_date=None,
+                end_date=None):
+    '''
+    Generator of DataFrames of the records of a csv database, read in
+    chunks of chunksize lines. Files are picked by run_name and variable,
+    the other filters are applied to each chunk.
+
+    Args
+    ------
+    location : str, csv database directory
+    chunksize : int, lines per DataFrame, at most
+    columns : list, Inputs fields, default is every field, id is the line
+        of the record in its file, from 1
+    run_name : str or list
+    basin_id : int or list
+    variable : str or list
+    function : str or list
+    start_date : datetime, first date_time, inclusive
+    end_date : datetime, last date_time, inclusive
+
+    '''
+
+    columns = check_columns(columns)
+
+    # basin_id is always read, so lines are counted when only id,
+    # run_name or variable are asked for
+    usecols = [c for c in COLUMNS if c in columns or c == 'basin_id' or
+               (c == 'function' and function is not None) or
+               (c == 'date_time' and (start_date is not None or
+                                      end_date is not None))]
+
+    filters = {'basin_id': basin_id, 'function': function}
+    filters = {k: (list(v) if type(v) in [list, tuple, set] else [v])
+               for k, v in filters.items() if v is not None}
+
+    if start_date is not None:
+        start_date = pd.Timestamp(start_date)
+
+    if end_date is not None:
+        end_date = pd.Timestamp(end_date)
+
+    for path, run, var in files(location, run_name, variable):
+        deleted = deleted_lines(path)
+        first = 0
+
+        reader = pd.read_csv(path, usecols=usecols, chunksize=chunksize,
+                             parse_dates=['date_time'] if 'date_time' in
+                             usecols else False,
+                             dtype={'function': object, 'unit': object})
+
+        for chunk in reader:
+            lines = np.arange(first, first + len(chunk))
+            first += len(chunk)
+
+            keep = ~np.isin(lines, deleted)
+
+            for field, values in filters.items():
+                keep &= chunk[field].isin(values).values
+
+            if start_date is not None:
+                keep &= (chunk['date_time'] >= start_date).values
+
+            if end_date is not None:
+                keep &= (chunk['date_time'] <= end_date).values
+
+            chunk = chunk[keep]
+
+            if len(chunk) == 0:
+                continue
+
+            chunk = chunk.assign(id=lines[keep] + 1, run_name=run,
+                                 variable=var)
+
+            yield chunk[columns].reset_index(drop=True)
+
+
+def read_frame(location, columns=None, run_name=None, basin_id=None,
+               variable=None, function=None, start_date=None,
+               end_date=None):
+    '''
+    Read the records of a csv database into one DataFrame.
+
+    Args
+    ------
+    see read_chunks()
+
+    Returns
+    ------
+    results : pd.DataFrame
+
+    '''
+
+    columns = check_columns(columns)
+    frames = list(read_chunks(location, READ_CHUNK_SIZE, columns, run_name,
+                              basin_id, variable, function, start_date,
+                              end_date))
+
+    if not frames:
+        return pd.DataFrame({c: [] for c in columns})
+
+    return pd.concat(frames, ignore_index=True)
@@ -13,7 +13,8 @@ class Units():
 
 class Methods():
     options = ['nanmean','nanmin','nanmax','nanstd','nanpercentile', 'nanstd',
-               'mean','min','max','std','percentile', 'median', 'nanmedian']
+               'mean','min','max','std','percentile', 'median', 'nanmedian',
+               'approx_percentile']
 
 class Fields():
     fields = {'run_id': '',
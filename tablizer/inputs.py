@@ -1,5 +1,6 @@
 
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import Column, ForeignKey, Integer, String, Index, \
+    SmallInteger
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy import schema, types
@@ -7,8 +8,16 @@ from sqlalchemy.orm import backref
 
 Base = declarative_base()
 
+# natural key of Inputs records, one value per function
+KEY_FIELDS = ['run_name', 'basin_id', 'date_time', 'variable', 'function']
+
+# lookups by run, variable and date range, with or without a basin
+LOOKUP_FIELDS = ['run_name', 'variable', 'date_time', 'basin_id']
+
 class Inputs(Base):
     __tablename__ = 'Inputs'
+    __table_args__ = (Index('uq_inputs_key', *KEY_FIELDS, unique=True),
+                      Index('ix_inputs_lookup', *LOOKUP_FIELDS))
 
     id = Column(Integer, primary_key=True)
     run_id = Column(Integer, nullable=False)
@@ -19,3 +28,59 @@ class Inputs(Base):
     function = Column(String(250), nullable=False)
     value = Column(types.Float(), nullable=True)
     unit = Column(String(250), nullable=True)
+
+# compact schema, names are stored once in dimension tables
+CompactBase = declarative_base()
+
+# sqlite only generates ids for INTEGER PRIMARY KEY columns
+SmallId = SmallInteger().with_variant(Integer(), 'sqlite')
+
+class RunNames(CompactBase):
+    __tablename__ = 'RunNames'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(250), nullable=False, unique=True)
+
+class VariableNames(CompactBase):
+    __tablename__ = 'VariableNames'
+
+    id = Column(SmallId, primary_key=True)
+    name = Column(String(250), nullable=False, unique=True)
+
+class FunctionNames(CompactBase):
+    __tablename__ = 'FunctionNames'
+
+    id = Column(SmallId, primary_key=True)
+    name = Column(String(250), nullable=False, unique=True)
+
+class UnitNames(CompactBase):
+    __tablename__ = 'UnitNames'
+
+    id = Column(SmallId, primary_key=True)
+    name = Column(String(250), nullable=False, unique=True)
+
+class CompactInputs(CompactBase):
+    __tablename__ = 'CompactInputs'
+    __table_args__ = (Index('uq_compact_inputs_key', 'run_name_id', 'basin_id',
+                            'date_time', 'variable_id', 'function_id',
+                            unique=True),
+                      Index('ix_compact_inputs_lookup', 'run_name_id',
+                            'variable_id', 'date_time', 'basin_id'))
+
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, nullable=False)
+    run_name_id = Column(Integer, ForeignKey('RunNames.id'), nullable=False)
+    basin_id = Column(Integer, nullable=False)
+    date_time = Column(types.DateTime(), nullable=False)
+    variable_id = Column(SmallInteger, ForeignKey('VariableNames.id'),
+                         nullable=False)
+    function_id = Column(SmallInteger, ForeignKey('FunctionNames.id'),
+                         nullable=False)
+    value = Column(types.Float(), nullable=True)
+    unit_id = Column(SmallInteger, ForeignKey('UnitNames.id'), nullable=True)
+
+# Inputs field of each compact dimension table, stored as <field>_id
+DIMENSIONS = {'run_name': RunNames,
+              'variable': VariableNames,
+              'function': FunctionNames,
+              'unit': UnitNames}
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# number of compiled masks kept by the cache
+MASK_CACHE_SIZE = 32
+
+
+class CompiledMask():
+    '''
+    Flat indices of the cells selected by a list of masks.
+
+    A cell is selected when every mask is >= 1 there, the same cells that
+    are not nan after multiplying the masks into an array in summarize().
+
+    Args
+    ------
+    masks : list, 2D arrays or DataFrames of the same shape
+
+    '''
+
+    def __init__(self, masks):
+
+        selected = None
+
+        for mask in masks:
+            mask = np.asarray(mask)
+
+            if selected is not None and mask.shape != selected.shape:
+                raise Exception('mask dimensions {} must match mask '
+                                'dimensions '
+                                '{}'.format(mask.shape, selected.shape))
+
+            with np.errstate(invalid='ignore'):
+                keep = mask >= 1
+
+            selected = keep if selected is None else selected & keep
+
+        self.shape = selected.shape
+        self.count = int(np.count_nonzero(selected))
+        self.complete = self.count == selected.size
+
+        dtype = np.int32 if selected.size < 2 ** 31 else np.int64
+        self.index = np.flatnonzero(selected).astype(dtype)
+
+    def select(self, array):
+        '''
+        Values of the selected cells.
+
+        Args
+        ------
+        array : array, same shape as the masks
+
+        Returns
+        ------
+        values : array, 1D values in the native dtype of array, a view of
+            array when every cell is selected
+
+        '''
+
+        if array.shape != self.shape:
+            raise Exception('mask dimensions {} must match array '
+                            'dimensions {}'.format(self.shape, array.shape))
+
+        return self.select_rows(array, 0)
+
+    def select_rows(self, tile, start):
+        '''
+        Values of the selected cells in a tile of whole rows.
+
+        Args
+        ------
+        tile : array, 2D rows start to start + len(tile) of the masked array
+        start : int, first row of tile
+
+        Returns
+        ------
+        values : array, 1D values in the native dtype of tile, a view of
+            tile when every cell is selected
+
+        '''
+
+        rows, cols = self.shape
+
+        if (tile.ndim != 2 or tile.shape[1] != cols or
+                start + tile.shape[0] > rows):
+            raise Exception('tile dimensions {} at row {} do not fit mask '
+                            'dimensions {}'.format(tile.shape, start,
+                                                   self.shape))
+
+        if self.complete:
+            return tile.reshape(-1)
+
+        first = start * cols
+        lo, hi = np.searchsorted(self.index,
+                                 [first, first + tile.shape[0] * cols])
+
+        return tile.reshape(-1)[self.index[lo:hi] - first]
+
+
+def read_only(array):
+    '''True when no view of array can change its values in place.'''
+
+    while isinstance(array, np.ndarray):
+        if array.flags.writeable:
+            return False
+
+        array = array.base
+
+    return True
+
+
+class MaskCache():
+    '''
+    Least recently used cache of compiled masks.
+
+    Masks are identified by a hash of their shape, dtype and contents, so
+    a mask buffer refilled in place is compiled again. The hash of a read
+    only mask, that no view can change, is also remembered for as long as
+    that object is alive, so passing the same mask again skips hashing.
+
+    Args
+    ------
+    maxsize : int, compiled masks to keep
+
+    '''
+
+    def __init__(self, maxsize=MASK_CACHE_SIZE):
+
+        self.maxsize = maxsize
+        self._compiled = OrderedDict()
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._compiled)
+
+    def key(self, mask):
+        '''
+        Hashable key of one mask.
+
+        Args
+        ------
+        mask : array or DataFrame
+
+        Returns
+        ------
+        key : tuple, (shape, dtype, digest)
+
+        '''
+
+        if type(mask) == pd.core.frame.DataFrame:
+            mask = mask.values
+
+        # writeable masks can be refilled in place, and are hashed each time
+        remember = read_only(mask)
+
+        if remember:
+            entry = self._keys.get(id(mask))
+
+            if entry is not None and entry[0]() is mask:
+                return entry[1]
+
+        data = np.ascontiguousarray(mask)
+        digest = hashlib.blake2b(data.view(np.uint8).data,
+                                 digest_size=16).digest()
+        key = (data.shape, data.dtype.str, digest)
+
+        if not remember:
+            return key
+
+        ident = id(mask)
+
+        try:
+            ref = weakref.ref(mask, lambda r: self._keys.pop(ident, None))
+            self._keys[ident] = (ref, key)
+
+        except TypeError:
+            pass
+
+        return key
+
+    def get(self, masks):
+        '''
+        Compiled form of a list of masks, compiling it if not cached.
+
+        Args
+        ------
+        masks : list, 2D arrays or DataFrames
+
+        Returns
+        ------
+        compiled : CompiledMask
+
+        '''
+
+        key = tuple(self.key(mask) for mask in masks)
+
+        with self._lock:
+            compiled = self._compiled.get(key)
+
+            if compiled is not None:
+                self._compiled.move_to_end(key)
+                return compiled
+
+        compiled = CompiledMask(masks)
+
+        with self._lock:
+            self._compiled[key] = compiled
+
+            while len(self._compiled) > self.maxsize:
+                self._compiled.popitem(last=False)
+
+        return compiled
+
+    def clear(self):
+        '''Remove every compiled mask.'''
+
+        with self._lock:
+            self._compiled.clear()
+            self._keys.clear()
+
+
+mask_cache = MaskCache()
+
+
+def compile_masks(masks):
+    '''
+    Compiled form of masks from the process wide mask cache.
+
+    Args
+    ------
+    masks : list or array, 2D masks
+
+    Returns
+    ------
+    compiled : CompiledMask
+
+    '''
+
+    if type(masks) != list:
+        masks = [masks]
+
+    return mask_cache.get(masks)
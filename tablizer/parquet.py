@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+except ImportError:
+    pa = None
+    ds = None
+    pq = None
+
+# Inputs fields, in the order of the Inputs table
+FIELDS = ['id', 'run_id', 'run_name', 'basin_id', 'date_time', 'variable',
+          'function', 'value', 'unit']
+
+# directories of a dataset, run_name=<run>/variable=<variable>/year=<year>
+PARTITIONS = ['run_name', 'variable', 'year']
+
+# unique key of a record
+KEY_FIELDS = ['run_name', 'basin_id', 'date_time', 'variable', 'function']
+
+_sequence = [0]
+_sequence_lock = threading.Lock()
+
+
+def check_pyarrow():
+    '''Raise an Exception when pyarrow is not installed.'''
+
+    if pa is None:
+        raise Exception('the parquet database needs pyarrow, install it with '
+                        'pip install pyarrow')
+
+
+def schema():
+    '''Arrow schema of the files, the partition fields are last.'''
+
+    return pa.schema([('run_id', pa.int64()),
+                      ('basin_id', pa.int64()),
+                      ('date_time', pa.timestamp('us')),
+                      ('function', pa.string()),
+                      ('value', pa.float64()),
+                      ('unit', pa.string()),
+                      ('sequence', pa.int64()),
+                      ('run_name', pa.string()),
+                      ('variable', pa.string()),
+                      ('year', pa.int32())])
+
+
+def partitioning():
+    '''Hive partitioning of the dataset directories.'''
+
+    return ds.partitioning(pa.schema([('run_name', pa.string()),
+                                      ('variable', pa.string()),
+                                      ('year', pa.int32())]), flavor='hive')
+
+
+def next_sequence():
+    '''Increasing write sequence, later writes of a key win on read.'''
+
+    with _sequence_lock:
+        _sequence[0] = max(time.time_ns(), _sequence[0] + 1)
+
+        return _sequence[0]
+
+
+def store_frame(location, frame, run_id, run_name, units, overwrite=True):
+    '''
+    Append records to a parquet dataset, as one new file per partition.
+
+    Files are never rewritten. Records of a key written again are kept,
+    and reads return the last one written, so overwriting is an append.
+    Without overwrite, records of keys that are already stored are
+    dropped before writing. consolidate() merges the files of partitions.
+
+    Args
+    ------
+    location : str, dataset directory
+    frame : pd.DataFrame or dict of 1D arrays, columns = ['date_time',
+        'variable', 'basin_id', 'function', 'value']
+    run_id : int
+    run_name : str
+    units : dict, {variable: unit}
+    overwrite : bool, overwrite existing records if they exist
+
+    Returns
+    ------
+    count : int, records written
+
+    '''
+
+    check_pyarrow()
+
+    dates = pd.to_datetime(np.asarray(frame['date_time']))
+    variables = np.asarray(frame['variable']).astype(str)
+
+    records = pd.DataFrame({
+        'run_id': np.int64(run_id),
+        'basin_id': np.asarray(frame['basin_id']).astype(np.int64),
+        'date_time': dates,
+        'function': np.asarray(frame['function']).astype(str),
+        'value': np.asarray(frame['value'], dtype=float),
+        'unit': [units[v] for v in variables],
+        'sequence': next_sequence(),
+        'run_name': run_name,
+        'variable': variables,
+        'year': dates.year.values.astype(np.int32)})
+
+    # records of a key in one write are stored in turn, the last one wins,
+    # or the first one without overwrite
+    records = records.drop_duplicates(KEY_FIELDS,
+                                      keep='last' if overwrite else 'first')
+
+    if not overwrite and os.path.isdir(location):
+        existing = read_frame(location, KEY_FIELDS, run_name,
+                              variable=list(records['variable'].unique()),
+                              start_date=dates.min(), end_date=dates.max())
+        existing['exists'] = True
+        records = records.merge(existing, on=KEY_FIELDS, how='left')
+        records = records[records['exists'].isnull()].drop(columns='exists')
+
+    if len(records) == 0:
+        return 0
+
+    table = pa.Table.from_pandas(records, schema=schema(),
+                                 preserve_index=False)
+
+    ds.write_dataset(table, location, format='parquet',
+                     partitioning=partitioning(),
+                     basename_template='part-{}-{{i}}.parquet'.format(
+                         uuid.uuid4().hex),
+                     existing_data_behavior='overwrite_or_ignore')
+
+    return len(records)
+
+
+def dataset(location):
+    '''
+    Arrow dataset of a parquet database directory.
+
+    Args
+    ------
+    location : str, dataset directory
+
+    Returns
+    ------
+    dataset : pyarrow.dataset.Dataset, None when there are no records
+
+    '''
+
+    check_pyarrow()
+
+    if not os.path.isdir(location):
+        return None
+
+    return ds.dataset(location, schema=schema(), format='parquet',
+                      partitioning=partitioning())
+
+
+def record_filter(run_name=None, basin_id=None, variable=None, function=None,
+                  start_date=None, end_date=None):
+    '''
+    Arrow filter expression, partition fields prune whole directories and
+    the others are pushed down to the row group statistics.
+
+    Args
+    ------
+    run_name : str or list
+    basin_id : int or list
+    variable : str or list
+    function : str or list
+    start_date : datetime, first date_time, inclusive
+    end_date : datetime, last date_time, inclusive
+
+    Returns
+    ------
+    expression : pyarrow.dataset.Expression, None for every record
+
+    '''
+
+    expressions = []
+    filters = {'run_name': run_name, 'basin_id': basin_id,
+               'variable': variable, 'function': function}
+
+    for field, value in filters.items():
+        if value is None:
+            continue
+
+        if type(value) in [list, tuple, set]:
+            expressions.append(ds.field(field).isin(list(value)))
+        else:
+            expressions.append(ds.field(field) == value)
+
+    if start_date is not None:
+        start_date = pd.Timestamp(start_date)
+        expressions.append(ds.field('year') >= start_date.year)
+        expressions.append(ds.field('date_time') >= pa.scalar(
+            start_date.to_pydatetime(), pa.timestamp('us')))
+
+    if end_date is not None:
+        end_date = pd.Timestamp(end_date)
+        expressions.append(ds.field('year') <= end_date.year)
+        expressions.append(ds.field('date_time') <= pa.scalar(
+            end_date.to_pydatetime(), pa.timestamp('us')))
+
+    expression = None
+
+    for e in expressions:
+        expression = e if expression is None else expression & e
+
+    return expression
+
+
+def latest(frame):
+    '''Keep the last record written of every key.'''
+
+    frame = frame.sort_values('sequence', kind='stable')
+    frame = frame.drop_duplicates(KEY_FIELDS, keep='last')
+
+    return frame.drop(columns='sequence').sort_index()
+
+
+def read_table(data, columns, expression):
+    '''Read and deduplicate the records of a dataset matching expression.'''
+
+    read = [c for c in columns if c != 'id']
+    read = read + [c for c in KEY_FIELDS + ['sequence'] if c not in read]
+
+    frame = data.to_table(columns=read, filter=expression).to_pandas()
+
+    for c in ['run_name', 'variable']:
+        frame[c] = frame[c].astype(object)
+
+    return latest(frame).reset_index(drop=True)
+
+
+def shape_frame(frame, columns, first_id=1):
+    '''Inputs columns of a frame from read_table().'''
+
+    frame['id'] = np.arange(first_id, first_id + len(frame))
+
+    return frame[columns]
+
+
+def read_frame(location, columns=None, run_name=None, basin_id=None,
+               variable=None, function=None, start_date=None,
+               end_date=None):
+    '''
+    Read the records of a parquet dataset, the last written of each key.
+
+    Args
+    ------
+    location : str, dataset directory
+    columns : list, Inputs fields, default is every field, id numbers the
+        records from 1
+    run_name, basin_id, variable, function, start_date, end_date : see
+        record_filter()
+
+    Returns
+    ------
+    results : pd.DataFrame
+
+    '''
+
+    columns = check_columns(columns)
+    data = dataset(location)
+
+    if data is None:
+        return empty_frame(columns)
+
+    expression = record_filter(run_name, basin_id, variable, function,
+                               start_date, end_date)
+
+    return shape_frame(read_table(data, columns, expression), columns)
+
+
+def read_chunks(location, chunksize, columns=None, run_name=None,
+                basin_id=None, variable=None, function=None, start_date=None,
+                end_date=None):
+    '''
+    Generator of DataFrames of at most chunksize records of a parquet
+    dataset, reading one partition at a time.
+
+    Args
+    ------
+    see read_frame(), chunksize : int, records per DataFrame
+
+    '''
+
+    columns = check_columns(columns)
+    data = dataset(location)
+
+    if data is None:
+        return
+
+    expression = record_filter(run_name, basin_id, variable, function,
+                               start_date, end_date)
+    partitions = []
+
+    for fragment in data.get_fragments(filter=expression):
+        keys = ds.get_partition_keys(fragment.partition_expression)
+        key = tuple(keys[p] for p in PARTITIONS)
+
+        if key not in partitions:
+            partitions.append(key)
+
+    first_id = 1
+
+    for key in sorted(partitions):
+        where = record_filter(key[0], variable=key[1])
+        where = where & (ds.field('year') == key[2])
+
+        if expression is not None:
+            where = where & expression
+
+        frame = shape_frame(read_table(data, columns, where), columns,
+                            first_id)
+        first_id += len(frame)
+
+        for i in range(0, len(frame), chunksize):
+            yield frame.iloc[i:i + chunksize].reset_index(drop=True)
+
+
+def check_columns(columns):
+    '''Inputs fields to read, default is every field.'''
+
+    if columns is None:
+        return list(FIELDS)
+
+    for c in columns:
+        if c not in FIELDS:
+            raise Exception('column "{}" must be one of {}'.format(c, FIELDS))
+
+    return list(columns)
+
+
+def empty_frame(columns):
+    '''DataFrame without records.'''
+
+    return pd.DataFrame({c: [] for c in columns})
+
+
+def consolidate(location):
+    '''
+    Merge the files of every partition of a parquet dataset into one file,
+    keeping the last record written of every key.
+
+    Args
+    ------
+    location : str, dataset directory
+
+    Returns
+    ------
+    partitions : int, partitions merged
+
+    '''
+
+    data = dataset(location)
+
+    if data is None:
+        return 0
+
+    directories = {}
+
+    for fragment in data.get_fragments():
+        directory = os.path.dirname(fragment.path)
+        directories.setdefault(directory, []).append(fragment.path)
+
+    merged = 0
+
+    for directory, paths in directories.items():
+        if len(paths) < 2:
+            continue
+
+        frame = ds.dataset(paths, schema=schema(), format='parquet',
+                           partitioning=partitioning(),
+                           partition_base_dir=location).to_table().to_pandas()
+        frame = latest(frame)
+        frame['sequence'] = next_sequence()
+
+        table = pa.Table.from_pandas(frame, schema=schema(),
+                                     preserve_index=False)
+
+        # write next to the old files, then swap directories
+        tmp = directory + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        columns = [c for c in table.column_names if c not in PARTITIONS]
+        pq.write_table(table.select(columns), os.path.join(
+            tmp, 'part-{}-0.parquet'.format(uuid.uuid4().hex)))
+
+        old = directory + '.old'
+        os.rename(directory, old)
+        os.rename(tmp, directory)
+        shutil.rmtree(old)
+        merged += 1
+
+    return merged
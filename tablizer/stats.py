@@ -0,0 +1,839 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+# values per chunk for moment calculations, bounds the scratch memory
+CHUNK_SIZE = 2 ** 16
+
+# default relative accuracy of QuantileSketch
+SKETCH_ALPHA = 0.01
+
+# absolute values below this are counted as zero by QuantileSketch
+SKETCH_MIN_VALUE = 1e-12
+
+
+def lerp(a, b, t):
+    '''
+    Linear interpolation between a and b, computed the same way as numpy's
+    percentile functions so results agree with np.nanpercentile.
+
+    Args
+    ------
+    a : array, lower values
+    b : array, upper values
+    t : array, interpolation weights between 0 and 1
+
+    Returns
+    ------
+    result : array
+
+    '''
+
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    diff = b - a
+    result = np.asarray(a + diff * t, dtype=float)
+    upper = np.asarray(b - diff * (1 - t), dtype=float)
+    t = np.broadcast_to(t, result.shape)
+    result[t >= 0.5] = upper[t >= 0.5]
+
+    return result
+
+
+def percentile_index(n, percentile):
+    '''
+    Find the neighbouring sorted positions and weight for a percentile with
+    numpy's default 'linear' method.
+
+    Args
+    ------
+    n : int or array, number of valid values
+    percentile : int or float, 0 to 100
+
+    Returns
+    ------
+    previous : array, lower sorted position
+    following : array, upper sorted position
+    gamma : array, interpolation weight between the two
+
+    '''
+
+    n = np.asarray(n)
+    virtual = (n - 1) * np.true_divide(percentile, 100)
+    previous = np.floor(virtual)
+    gamma = virtual - previous
+    previous = previous.astype(np.intp)
+    following = np.minimum(previous + 1, np.maximum(n - 1, 0))
+
+    return previous, following, gamma
+
+
+class Moments():
+    '''
+    Count, sum and variance of the valid values, calculated together in one
+    chunked pass.
+
+    Each chunk keeps its own valid count, nan count, sum and sum of squared
+    deviations from the chunk mean, so the scratch memory is bounded by the
+    chunk size. Chunks from other arrays or tiles can be added with merge().
+
+    Args
+    ------
+    values : array, any shape
+    chunk_size : int, values per chunk
+
+    '''
+
+    def __init__(self, values=None, chunk_size=CHUNK_SIZE):
+
+        self.count = np.zeros(0, dtype=np.int64)
+        self.nans = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros(0)
+        self.m2 = np.zeros(0)
+
+        if values is not None:
+            self.update(values, chunk_size)
+
+    def update(self, values, chunk_size=CHUNK_SIZE):
+        '''
+        Add the chunks of values.
+
+        Args
+        ------
+        values : array, any shape
+        chunk_size : int, values per chunk
+
+        '''
+
+        values = np.asarray(values).reshape(-1)
+        starts = range(0, values.size, chunk_size)
+        nchunks = len(starts)
+
+        count = np.zeros(nchunks, dtype=np.int64)
+        nans = np.zeros(nchunks, dtype=np.int64)
+        sums = np.zeros(nchunks)
+        m2 = np.zeros(nchunks)
+
+        for i, start in enumerate(starts):
+            chunk = values[start:start + chunk_size]
+
+            # accumulate in float64 whatever the dtype of values
+            if chunk.dtype.kind == 'f':
+                valid = chunk[~np.isnan(chunk)].astype(np.float64, copy=False)
+                nans[i] = chunk.size - valid.size
+            else:
+                valid = chunk.astype(np.float64)
+
+            count[i] = valid.size
+
+            if valid.size:
+                sums[i] = valid.sum()
+                valid -= sums[i] / valid.size
+                m2[i] = np.dot(valid, valid)
+
+        self.count = np.concatenate((self.count, count))
+        self.nans = np.concatenate((self.nans, nans))
+        self.sums = np.concatenate((self.sums, sums))
+        self.m2 = np.concatenate((self.m2, m2))
+
+    def merge(self, other):
+        '''
+        Add the chunks of another Moments, in order.
+
+        Args
+        ------
+        other : Moments
+
+        '''
+
+        self.count = np.concatenate((self.count, other.count))
+        self.nans = np.concatenate((self.nans, other.nans))
+        self.sums = np.concatenate((self.sums, other.sums))
+        self.m2 = np.concatenate((self.m2, other.m2))
+
+    def result(self):
+        '''
+        Combine the chunks.
+
+        Returns
+        ------
+        stats : dict, {'count', 'has_nan', 'sum', 'mean', 'var', 'std'}
+
+        '''
+
+        n = int(self.count.sum())
+        total = self.sums.sum()
+        stats = {'count': n, 'has_nan': bool(self.nans.sum() > 0),
+                 'sum': total, 'mean': np.nan, 'var': np.nan, 'std': np.nan}
+
+        if n > 0:
+            valid = self.count > 0
+            mean = total / n
+            d = self.sums[valid] / self.count[valid] - mean
+            m2 = self.m2.sum() + np.dot(self.count[valid] * d, d)
+
+            stats['mean'] = mean
+            stats['var'] = m2 / n
+            stats['std'] = np.sqrt(stats['var'])
+
+        return stats
+
+
+def order_statistics(values, percentiles=[], median=False, copy=True):
+    '''
+    Calculate min, max, median and percentiles of the valid values together,
+    with a single partition of the values.
+
+    Nan values sort to the end of the partition, so the order statistics of
+    the valid values are read from the first positions without removing
+    nan values first.
+
+    Args
+    ------
+    values : array, any shape
+    percentiles : list, percentiles to calculate
+    median : bool, calculate the median
+    copy : bool, partition a copy of values, if False values are reordered
+        in place
+
+    Returns
+    ------
+    stats : dict, {'count', 'has_nan', 'min', 'max', 'median',
+        'percentile_<p>'}
+
+    '''
+
+    if copy:
+        values = np.array(values)
+
+    values = values.reshape(-1)
+
+    if values.dtype.kind == 'f':
+        n = values.size - np.count_nonzero(np.isnan(values))
+    else:
+        n = values.size
+
+    stats = {'count': n, 'has_nan': n < values.size}
+
+    if n == 0:
+        for key in ['min', 'max', 'median']:
+            stats[key] = np.nan
+
+        for p in percentiles:
+            stats['percentile_{}'.format(p)] = np.nan
+
+        return stats
+
+    if not percentiles and not median:
+        stats['min'] = np.fmin.reduce(values)
+        stats['max'] = np.fmax.reduce(values)
+
+        return stats
+
+    kth = [0, n - 1]
+
+    if median:
+        kth += [(n - 1) // 2, n // 2]
+
+    indexes = []
+
+    for p in percentiles:
+        previous, following, gamma = percentile_index(n, p)
+        indexes.append((p, int(previous), int(following), gamma))
+        kth += [int(previous), int(following)]
+
+    values.partition(np.unique(kth))
+
+    stats['min'] = values[0]
+    stats['max'] = values[n - 1]
+
+    if median:
+        if n % 2 == 1:
+            stats['median'] = values[n // 2]
+        else:
+            stats['median'] = np.mean(values[n // 2 - 1:n // 2 + 1])
+
+    for p, previous, following, gamma in indexes:
+        stats['percentile_{}'.format(p)] = lerp(values[previous],
+                                                values[following], gamma)[()]
+
+    return stats
+
+
+class QuantileSketch():
+    '''
+    Mergeable sketch of the distribution of values, for approximate
+    percentiles without keeping the values.
+
+    Values are counted in logarithmic buckets (as in DDSketch), with
+    separate buckets for positive and negative values and a count of zeros.
+    Any value x is represented within a relative error alpha, so every
+    percentile is within alpha * |x| of the exact np.nanpercentile result
+    when the two values it interpolates between have the same sign. The
+    min and max, and so the 0 and 100 percentiles, are exact. Memory
+    depends on the range of the values, not on their number, about
+    log(max / min) / (2 * alpha) buckets per sign.
+
+    Sketches of tiles, masks or time steps are combined with merge(), and
+    the result is the same as one sketch of all their values.
+
+    Args
+    ------
+    values : array, optional values to add
+    alpha : float, relative accuracy, between 0 and 1
+
+    '''
+
+    def __init__(self, values=None, alpha=SKETCH_ALPHA):
+
+        if not 0 < alpha < 1:
+            raise Exception('alpha must be between 0 and 1')
+
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.count = 0
+        self.zeros = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.keys = {1: np.zeros(0, dtype=np.int64),
+                     -1: np.zeros(0, dtype=np.int64)}
+        self.counts = {1: np.zeros(0, dtype=np.int64),
+                       -1: np.zeros(0, dtype=np.int64)}
+
+        if values is not None:
+            self.update(values)
+
+    def __len__(self):
+        return self.count
+
+    def _add(self, sign, keys, counts):
+        '''Add bucket counts to the positive or negative buckets.'''
+
+        keys = np.concatenate((self.keys[sign], keys))
+        counts = np.concatenate((self.counts[sign], counts))
+        self.keys[sign], inverse = np.unique(keys, return_inverse=True)
+        self.counts[sign] = np.bincount(inverse, counts).astype(np.int64)
+
+    def update(self, values):
+        '''
+        Add values, nan values are skipped.
+
+        Args
+        ------
+        values : array, any shape
+
+        '''
+
+        values = np.asarray(values).reshape(-1)
+
+        if values.size == 0:
+            return
+
+        low = values.min()
+
+        # min() is nan only when there are nan values to skip
+        if values.dtype.kind == 'f' and np.isnan(low):
+            values = values[~np.isnan(values)]
+
+            if values.size == 0:
+                return
+
+            low = values.min()
+
+        self.count += values.size
+        self.min = min(self.min, float(low))
+        self.max = max(self.max, float(values.max()))
+
+        # one bincount for both signs, code = 2 * bucket + negative, with
+        # bucket 0 for zeros and values below SKETCH_MIN_VALUE
+        zero = int(np.floor(np.log(SKETCH_MIN_VALUE) / np.log(self.gamma)))
+
+        with np.errstate(divide='ignore'):
+            keys = np.log(np.abs(values, dtype=np.float64))
+
+        keys /= np.log(self.gamma)
+        np.ceil(keys, out=keys)
+        np.maximum(keys, zero, out=keys)
+        codes = (keys.astype(np.int64) - zero) * 2
+        codes += values < 0
+
+        counts = np.bincount(codes)
+        codes = np.flatnonzero(counts)
+        counts = counts[codes]
+
+        buckets = codes // 2
+        negative = codes % 2 == 1
+        self.zeros += int(counts[buckets == 0].sum())
+
+        for sign, selected in [(1, ~negative), (-1, negative)]:
+            selected &= buckets > 0
+
+            if selected.any():
+                self._add(sign, buckets[selected] + zero,
+                          counts[selected].astype(np.int64))
+
+    def merge(self, other):
+        '''
+        Add the values of another sketch.
+
+        Args
+        ------
+        other : QuantileSketch, with the same alpha
+
+        '''
+
+        if other.alpha != self.alpha:
+            raise Exception('sketches must have the same alpha to merge')
+
+        self.count += other.count
+        self.zeros += other.zeros
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+        for sign in [1, -1]:
+            self._add(sign, other.keys[sign], other.counts[sign])
+
+    def percentile(self, percentiles):
+        '''
+        Approximate percentiles, interpolated like np.nanpercentile.
+
+        Args
+        ------
+        percentiles : float or list, 0 to 100
+
+        Returns
+        ------
+        values : float or array, nan if the sketch is empty
+
+        '''
+
+        scalar = np.ndim(percentiles) == 0
+        percentiles = np.atleast_1d(percentiles)
+
+        if self.count == 0:
+            result = np.full(percentiles.shape, np.nan)
+            return result[0] if scalar else result
+
+        # bucket values in ascending order, negative values first
+        value = 2 / (self.gamma + 1)
+        buckets = np.concatenate((
+            -value * self.gamma ** self.keys[-1][::-1].astype(float),
+            [0.0],
+            value * self.gamma ** self.keys[1].astype(float)))
+        counts = np.concatenate((self.counts[-1][::-1], [self.zeros],
+                                 self.counts[1]))
+        cumulative = np.cumsum(counts)
+
+        previous, following, gamma = percentile_index(self.count,
+                                                      percentiles)
+        a = buckets[np.searchsorted(cumulative, previous, side='right')]
+        b = buckets[np.searchsorted(cumulative, following, side='right')]
+
+        result = np.clip(lerp(a, b, gamma), self.min, self.max)
+        result[percentiles == 0] = self.min
+        result[percentiles == 100] = self.max
+
+        return result[0] if scalar else result
+
+
+def select_sorted(runs, k):
+    '''
+    Find the k-th smallest value of several sorted arrays, without merging
+    them.
+
+    Args
+    ------
+    runs : list, sorted 1D arrays without nan values
+    k : int, 0 based rank
+
+    Returns
+    ------
+    value : the k-th smallest value
+
+    '''
+
+    for run in runs:
+        lo = 0
+        hi = len(run)
+
+        while lo < hi:
+            m = (lo + hi) // 2
+            c = run[m]
+            less = sum(np.searchsorted(r, c, side='left') for r in runs)
+            equal = sum(np.searchsorted(r, c, side='right') for r in runs)
+
+            if less <= k < equal:
+                return c
+
+            if equal <= k:
+                lo = m + 1
+            else:
+                hi = m
+
+    raise Exception('rank {} is out of range'.format(k))
+
+
+def sorted_order_statistics(runs, percentiles=[], median=False):
+    '''
+    Calculate min, max, median and percentiles of the values of several
+    sorted arrays, giving the same results as order_statistics() of all
+    the values.
+
+    Args
+    ------
+    runs : list, sorted 1D arrays without nan values
+    percentiles : list, percentiles to calculate
+    median : bool, calculate the median
+
+    Returns
+    ------
+    stats : dict, {'count', 'has_nan', 'min', 'max', 'median',
+        'percentile_<p>'}
+
+    '''
+
+    runs = [r for r in runs if len(r)]
+    n = sum(len(r) for r in runs)
+
+    if n == 0:
+        return order_statistics(np.zeros(0), percentiles, median)
+
+    stats = {'count': n, 'has_nan': False,
+             'min': min(r[0] for r in runs),
+             'max': max(r[-1] for r in runs)}
+
+    if median:
+        low = select_sorted(runs, (n - 1) // 2)
+
+        if n % 2 == 1:
+            stats['median'] = low
+        else:
+            stats['median'] = np.mean([low, select_sorted(runs, n // 2)])
+
+    for p in percentiles:
+        previous, following, gamma = percentile_index(n, p)
+        stats['percentile_{}'.format(p)] = lerp(
+            select_sorted(runs, int(previous)),
+            select_sorted(runs, int(following)), gamma)[()]
+
+    return stats
+
+
+class Reduction():
+    '''
+    Mergeable statistics of values added tile by tile.
+
+    Moments are kept per chunk (see Moments) and min/max are combined
+    exactly. For the median and percentiles the valid values of every tile
+    are kept and partitioned once by result(), which is exact as long as the
+    valid values fit in memory. With approximate=True they are counted in a
+    QuantileSketch instead, and memory no longer grows with the values.
+    Percentiles in sketch_percentiles always come from the QuantileSketch.
+
+    Tiles added with sort=True keep their valid values sorted, and when
+    every tile is sorted result() selects the order statistics from the
+    sorted tiles instead of partitioning them again. This lets tiles be
+    sorted in parallel and merged exactly.
+
+    Args
+    ------
+    moments : bool, calculate count, sum, mean and std
+    order : bool, calculate min and max
+    median : bool, calculate the median
+    percentiles : list, percentiles to calculate
+    approximate : bool, use a QuantileSketch for median and percentiles
+    alpha : float, relative accuracy of the QuantileSketch
+    sketch_percentiles : list, approximate percentiles to calculate
+    sketch : bool, keep a QuantileSketch of the values in any case
+
+    '''
+
+    def __init__(self, moments=True, order=True, median=False, percentiles=[],
+                 approximate=False, alpha=SKETCH_ALPHA, sketch_percentiles=[],
+                 sketch=False):
+
+        self._settings = dict(moments=moments, order=order, median=median,
+                              percentiles=percentiles,
+                              approximate=approximate, alpha=alpha,
+                              sketch_percentiles=sketch_percentiles,
+                              sketch=sketch)
+        self.moments = Moments() if moments else None
+        self.order = order or median or len(percentiles) > 0
+        self.median = median
+        self.percentiles = list(percentiles)
+        self.sketch_percentiles = list(sketch_percentiles)
+        self.exact = (median or len(percentiles) > 0) and not approximate
+        self.count = 0
+        self.nans = 0
+        self.min = np.nan
+        self.max = np.nan
+        self.parts = []
+        self.sorted = []
+        self.sketch = None
+
+        if sketch or (self.order and approximate) or self.sketch_percentiles:
+            self.sketch = QuantileSketch(alpha=alpha)
+
+    def empty(self):
+        '''
+        New Reduction with the same settings, to merge into this one.
+
+        Returns
+        ------
+        reduction : Reduction
+
+        '''
+
+        return Reduction(**self._settings)
+
+    def update(self, values, owned=False, sort=False):
+        '''
+        Add the values of one tile.
+
+        Args
+        ------
+        values : array, any shape
+        owned : bool, values is a copy that may be reordered in place
+        sort : bool, keep the valid values sorted, see result()
+
+        '''
+
+        values = np.asarray(values).reshape(-1)
+
+        if values.dtype.kind == 'f':
+            isnan = np.isnan(values)
+            nans = int(np.count_nonzero(isnan))
+        else:
+            isnan = None
+            nans = 0
+
+        self.nans += nans
+        self.count += values.size - nans
+
+        if self.moments is not None:
+            self.moments.update(values)
+
+        if values.size == nans:
+            return
+
+        if self.sketch is not None:
+            self.sketch.update(values[~isnan] if nans else values)
+
+        # nan values sort last, so owned values are kept as they are
+        if self.exact:
+            if sort:
+                values = np.sort(values[~isnan] if nans else values)
+            elif not owned:
+                values = values[~isnan] if nans else values.copy()
+
+            self.parts.append(values)
+            self.sorted.append(sort)
+
+        elif self.order:
+            self.min = np.fmin(self.min, np.fmin.reduce(values))
+            self.max = np.fmax(self.max, np.fmax.reduce(values))
+
+    def merge(self, other):
+        '''
+        Add the statistics of another Reduction, in order.
+
+        Args
+        ------
+        other : Reduction, with the same settings
+
+        '''
+
+        self.count += other.count
+        self.nans += other.nans
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self.parts.extend(other.parts)
+        self.sorted.extend(other.sorted)
+
+        if self.moments is not None:
+            self.moments.merge(other.moments)
+
+        if self.sketch is not None:
+            self.sketch.merge(other.sketch)
+
+    def result(self):
+        '''
+        Combine the statistics of every tile.
+
+        Returns
+        ------
+        stats : dict, {'count', 'has_nan', 'min', 'max', 'median',
+            'percentile_<p>', 'approx_percentile_<p>', 'sum', 'mean', 'var',
+            'std'}
+
+        '''
+
+        stats = {'min': self.min, 'max': self.max, 'median': np.nan}
+
+        for p in self.percentiles:
+            stats['percentile_{}'.format(p)] = np.nan
+
+        if self.moments is not None:
+            stats.update(self.moments.result())
+
+        if self.parts and all(self.sorted):
+            stats.update(sorted_order_statistics(self.parts, self.percentiles,
+                                                 self.median))
+
+        elif self.parts:
+            if len(self.parts) == 1:
+                values = self.parts[0]
+            else:
+                values = np.concatenate(self.parts)
+
+            stats.update(order_statistics(values, self.percentiles,
+                                          self.median, copy=False))
+
+        if self.sketch is not None:
+            quantiles = self.sketch_percentiles
+
+            if not self.exact:
+                quantiles = quantiles + [50] + self.percentiles
+
+            values = self.sketch.percentile(quantiles)
+            n = len(self.sketch_percentiles)
+
+            for p, v in zip(self.sketch_percentiles, values[:n]):
+                stats['approx_percentile_{}'.format(p)] = v
+
+            if not self.exact:
+                stats['median'] = values[n]
+
+                for p, v in zip(self.percentiles, values[n + 1:]):
+                    stats['percentile_{}'.format(p)] = v
+
+        stats['count'] = self.count
+        stats['has_nan'] = self.nans > 0
+
+        return stats
+
+
+def merge_sketches(sketches):
+    '''
+    Combine sketches, for example hourly sketches into a daily one.
+
+    Args
+    ------
+    sketches : list, QuantileSketch with the same alpha, None is skipped
+
+    Returns
+    ------
+    sketch : QuantileSketch, or None if there are no sketches
+
+    '''
+
+    merged = None
+
+    for sketch in sketches:
+        if sketch is None:
+            continue
+
+        if merged is None:
+            merged = QuantileSketch(alpha=sketch.alpha)
+
+        merged.merge(sketch)
+
+    return merged
+
+
+def zonal_reduce(values, labels, zones, methods, percentiles,
+                 mask_zero_values=False):
+    '''
+    Apply methods to the values of every zone of a label raster at once,
+    with grouped reductions (bincount for moments, one sort for order
+    statistics) instead of one masked copy per zone.
+
+    Methods without the 'nan' prefix return nan for zones containing any nan.
+
+    Args
+    ------
+    values : array, 2D values
+    labels : array, 2D integer labels, same shape as values
+    zones : array, sorted labels to summarize
+    methods : list, method names from Methods.options
+    percentiles : list, [low, high]
+    mask_zero_values : bool, treat zero values as nan
+
+    Returns
+    ------
+    results : dict {column: array of len(zones)}
+
+    '''
+
+    nz = len(zones)
+    labels = labels.ravel()
+    values = values.ravel()
+
+    inzone = np.isin(labels, zones)
+    z = np.searchsorted(zones, labels[inzone])
+    v = values[inzone].astype(float)
+
+    if mask_zero_values:
+        v[v == 0] = np.nan
+
+    isnan = np.isnan(v)
+    nan_count = np.bincount(z[isnan], minlength=nz)
+    z = z[~isnan]
+    v = v[~isnan]
+    count = np.bincount(z, minlength=nz)
+    empty = count == 0
+
+    stats = {}
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+
+        if any(m.replace('nan', '') in ['mean', 'std'] for m in methods):
+            stats['mean'] = np.bincount(z, v, minlength=nz) / count
+            d = v - stats['mean'][z]
+            stats['std'] = np.sqrt(np.bincount(z, d * d, minlength=nz) / count)
+
+        if any(m.replace('nan', '') in ['min', 'max', 'median', 'percentile']
+               for m in methods):
+            sv = v[np.lexsort((v, z))]
+            starts = np.concatenate(([0], np.cumsum(count)[:-1]))
+            n = np.maximum(count, 1)
+            last = np.minimum(starts + n - 1, max(len(sv) - 1, 0))
+            take = np.minimum(starts, max(len(sv) - 1, 0))
+
+            if len(sv) == 0:
+                sv = np.full(1, np.nan)
+
+            stats['min'] = sv[take]
+            stats['max'] = sv[last]
+
+            low = np.minimum(starts + (n - 1) // 2, last)
+            high = np.minimum(starts + n // 2, last)
+            stats['median'] = (sv[low] + sv[high]) / 2
+            stats['median'][n % 2 == 1] = sv[low][n % 2 == 1]
+
+            for p in percentiles:
+                previous, following, gamma = percentile_index(n, p)
+                stats['percentile_{}'.format(p)] = lerp(
+                    sv[np.minimum(starts + previous, last)],
+                    sv[np.minimum(starts + following, last)], gamma)
+
+    results = {}
+
+    for method in methods:
+        name = method.replace('nan', '')
+
+        if name == 'percentile':
+            keys = [('{}_{}'.format(method, p), 'percentile_{}'.format(p))
+                    for p in percentiles]
+        else:
+            keys = [(method, name)]
+
+        for col, key in keys:
+            r = np.array(stats[key], dtype=float)
+            r[empty] = np.nan
+
+            if not method.startswith('nan'):
+                r[nan_count > 0] = np.nan
+
+            results[col] = r
+
+    return results
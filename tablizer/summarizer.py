@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from tablizer.defaults import Methods
+from tablizer.masks import compile_masks
+from tablizer.stats import Reduction, SKETCH_ALPHA, CHUNK_SIZE
+
+# methods calculated from one shared partition of the values
+ORDER_METHODS = ['min', 'max', 'median', 'percentile']
+
+# methods calculated from one shared pass of count, sum and variance
+MOMENT_METHODS = ['mean', 'std']
+
+# methods that skip nan values, the others are nan if any value is nan
+NAN_METHODS = [m for m in Methods.options if m.startswith('nan')] + \
+    ['approx_percentile']
+
+# values per tile when reducing memory mapped arrays
+TILE_SIZE = 2 ** 22
+
+
+def check_methods(methods, percentiles):
+    """
+    Check methods and percentiles, and make the list of result columns.
+
+    Args
+    ------
+    methods {list}: (['mean','std']), strings of numpy functions to apply
+    percentiles {list}: ([low, high]), must supply when using 'percentile'
+
+    Returns
+    ------
+    cols {list}: result column names, percentile columns are appended last
+    """
+
+    method_options = Methods.options
+
+    cols = [x for x in methods if 'percentile' not in x]
+
+    for method in methods:
+        if method not in method_options:
+            raise Exception('Method must be in {}'.format(method_options))
+
+        if 'percentile' in method:
+            if type(percentiles) != list:
+                raise Exception('percentiles must be a list')
+
+            if type(percentiles[0]) != int or type(percentiles[1]) != int:
+                raise Exception('percentiles must be list of int')
+
+            if len(percentiles) != 2 or (percentiles[1] < percentiles[0]):
+                raise Exception('percentiles must [low, high]')
+
+            cols = cols + ['{}_{}'.format(method, str(percentiles[0])),
+                           '{}_{}'.format(method, str(percentiles[1]))]
+
+    return cols
+
+
+class Summarizer():
+    """
+    Calculate basic summary statistics for many 2D arrays with the same
+    settings.
+
+    Methods, percentiles and masks are checked and the result columns are
+    planned once, when the Summarizer is created. Each call then writes one
+    row of results into a preallocated buffer, and to_frame() returns all
+    rows as one DataFrame, matching summarize() value for value.
+
+    Masks are compiled once into the flat indices of the selected cells
+    (see tablizer.masks), and statistics are calculated on those cells only,
+    without changing array in place. Values keep the dtype of array, so a
+    float32 array is never copied to float64, while sums and interpolation
+    are accumulated in float64.
+
+    Arrays larger than memory, such as np.memmap or np.load(mmap_mode='r')
+    arrays, are reduced in tiles of whole rows, and an iterable of 2D row
+    tiles can be passed instead of an array. Percentiles and medians stay
+    exact as long as the selected valid values fit in memory, otherwise use
+    approximate=True.
+
+    With n_threads, the selected values are split into parts aligned to the
+    moment chunks, and each part is reduced and sorted on its own thread
+    (numpy releases the GIL). The parts are merged exactly, the moments from
+    the same chunks as the serial path and percentiles by selection from the
+    sorted parts, so results do not depend on n_threads.
+
+    Args
+    ------
+    methods {list}: (['mean','std']), strings of numpy functions to apply
+    percentiles {list}: ([low, high]), must supply when using 'percentile'
+    decimals {int}: rounding
+    masks {list}: mask outputs
+    mask_zero_values {bool}: mask zero values in array
+    capacity {int}: number of rows to preallocate, grows as needed
+    tile_rows {int}: rows per tile, default is one tile for arrays in memory
+        and about TILE_SIZE values per tile for np.memmap arrays
+    approximate {bool}: calculate medians and percentiles from a
+        QuantileSketch, see tablizer.stats
+    alpha {float}: relative accuracy of approximate results and of
+        'approx_percentile'
+    keep_sketches {bool}: keep the QuantileSketch of every call, to combine
+        them later with sketches() and resample_sketches()
+    n_threads {int}: reduce each array in this many parts on a thread pool,
+        results are identical to n_threads=None, the pool is made on the
+        first call and reused until close()
+
+    Example
+    ------
+    summarizer = Summarizer(['nanmean', 'nanpercentile'], [25, 75], 3)
+
+    for date, array in grids:
+        summarizer(array, date)
+
+    result = summarizer.to_frame()
+    """
+
+    def __init__(self, methods, percentiles=[25, 75], decimals=3,
+                 masks=None, mask_zero_values=False, capacity=256,
+                 tile_rows=None, approximate=False, alpha=SKETCH_ALPHA,
+                 keep_sketches=False, n_threads=None):
+
+        if not isinstance(methods, list):
+            raise TypeError("methods must be a list")
+
+        self.columns = check_methods(methods, percentiles)
+        self.methods = methods
+        self.percentiles = percentiles
+        self.decimals = decimals
+        self.mask_zero_values = mask_zero_values
+        self.tile_rows = tile_rows
+        self.approximate = approximate
+        self.alpha = alpha
+        self.keep_sketches = keep_sketches
+        self.n_threads = n_threads
+
+        # column positions for each method, percentile columns are
+        # appended in pairs, positions allow equal low and high percentiles
+        self._plan = []
+        position = len([m for m in methods if 'percentile' not in m])
+
+        for method in methods:
+            if 'percentile' in method:
+                idx = [position, position + 1]
+                position += 2
+            else:
+                idx = [self.columns.index(method)]
+
+            self._plan.append((method, idx))
+
+        self._order = set(m.replace('nan', '') for m in methods
+                          if m.replace('nan', '') in ORDER_METHODS)
+        self._order_percentiles = []
+
+        if 'percentile' in self._order:
+            self._order_percentiles = percentiles
+
+        self._sketch_percentiles = []
+
+        if 'approx_percentile' in methods:
+            self._sketch_percentiles = percentiles
+
+        self._moments = set(m.replace('nan', '') for m in methods
+                            if m.replace('nan', '') in MOMENT_METHODS)
+
+        self.mask = None
+
+        if masks is not None:
+            self.mask = compile_masks(masks)
+
+        self._values = np.full((max(int(capacity), 1), len(self.columns)),
+                               np.nan)
+        self._dates = []
+        self._sketches = []
+        self._pool = None
+
+    def __len__(self):
+        return len(self._dates)
+
+    def __call__(self, array, date):
+        """
+        Summarize one array.
+
+        Args
+        ------
+        array {arr}: 2D array, np.memmap, DataFrame, or an iterable of 2D
+            row tiles of one array
+        date {str}: ('2019-8-18 23:00'), anything pd.to_datetime() can parse
+
+        Returns
+        ------
+        row {arr}: results in the order of Summarizer.columns
+        """
+
+        if type(array) == pd.core.frame.DataFrame:
+            array = array.values
+
+        if isinstance(array, np.ndarray):
+            if len(array.shape) != 2:
+                raise Exception('array must be 2D array or DataFrame')
+
+            if self.mask is not None and self.mask.shape != array.shape:
+                raise Exception('mask dimensions {} must match array '
+                                'dimensions '
+                                '{}'.format(self.mask.shape, array.shape))
+
+            tiles = self._tiles(array)
+
+        elif hasattr(array, '__iter__') and not isinstance(array, str):
+            tiles = array
+
+        else:
+            raise Exception('array type {} not valid'.format(type(array)))
+
+        try:
+            date_time = pd.to_datetime(date)
+        except (ValueError, TypeError) as e:
+            raise Exception('pandas.to_datetime() failed with -> {}'.format(
+                date)) from e
+
+        reduction = Reduction(moments=len(self._moments) > 0,
+                              order=len(self._order) > 0,
+                              median='median' in self._order,
+                              percentiles=self._order_percentiles,
+                              approximate=self.approximate, alpha=self.alpha,
+                              sketch_percentiles=self._sketch_percentiles,
+                              sketch=self.keep_sketches)
+        start = 0
+        pool = self._thread_pool()
+        failed = True
+
+        try:
+            for tile in tiles:
+                if type(tile) == pd.core.frame.DataFrame:
+                    tile = tile.values
+
+                tile = np.asanyarray(tile)
+
+                if len(tile.shape) != 2:
+                    raise Exception('array tiles must be 2D')
+
+                values, owned = self._select(tile, start)
+                self._update(reduction, values, owned, pool)
+                start += tile.shape[0]
+
+            failed = False
+
+        finally:
+            # parts of a failed tile may still be queued, drop the pool
+            if failed:
+                self.close()
+
+        if self.mask is not None and start != self.mask.shape[0]:
+            raise Exception('array has {} rows, masks have '
+                            '{}'.format(start, self.mask.shape[0]))
+
+        # masked out cells count as nan for methods without 'nan'
+        missing = self.mask is not None and not self.mask.complete
+
+        n = len(self._dates)
+
+        if n == self._values.shape[0]:
+            grow = np.full(self._values.shape, np.nan)
+            self._values = np.concatenate((self._values, grow))
+
+        row = self._values[n]
+        self._summarize(reduction.result(), row, missing)
+        self._dates.append(date_time)
+
+        if self.keep_sketches:
+            self._sketches.append(reduction.sketch)
+
+        return row.copy()
+
+    def _thread_pool(self):
+        """Thread pool of the parts, made once, None without n_threads."""
+
+        if self.n_threads is None or self.n_threads <= 1:
+            return None
+
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.n_threads,
+                                            thread_name_prefix='Summarizer')
+
+        return self._pool
+
+    def close(self):
+        """Stop the thread pool, a later call makes a new one."""
+
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def _tiles(self, array):
+        """Split array into tiles of whole rows."""
+
+        tile_rows = self.tile_rows
+
+        if tile_rows is None and isinstance(array, np.memmap):
+            tile_rows = max(1, TILE_SIZE // max(array.shape[1], 1))
+
+        if tile_rows is None or array.shape[0] <= tile_rows:
+            return [array]
+
+        return (array[r:r + tile_rows]
+                for r in range(0, array.shape[0], tile_rows))
+
+    def _select(self, tile, start):
+        """
+        Masked values of one tile.
+
+        Args
+        ------
+        tile {arr}: 2D rows of the array
+        start {int}: first row of tile
+
+        Returns
+        ------
+        values {arr}: 1D selected values
+        owned {bool}: values is a copy that may be reordered in place
+        """
+
+        if self.mask is None:
+            return tile.reshape(-1), False
+
+        values = self.mask.select_rows(tile, start)
+        owned = not self.mask.complete
+
+        if self.mask_zero_values:
+            zeros = values == 0
+
+            if zeros.any():
+                dtype = values.dtype if values.dtype.kind == 'f' else float
+                values = values.astype(dtype, copy=not owned)
+                values[zeros] = np.nan
+                owned = True
+
+        return values, owned
+
+    def _update(self, reduction, values, owned, pool=None):
+        """
+        Add values to reduction, in parts on the thread pool if there is
+        one.
+
+        Args
+        ------
+        reduction {Reduction}: statistics of the array so far
+        values {arr}: 1D selected values of one tile
+        owned {bool}: values is a copy that may be reordered in place
+        pool {ThreadPoolExecutor}: threads to reduce parts on
+        """
+
+        if pool is None or values.size <= CHUNK_SIZE:
+            reduction.update(values, owned)
+            return
+
+        # parts start on moment chunk boundaries, like the serial path
+        chunks = -(-values.size // CHUNK_SIZE)
+        step = -(-chunks // self.n_threads) * CHUNK_SIZE
+
+        def reduce(start):
+            part = reduction.empty()
+            part.update(values[start:start + step], owned, sort=True)
+            return part
+
+        for part in pool.map(reduce, range(0, values.size, step)):
+            reduction.merge(part)
+
+    def _summarize(self, stats, row, missing=False):
+        """
+        Fan statistics out to the method columns of row.
+
+        Args
+        ------
+        stats {dict}: results of Reduction.result()
+        row {arr}: results in the order of Summarizer.columns
+        missing {bool}: cells were masked out of the values
+        """
+
+        for method, idx in self._plan:
+            name = method.replace('nan', '')
+
+            if 'percentile' in name:
+                v = np.array([stats['{}_{}'.format(name, p)]
+                              for p in self.percentiles], dtype=np.float64)
+            else:
+                v = np.array(stats[name], dtype=np.float64)
+
+            if ((stats['has_nan'] or missing) and
+                    method not in NAN_METHODS):
+                v = v * np.nan
+
+            if not np.isnan(v).any():
+                row[idx] = v.round(self.decimals)
+
+    def to_frame(self):
+        """
+        Results of every call so far.
+
+        Returns
+        ------
+        result {DataFrame}: index = dates, columns = methods
+        """
+
+        n = len(self._dates)
+
+        return pd.DataFrame(self._values[:n].copy(), index=self._dates,
+                            columns=self.columns)
+
+    def sketches(self):
+        """
+        QuantileSketch of every call so far, needs keep_sketches=True.
+
+        Returns
+        ------
+        sketches {Series}: index = dates, values = QuantileSketch
+        """
+
+        if not self.keep_sketches:
+            raise Exception('Summarizer must be created with '
+                            'keep_sketches=True')
+
+        return pd.Series(self._sketches, index=pd.DatetimeIndex(self._dates),
+                         dtype=object)
+
+    def reset(self):
+        """Clear results, keeping the buffer."""
+
+        self._values[:] = np.nan
+        self._dates = []
+        self._sketches = []
@@ -2,138 +2,373 @@
 import os
 import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
 
-from tablizer.inputs import Inputs, Base
-from tablizer.defaults import Units, Methods, Fields
-from tablizer.tools import create_sqlite_database, check_inputs_table, insert, \
-    make_session, check_existing_records, delete_records, make_cnx_string
+from tablizer.defaults import Units
+from tablizer.stats import zonal_reduce, merge_sketches, CHUNK_SIZE
+from tablizer.summarizer import Summarizer, check_methods
+from tablizer.masks import compile_masks
+from tablizer.tools import create_sqlite_database, make_cnx_string, \
+    create_schema, make_records, record_statements, write_statements, \
+    record_filter, frame_records, record_filters, has_unique_key, \
+    inputs_select, read_records, read_timeseries, BulkLoad, wide_frame, \
+    shape_records
+from tablizer import parquet, csvstore
+
+# database options of store() and get_existing_records()
+DATABASES = ['sql', 'sqlite', 'parquet', 'csv']
+
+# databases stored in a directory of files, by the module storing them
+FILE_DATABASES = {'parquet': parquet, 'csv': csvstore}
 
 
 def summarize(array, date, methods, percentiles=[25, 75], decimals=3,
-              masks=None, mask_zero_values=False):
+              masks=None, mask_zero_values=False, tile_rows=None,
+              approximate=False, n_threads=None):
     """
     Calculate basic summary statistics for 2D arrays or DataFrames.
 
+    To summarize many arrays with the same settings, create a Summarizer
+    once and call it for each array instead.
+
     Args
     ------
-    array {arr}: 2D array or DataFrame
+    array {arr}: 2D array or DataFrame, np.memmap arrays and iterables of
+        2D row tiles are reduced tile by tile
     date {str}: ('2019-8-18 23:00'), anything pd.to_datetime() can parse
-    methods {list}: (['mean','std']), strings of numpy functions to apply
+    methods {list}: (['mean','std']), strings of numpy functions to apply,
+        'approx_percentile' gives percentiles from a QuantileSketch
     percentiles {list}: ([low, high]), must supply when using 'percentile'
     decimals {int}: rounding
     masks {list}: mask outputs
     mask_zero_values {bool}: mask zero values in array
+    tile_rows {int}: rows per tile, to bound memory for large arrays
+    approximate {bool}: approximate medians and percentiles, for selected
+        values that do not fit in memory
+    n_threads {int}: reduce large arrays in parts on this many threads
 
     Returns
     ------
     result {DataFrame}: index = date, columns = methods
     """
 
-    method_options = Methods.options
+    summarizer = Summarizer(methods, percentiles, decimals, masks,
+                            mask_zero_values, capacity=1,
+                            tile_rows=tile_rows, approximate=approximate,
+                            n_threads=n_threads)
+    summarizer(array, date)
+
+    return summarizer.to_frame()
+
+
+def summarize_stack(array, dates, methods, percentiles=[25, 75], decimals=3,
+                    masks=None, mask_zero_values=False):
+    """
+    Calculate basic summary statistics for a stack of 2D arrays.
+
+    Each method is applied once to the whole stack, reducing over the two
+    spatial axes, instead of calling summarize() for every time step.
+
+    Args
+    ------
+    array {arr}: 3D array (time, y, x)
+    dates {list}: datetimes of the first array axis, anything
+        pd.to_datetime() can parse
+    methods {list}: (['mean','std']), strings of numpy functions to apply
+    percentiles {list}: ([low, high]), must supply when using 'percentile'
+    decimals {int}: rounding
+    masks {list}: 2D masks (y, x) applied to every time step, only the
+        selected cells are reduced, in the dtype of array
+    mask_zero_values {bool}: mask zero values in array
+
+    Returns
+    ------
+    result {DataFrame}: index = dates, columns = methods
+    """
 
     if not isinstance(methods, list):
         raise TypeError("methods must be a list")
 
-    if type(array) not in [np.ndarray, pd.core.frame.DataFrame]:
+    if type(array) != np.ndarray:
         raise Exception('array type {} not valid'.format(type(array)))
 
-    if len(array.shape) != 2:
-        raise Exception('array must be 2D array or DataFrame')
-
-    if type(array) == pd.core.frame.DataFrame:
-        array = array.values
+    if len(array.shape) != 3:
+        raise Exception('array must be 3D array (time, y, x)')
 
     try:
-        date_time = pd.to_datetime(date)
-    except ValueError:
-        print('pandas.to_datetime() failed with -> {}'.format(date))
+        date_time = pd.to_datetime(dates)
+    except (ValueError, TypeError) as e:
+        raise Exception('pandas.to_datetime() failed with -> {}'.format(
+            dates)) from e
 
-    # check methods and create columns list
-    cols = [x for x in methods if 'percentile' not in x]
+    if len(date_time) != array.shape[0]:
+        raise Exception('{} dates supplied for {} arrays'.format(
+                        len(date_time), array.shape[0]))
 
-    for method in methods:
-        if method not in method_options:
-            raise Exception('Method must be in {}'.format(method_options))
+    if 'approx_percentile' in methods:
+        raise Exception('approx_percentile is only available in summarize() '
+                        'and Summarizer')
 
-        if 'percentile' in method:
-            if type(percentiles) != list:
-                raise Exception('percentiles must be a list')
+    cols = check_methods(methods, percentiles)
 
-            if type(percentiles[0]) != int or type(percentiles[1]) != int:
-                raise Exception('percentiles must be list of int')
+    result = pd.DataFrame(index=date_time, columns=cols, dtype=float)
 
-            if len(percentiles) != 2 or (percentiles[1] < percentiles[0]):
-                raise Exception('percentiles must [low, high]')
+    values = array.reshape(array.shape[0], -1)
+    missing = False
 
-            cols = cols + ['{}_{}'.format(method, str(percentiles[0])),
-                           '{}_{}'.format(method, str(percentiles[1]))]
+    if masks is not None:
+        mask = compile_masks(masks)
 
-    result = pd.DataFrame(index=[date_time], columns=cols)
+        if mask.shape != array.shape[1:]:
+            raise Exception('mask dimensions {} must match array '
+                            'dimensions '
+                            '{}'.format(mask.shape, array.shape[1:]))
 
-    if masks is not None:
-        if type(masks) != list:
-            masks = [masks]
+        values = values[:, mask.index]
 
-        for idx, mask in enumerate(masks):
+        # masked out cells count as nan for methods without 'nan'
+        missing = not mask.complete
 
-            if mask.shape != array.shape:
-                raise Exception('mask dimensions {} must match array '
-                                'dimensions '
-                                '{}'.format(mask.shape, array.shape))
+        if mask_zero_values:
+            if values.dtype.kind != 'f':
+                values = values.astype(float)
 
-            if mask_zero_values:
-                ixz = array == 0
-                array[ixz] = np.nan
+            values[values == 0] = np.nan
 
-            mask = mask.astype('float')
-            mask[mask < 1] = np.nan
-            array = array * mask
+    if values.shape[1] == 0:
+        return result
 
-    for col, method in zip(cols, methods):
+    for method in methods:
 
         if 'percentile' in method:
             c1 = '{}_{}'.format(method, str(percentiles[0]))
             c2 = '{}_{}'.format(method, str(percentiles[1]))
-            v = getattr(np, method)(array, [percentiles[0], percentiles[1]])
+            v = getattr(np, method)(values, [percentiles[0], percentiles[1]],
+                                    axis=1).astype(np.float64)
 
-            if not np.isnan(v).any():
-                v = v.round(decimals)
-                result.loc[date_time, c1] = v[0]
-                result.loc[date_time, c2] = v[1]
+            # both percentiles are nan if either one is
+            v[:, np.isnan(v).any(axis=0)] = np.nan
 
-            else:
-                result.loc[date_time, c1] = np.nan
-                result.loc[date_time, c2] = np.nan
+        elif method.replace('nan', '') in ['mean', 'std']:
+            v = row_moments(getattr(np, method), values)
 
         else:
-            v = getattr(np, method)(array)
+            v = getattr(np, method)(values, axis=1).astype(np.float64)
+
+        if missing and not method.startswith('nan'):
+            v[:] = np.nan
+
+        v = v.round(decimals)
+
+        if 'percentile' in method:
+            result[c1] = v[0]
+            result[c2] = v[1]
+        else:
+            result[method] = v
+
+    return result
+
+
+def row_moments(function, values):
+    """
+    Mean or standard deviation of each row, in float64. Narrower arrays are
+    copied to float64 a block of rows at a time, numpy would subtract the
+    mean in the dtype of the values.
+
+    Args
+    ------
+    function {function}: np.mean, np.nanmean, np.std or np.nanstd
+    values {arr}: 2D array (time, cells)
+
+    Returns
+    ------
+    result {arr}: one value per row
+    """
+
+    if values.dtype == np.float64:
+        return function(values, axis=1)
+
+    step = max(1, CHUNK_SIZE // max(1, values.shape[1]))
+
+    return np.concatenate([function(values[i:i + step].astype(np.float64),
+                                    axis=1)
+                           for i in range(0, values.shape[0], step)])
+
+
+def summarize_zones(array, date, labels, methods, percentiles=[25, 75],
+                    decimals=3, basin_ids=None, mask_zero_values=False):
+    """
+    Calculate basic summary statistics for every zone of a label raster.
+
+    All zones are summarized in one pass with grouped reductions, instead of
+    one summarize() call per basin mask. Methods without the 'nan' prefix
+    are calculated over the cells of each zone, and are nan if the zone
+    contains nan values.
+
+    Args
+    ------
+    array {arr}: 2D array or DataFrame
+    date {str}: ('2019-8-18 23:00'), anything pd.to_datetime() can parse
+    labels {arr}: 2D integer array of zone labels, same shape as array
+    methods {list}: (['mean','std']), strings of numpy functions to apply
+    percentiles {list}: ([low, high]), must supply when using 'percentile'
+    decimals {int}: rounding
+    basin_ids {dict}: ({label: basin_id}) zones to summarize and their
+        basin_id, or a list of labels to use as basin_id, default is every
+        label in labels
+    mask_zero_values {bool}: mask zero values in array
 
-            if not np.isnan(v):
-                v = v.round(decimals)
-                result.loc[date_time, col] = v
+    Returns
+    ------
+    result {DataFrame}: index = (date_time, basin_id), columns = methods
+    """
+
+    if not isinstance(methods, list):
+        raise TypeError("methods must be a list")
+
+    if type(array) not in [np.ndarray, pd.core.frame.DataFrame]:
+        raise Exception('array type {} not valid'.format(type(array)))
+
+    if len(array.shape) != 2:
+        raise Exception('array must be 2D array or DataFrame')
+
+    if type(array) == pd.core.frame.DataFrame:
+        array = array.values
+
+    labels = np.asarray(labels)
+
+    if labels.shape != array.shape:
+        raise Exception('labels dimensions {} must match array dimensions '
+                        '{}'.format(labels.shape, array.shape))
+
+    if not np.issubdtype(labels.dtype, np.integer):
+        raise Exception('labels must be an integer array')
+
+    try:
+        date_time = pd.to_datetime(date)
+    except (ValueError, TypeError) as e:
+        raise Exception('pandas.to_datetime() failed with -> {}'.format(
+            date)) from e
+
+    if 'approx_percentile' in methods:
+        raise Exception('approx_percentile is only available in summarize() '
+                        'and Summarizer')
+
+    cols = check_methods(methods, percentiles)
+
+    if basin_ids is None:
+        zones = np.unique(labels)
+        ids = zones
+
+    elif type(basin_ids) == dict:
+        zones = np.array(sorted(basin_ids.keys()))
+        ids = [basin_ids[z] for z in zones]
+
+    else:
+        zones = np.array(sorted(basin_ids))
+        ids = zones
+
+    values = zonal_reduce(array, labels, zones, methods, percentiles,
+                          mask_zero_values)
+
+    index = pd.MultiIndex.from_arrays([[date_time] * len(zones),
+                                       [int(i) for i in ids]],
+                                      names=['date_time', 'basin_id'])
+    result = pd.DataFrame(index=index, columns=cols, dtype=float)
+
+    for col in cols:
+        result[col] = values[col].round(decimals)
 
     return result
 
 
+def resample_sketches(sketches, freq, percentiles=[25, 75], decimals=3):
+    """
+    Approximate percentiles over longer periods, from the sketches kept by
+    a Summarizer, without summarizing the arrays again.
+
+    Args
+    ------
+    sketches {Series}: index = dates, values = QuantileSketch, from
+        Summarizer.sketches()
+    freq {str}: ('D', 'MS'), pandas frequency of the periods
+    percentiles {list}: ([low, high])
+    decimals {int}: rounding
+
+    Returns
+    ------
+    result {DataFrame}: index = period start, columns =
+        approx_percentile_<low>, approx_percentile_<high>
+    """
+
+    cols = check_methods(['approx_percentile'], percentiles)
+    groups = sketches.groupby(pd.Grouper(freq=freq))
+    result = pd.DataFrame(index=list(groups.groups.keys()), columns=cols,
+                          dtype=float)
+
+    for period, group in groups:
+        sketch = merge_sketches(group.values)
+
+        if sketch is not None:
+            v = sketch.percentile(percentiles).round(decimals)
+            result.loc[period, cols] = v
+
+    return result.sort_index()
+
+
 def store(values, variable, database, location, run_name, basin_id, run_id,
-          date_time, overwrite=True, units=None):
+          date_time, overwrite=True, units=None, compact=False):
     '''
 
     Args
     ------
-    values : pd.DataFrame, index = date_time, columns = methods
+    values : pd.DataFrame, index = date_time, columns = methods, or the
+        (date_time, basin_id) index from summarize_zones(), in which case only
+        the basin_id rows are stored
     variable : str ('air_temp')
-    database : str, options are 'sql' or 'sqlite'
+    database : str, options are 'sql', 'sqlite', 'parquet' or 'csv'
     location : str
         mysql database: user:pwd@host/database
         sqlite database: /<path>/database.db
+        parquet or csv database: /<path>/directory
     run_name : str
     basin_id : dict
     run_id : int
     date_time : datetime
-    overwrite : bool, overwrite existing records if they exist
+    overwrite : bool, overwrite existing records if they exist, a record is
+        replaced by the one of the same run_name, basin_id, date_time,
+        variable and function, records of functions missing from values are
+        kept
     units : dict, default supplied by defaults.py, check there for format
+    compact : bool, make new databases with the compact schema, where run,
+        variable, function and unit names are stored once and referenced by
+        integer ids, databases that have tables keep their schema
+
+    '''
+
+    location, statements, count = store_statements(
+        values, variable, database, location, run_name, basin_id, run_id,
+        date_time, overwrite, units, compact)
+
+    write_statements(location, statements, count)
+
+
+def store_statements(values, variable, database, location, run_name,
+                     basin_id, run_id, date_time, overwrite=True, units=None,
+                     compact=False):
+    '''
+    Check the arguments of store() and make the statements that store values
+    in a sql or sqlite database, after making its tables. Parquet and csv
+    databases have no statements, values are stored in them here.
+
+    Args
+    ------
+    see store()
+
+    Returns
+    ------
+    location : str, connection string from make_cnx_string()
+    statements : list, see record_statements()
+    count : int, records stored
 
     '''
 
@@ -146,8 +381,9 @@ def store(values, variable, database, location, run_name, basin_id, run_id,
     if type(values) != pd.core.frame.DataFrame:
         raise Exception('values must be pandas.DataFrame')
 
-    if database not in ['sql', 'sqlite']:
-        raise Exception('database must be "sql" or "sqlite"')
+    if database not in DATABASES:
+        raise Exception('database must be "sql", "sqlite", "parquet" or '
+                        '"csv"')
 
     if type(run_name) != str:
         raise Exception('run_name must be type string')
@@ -158,110 +394,421 @@ def store(values, variable, database, location, run_name, basin_id, run_id,
     if type(basin_id) != int:
         raise Exception('basin_id must be type int')
 
+    if (isinstance(values.index, pd.MultiIndex) and
+            'basin_id' in values.index.names):
+        values = values.xs(basin_id, level='basin_id')
+
     if units is None:
         units = Units.units
 
     location = make_cnx_string(location, database)
 
-    fields = Fields.fields
+    if database in FILE_DATABASES:
+        dates = np.full(len(values), pd.Timestamp(date_time).to_datetime64())
+        frame = long_columns(values, variable, basin_id, dates)
+        count = FILE_DATABASES[database].store_frame(location, frame, run_id,
+                                                     run_name, units,
+                                                     overwrite)
+        return location, [], count
 
     # create if it doesn't exist
     if database == 'sqlite':
+        if not os.path.isfile(location.replace('sqlite:///', '', 1)):
+            create_sqlite_database(location, compact)
+
+    # tables are checked and created once per engine
+    create_schema(location, compact)
+
+    date = pd.Timestamp(np.datetime64(values.index.values[0])).to_pydatetime()
+
+    records = make_records(values, run_id, run_name, basin_id, date_time,
+                           variable, units[variable])
+
+    # existing records are upserted, or deleted in the same transaction as
+    # the insert in databases without the unique natural key
+    statements = record_statements(
+        location, records, overwrite,
+        record_filter(run_name, basin_id, date, variable, values.columns))
+
+    return location, statements, len(records)
 
-        if not os.path.isfile(location):
-            create_sqlite_database(location)
 
-        # check if inputs table exists
-        flag = check_inputs_table(location)
+def long_frame(values, variable=None, basin_id=None):
+    '''
+    Long form of results for store_many().
 
-        if not flag:
-            engine = create_engine(location)
-            Base.metadata.create_all(engine, tables=[Inputs.__table__])
+    Args
+    ------
+    values : pd.DataFrame, either long with 'function' and 'value' columns,
+        or wide with columns = methods, and date_time, variable and basin_id
+        as index levels or columns
+    variable : str, used when values has no variable level or column
+    basin_id : int, used when values has no basin_id level or column
 
-        date = pd.Timestamp(np.datetime64(values.index.values[0])).to_pydatetime()
+    Returns
+    ------
+    frame : pd.DataFrame, columns = ['date_time', 'variable', 'basin_id',
+        'function', 'value']
 
-        flag = check_existing_records(location, run_name, basin_id, date, variable)
+    '''
+
+    keys = ['date_time', 'variable', 'basin_id']
+    values = values.copy(deep=False)
 
-        if overwrite and flag:
-            delete_records(location, run_name, basin_id, date, variable)
+    # summarize() results have an unnamed date index
+    if (not isinstance(values.index, pd.MultiIndex) and
+            values.index.name is None and
+            type(values.index) == pd.DatetimeIndex):
+        values.index.name = 'date_time'
 
-        for v in values:
-            fields['run_id'] = run_id
-            fields['basin_id'] = basin_id
-            fields['run_name'] = run_name
-            fields['date_time'] = date_time
-            fields['variable'] = variable
-            fields['function'] = v
-            fields['value'] = values[v].values
-            fields['unit'] = units[variable]
+    if 'function' in values.columns and 'value' in values.columns:
+        frame = values.reset_index(
+            drop=not any(n in keys for n in values.index.names))
 
-            insert(location, 'Inputs', fields)
+    else:
+        frame = values.reset_index(
+            level=[n for n in values.index.names if n in keys])
 
-        return
+        if not all(n in keys for n in values.index.names):
+            frame = frame.reset_index(drop=True)
 
-    if database == 'sql':
+        frame = frame.melt(id_vars=[c for c in frame.columns if c in keys],
+                           var_name='function', value_name='value')
 
-        # check if inputs table exists
-        flag = check_inputs_table(location)
+    for name, default in [('variable', variable), ('basin_id', basin_id)]:
+        if name not in frame.columns:
+            if default is None:
+                raise Exception('values has no {0} level or column, {0} must '
+                                'be supplied'.format(name))
 
-        if not flag:
-            engine = create_engine(location)
-            Base.metadata.create_all(engine, tables=[Inputs.__table__])
+            frame[name] = default
 
-        date = pd.Timestamp(np.datetime64(values.index.values[0])).to_pydatetime()
+    if 'date_time' not in frame.columns:
+        raise Exception('values must have a date_time level or column')
 
-        flag = check_existing_records(location, run_name, basin_id, date, variable)
+    return frame[keys + ['function', 'value']]
 
-        if overwrite and flag:
-            delete_records(location, run_name, basin_id, date, variable)
 
-        for v in values:
-            fields['run_id'] = run_id
-            fields['basin_id'] = basin_id
-            fields['run_name'] = run_name
-            fields['date_time'] = date_time
-            fields['variable'] = variable
-            fields['function'] = v
-            fields['value'] = values[v].values
-            fields['unit'] = units[variable]
+def long_columns(values, variable, basin_id, dates):
+    '''
+    Long form of wide results of one variable and basin, as arrays, without
+    the cost of long_frame() for small frames.
+
+    Args
+    ------
+    values : pd.DataFrame, columns = methods
+    variable : str
+    basin_id : int
+    dates : 1D datetime64 array, date_time of each row of values
+
+    Returns
+    ------
+    columns : dict, 1D arrays of 'date_time', 'variable', 'basin_id',
+        'function' and 'value', every value of a method column in turn, as
+        in make_records()
+
+    '''
+
+    rows = len(values)
 
-            insert(location, 'Inputs', fields)
+    return {'date_time': np.tile(np.asarray(dates, dtype='datetime64[ns]'),
+                                 values.shape[1]),
+            'variable': np.full(values.size, variable, dtype=object),
+            'basin_id': np.full(values.size, basin_id),
+            'function': np.repeat(values.columns.values.astype(object), rows),
+            'value': values.values.astype(float).T.ravel()}
 
 
-def get_existing_records(location, database, query_dict=None):
+def store_many(values, database, location, run_name, run_id, variable=None,
+               basin_id=None, overwrite=True, units=None, compact=False):
     '''
-    Get existing database records.
+    Store results for many dates, variables and basins in one transaction.
+
+    Existing records of the same run_name, date_time, variable, basin_id and
+    function are upserted, or deleted with one statement per variable, basin
+    and function in databases without the unique natural key, and every row
+    is inserted with a single executemany. Records of other functions are
+    kept.
 
     Args
     ------
+    values : pd.DataFrame, see long_frame(), for example summarize() or
+        summarize_zones() results, or a long DataFrame with date_time,
+        variable, basin_id, function and value columns
+    database : str, options are 'sql', 'sqlite', 'parquet' or 'csv'
     location : str
-        mysql database example: user:pwd@host/database
-        sqlite database example: /<path>/database.db
+        mysql database: user:pwd@host/database
+        sqlite database: /<path>/database.db
+        parquet or csv database: /<path>/directory
+    run_name : str
+    run_id : int
+    variable : str ('air_temp'), when values has no variable level or column
+    basin_id : int, when values has no basin_id level or column
+    overwrite : bool, overwrite existing records if they exist, see store()
+    units : dict, default supplied by defaults.py, check there for format
+    compact : bool, make new databases with the compact schema, see store()
+
+    Returns
+    ------
+    count : int, rows inserted
+
+    '''
+
+    location, statements, count = store_many_statements(
+        values, database, location, run_name, run_id, variable, basin_id,
+        overwrite, units, compact)
+
+    write_statements(location, statements, count)
+
+    return count
+
+
+def store_many_statements(values, database, location, run_name, run_id,
+                          variable=None, basin_id=None, overwrite=True,
+                          units=None, compact=False):
+    '''
+    Check the arguments of store_many() and make the statements that store
+    values, see store_statements().
+
+    Args
+    ------
+    see store_many()
+
+    Returns
+    ------
+    location : str, connection string from make_cnx_string()
+    statements : list, see record_statements()
+    count : int, records stored
+
+    '''
+
+    if type(values) != pd.core.frame.DataFrame:
+        raise Exception('values must be pandas.DataFrame')
+
+    if database not in DATABASES:
+        raise Exception('database must be "sql", "sqlite", "parquet" or '
+                        '"csv"')
+
+    if type(run_name) != str:
+        raise Exception('run_name must be type string')
+
+    if type(run_id) != int:
+        raise Exception('run_id must be type int')
+
+    if units is None:
+        units = Units.units
+
+    frame = long_frame(values, variable, basin_id)
+
+    for v in frame['variable'].unique():
+        if type(v) != str:
+            raise Exception('variable must be type string')
+
+        if len(v) > 30:
+            raise Exception('variable string must be < 30 characters')
+
+    location = make_cnx_string(location, database)
+
+    if database in FILE_DATABASES:
+        count = FILE_DATABASES[database].store_frame(location, frame, run_id,
+                                                     run_name, units,
+                                                     overwrite)
+        return location, [], count
+
+    records = frame_records(frame, run_id, run_name, units)
+
+    # create if it doesn't exist
+    if database == 'sqlite':
+        if not os.path.isfile(location.replace('sqlite:///', '', 1)):
+            create_sqlite_database(location, compact)
+
+    create_schema(location, compact)
+
+    delete = None
+
+    if overwrite and not has_unique_key(location):
+        delete = record_filters(run_name, frame)
+
+    statements = record_statements(location, records, overwrite, delete)
+
+    return location, statements, len(records)
+
+
+def bulk_load(location, database, batch_rows=1000000, defer_indexes=True):
+    '''
+    Context manager for storing many results with store() and store_many()
+    from one writer. Writes are committed every batch_rows rows, and
+    secondary indexes are made again once at the end.
+
+        with bulk_load(location, 'sqlite'):
+            for date, results in daily_results:
+                store(results, value, 'sqlite', location, run_name, bid,
+                      rid, date)
+
+    Args
+    ------
+    location : str
+        mysql database: user:pwd@host/database
+        sqlite database: /<path>/database.db
     database : str, options are 'sql' or 'sqlite'
-    query_dict : dict, if None default will be
-        {'Inputs':['run_id','run_name','basin_id']}
-        For existing database records will query {table:['field1','field2']}
+    batch_rows : int, rows per commit
+    defer_indexes : bool, drop and remake the non-unique indexes
 
     Returns
     ------
-    results : dict {field:value}
+    bulk : tools.BulkLoad
 
     '''
 
     if database not in ['sql', 'sqlite']:
         raise Exception('database must be "sql" or "sqlite"')
 
-    if query_dict is None:
-        query_dict = {'Inputs': ['run_id', 'run_name', 'basin_id']}
+    return BulkLoad(make_cnx_string(location, database), batch_rows,
+                    defer_indexes)
+
+
+def get_existing_records(location, database, query_dict=None, run_name=None,
+                         basin_id=None, variable=None, function=None,
+                         start_date=None, end_date=None, chunksize=None,
+                         categorical=False, value_dtype=None):
+    '''
+    Get existing database records. Filters and columns are applied in the
+    database query.
+
+    Args
+    ------
+    location : str
+        mysql database example: user:pwd@host/database
+        sqlite database example: /<path>/database.db
+        parquet or csv database example: /<path>/directory
+    database : str, options are 'sql', 'sqlite', 'parquet' or 'csv'
+    query_dict : dict, {'Inputs':['field1','field2']} selects only those
+        fields, if None every field is selected
+    run_name : str or list, only these runs
+    basin_id : int or list, only these basins
+    variable : str or list, only these variables
+    function : str or list, only these functions
+    start_date : datetime, first date_time, inclusive
+    end_date : datetime, last date_time, inclusive
+    chunksize : int, rows per DataFrame, returns a generator of DataFrames
+        so large results are not held in memory at once
+    categorical : bool, return run_name, variable, function and unit as
+        categoricals, and integer columns with the smallest integer dtype,
+        which uses a fraction of the memory of the object columns
+    value_dtype : str or dtype, dtype of the value column, such as
+        'float32', default is float64
+
+    Returns
+    ------
+    results : pd.DataFrame, or generator of DataFrames with chunksize
+
+    '''
+
+    if database not in DATABASES:
+        raise Exception('database must be "sql", "sqlite", "parquet" or '
+                        '"csv"')
+
+    columns = query_columns(query_dict)
+    location = make_cnx_string(location, database)
+
+    if database in FILE_DATABASES:
+        return file_records(FILE_DATABASES[database], location, columns,
+                            run_name, basin_id, variable, function,
+                            start_date, end_date, chunksize, categorical,
+                            value_dtype)
+
+    # the same columns for the Inputs and the compact schema
+    statement = inputs_select(location, columns, run_name, basin_id,
+                              variable, function, start_date, end_date)
+
+    return read_records(location, statement, chunksize, categorical,
+                        value_dtype)
+
+
+def query_columns(query_dict):
+    '''Inputs fields of a query_dict, see get_existing_records().'''
+
+    columns = None
+
+    if query_dict is not None:
+        for k in query_dict.keys():
+            if k != 'Inputs':
+                raise Exception('query_dict table must be "Inputs"')
+
+            columns = list(query_dict[k])
+
+    return columns
+
+
+def file_records(module, location, columns, run_name, basin_id, variable,
+                 function, start_date, end_date, chunksize, categorical,
+                 value_dtype):
+    '''Records of a parquet or csv database, see get_existing_records().'''
+
+    filters = (run_name, basin_id, variable, function, start_date, end_date)
+
+    if chunksize is not None:
+        return (shape_records(f, categorical, value_dtype)
+                for f in module.read_chunks(location, chunksize, columns,
+                                            *filters))
+
+    return shape_records(module.read_frame(location, columns, *filters),
+                         categorical, value_dtype)
+
+
+def get_timeseries(location, database, run_name, basin_id, variable,
+                   functions=None, start=None, end=None):
+    '''
+    Get a wide time series of one variable, date_time by function, from a
+    filtered query ordered by date_time. The DataFrame is filled straight
+    from the query rows, without a long DataFrame and pivot.
+
+    Args
+    ------
+    location : str
+        mysql database example: user:pwd@host/database
+        sqlite database example: /<path>/database.db
+        parquet or csv database example: /<path>/directory
+    database : str, options are 'sql', 'sqlite', 'parquet' or 'csv'
+    run_name : str
+    basin_id : int or list, columns are (basin_id, function) for a list
+    variable : str
+    functions : str or list, default is every function
+    start : datetime, first date_time, inclusive
+    end : datetime, last date_time, inclusive
+
+    Returns
+    ------
+    results : pd.DataFrame, index = date_time, columns = functions, or
+        (basin_id, function) when basin_id is a list
+
+    '''
+
+    if database not in DATABASES:
+        raise Exception('database must be "sql", "sqlite", "parquet" or '
+                        '"csv"')
+
+    if type(functions) == str:
+        functions = [functions]
+
+    basins = type(basin_id) in [list, tuple]
+    columns = ['date_time', 'basin_id', 'function', 'value']
+
+    if not basins:
+        columns.remove('basin_id')
 
     location = make_cnx_string(location, database)
 
-    session = make_session(location)
+    if database in FILE_DATABASES:
+        rows = FILE_DATABASES[database].read_frame(
+            location, columns, run_name, basin_id, variable, functions,
+            start, end)
 
-    for k in query_dict.keys():
-        qry = session.query(Inputs)
-        results = pd.read_sql(qry.statement, qry.session.connection())
+        return wide_frame(rows.sort_values('date_time', kind='stable'),
+                          basins)
 
-    session.close()
+    statement = inputs_select(location, columns, run_name, basin_id,
+                              variable, functions, start, end)
 
-    return results
+    return read_timeseries(location, statement.order_by('date_time'),
+                           basins)
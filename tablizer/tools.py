@@ -1,22 +1,52 @@
 
-from sqlalchemy import create_engine, and_
-from tablizer.inputs import Inputs, Base
+from contextlib import contextmanager
+from sqlalchemy import create_engine, and_, inspect, select, func, event
+from sqlalchemy.pool import QueuePool
+from tablizer.inputs import Inputs, Base, KEY_FIELDS, CompactInputs, \
+    CompactBase, DIMENSIONS
 import tablizer
 import pandas as pd
+from pandas.api.types import union_categoricals
 import numpy as np
+import atexit
 import os
+import threading
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 from tablizer.defaults import Units, Fields
 
+# process wide engines, session factories and created schemas, by location
+_engines = {}
+_sessionmakers = {}
+_schemas = set()
+_unique_keys = {}
+_compact = {}
+_dimensions = {}
+_sqlite_profiles = {}
+_bulk_loads = {}
+_engines_lock = threading.Lock()
+_schemas_lock = threading.Lock()
+
+# pragmas of every new sqlite connection, see set_sqlite_profile(), None
+# leaves the sqlite default
+SQLITE_PROFILE = {'page_size': None,
+                  'journal_mode': 'WAL',
+                  'synchronous': 'NORMAL',
+                  'cache_size': -65536,
+                  'temp_store': 'MEMORY'}
+
+# rows read at a time when making compact DataFrames
+READ_CHUNK_SIZE = 100000
+
 def make_cnx_string(location, database):
     '''
-    Make a connection string for sqlalchemy for either sql or sqlite.
+    Make a connection string for sqlalchemy for either sql or sqlite, or
+    the directory of a parquet or csv database.
 
     Args
     ------
     location : str
-    database : str, either 'sql' or 'sqlite'
+    database : str, either 'sql', 'sqlite', 'parquet' or 'csv'
 
     Returns
     ------
@@ -24,8 +54,12 @@ def make_cnx_string(location, database):
 
     '''
 
-    if database not in ['sql','sqlite']:
-        raise Exception('database must be "sql" or "sqlite"')
+    if database not in ['sql','sqlite','parquet','csv']:
+        raise Exception('database must be "sql", "sqlite", "parquet" or '
+                        '"csv"')
+
+    if database in ['parquet', 'csv']:
+        location = os.path.abspath(location)
 
     if database == 'sqlite':
         if 'sqlite:///' not in location:
@@ -37,6 +71,228 @@ def make_cnx_string(location, database):
 
     return location
 
+def get_engine(location):
+    '''
+    Get the engine of a database, creating it on first use.
+
+    Engines are kept for the life of the process, so every call with the
+    same connection string shares one connection pool. MySQL connections
+    are checked before use and recycled hourly. File based sqlite databases
+    also get a QueuePool, instead of a new connection for every session,
+    and every sqlite connection gets the pragmas of set_sqlite_profile().
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+
+    Returns
+    ------
+    engine : sqlalchemy Engine
+
+    '''
+
+    engine = _engines.get(location)
+
+    if engine is not None:
+        return engine
+
+    with _engines_lock:
+        engine = _engines.get(location)
+
+        if engine is None:
+            if location.startswith('mysql'):
+                engine = create_engine(location, pool_pre_ping=True,
+                                       pool_recycle=3600)
+
+            elif location.startswith('sqlite') and ':memory:' not in location \
+                    and location != 'sqlite://':
+                engine = create_engine(
+                    location, poolclass=QueuePool,
+                    connect_args={'check_same_thread': False})
+
+            else:
+                engine = create_engine(location)
+
+            if location.startswith('sqlite'):
+                event.listen(engine, 'connect',
+                             sqlite_pragmas(sqlite_profile(location)))
+
+            _engines[location] = engine
+
+    return engine
+
+def sqlite_pragmas(profile):
+    '''
+    Connect event listener that applies sqlite pragmas.
+
+    Args
+    ------
+    profile : dict, {pragma: value}, None values are skipped
+
+    Returns
+    ------
+    listener : function(dbapi_connection, connection_record)
+
+    '''
+
+    # page_size must come before journal_mode, a WAL database keeps its size
+    pragmas = [(k, profile[k]) for k in sorted(
+        profile, key=lambda k: k != 'page_size') if profile[k] is not None]
+
+    def listener(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+
+        for name, value in pragmas:
+            cursor.execute('PRAGMA {}={}'.format(name, value))
+
+        cursor.close()
+
+    return listener
+
+def sqlite_profile(location):
+    '''
+    Pragmas of the connections of a sqlite database.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+
+    Returns
+    ------
+    profile : dict, {pragma: value}, see set_sqlite_profile()
+
+    '''
+
+    return _sqlite_profiles.get(location, SQLITE_PROFILE)
+
+def set_sqlite_profile(location, **pragmas):
+    '''
+    Change the pragmas of the connections of a sqlite database from
+    SQLITE_PROFILE, for example journal_mode='DELETE', synchronous='FULL'
+    for the sqlite defaults. The cached engine is disposed so every new
+    connection gets them. page_size only applies to new database files.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+    pragmas : pragma=value, None leaves the sqlite default
+
+    '''
+
+    for k in pragmas:
+        if k not in SQLITE_PROFILE:
+            raise Exception('pragma must be one of '
+                            '{}'.format(list(SQLITE_PROFILE.keys())))
+
+    profile = dict(SQLITE_PROFILE)
+    profile.update(pragmas)
+
+    dispose(location)
+    _sqlite_profiles[location] = profile
+
+def create_schema(location, compact=False):
+    '''
+    Create the database tables, once per engine. Databases that already
+    have tables keep their schema, compact only applies to new databases.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+    compact : bool, use the compact schema, with run, variable, function
+        and unit names in small tables referenced by integer ids
+
+    '''
+
+    if location in _schemas:
+        return
+
+    engine = get_engine(location)
+
+    # threads using a new location make its tables once, and the location
+    # is only marked once they exist
+    with _schemas_lock:
+        if location in _schemas:
+            return
+
+        # records of a plain database would be hidden by a compact schema
+        with engine.connect() as connection:
+            if engine.dialect.has_table(connection, 'CompactInputs'):
+                compact = True
+            elif engine.dialect.has_table(connection, 'Inputs'):
+                compact = False
+
+        if compact:
+            CompactBase.metadata.create_all(engine)
+        else:
+            Base.metadata.create_all(engine)
+
+        _compact[location] = compact
+        _schemas.add(location)
+
+def is_compact(location):
+    '''
+    Check if a database uses the compact schema.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+
+    Returns
+    ------
+    bool
+
+    '''
+
+    create_schema(location)
+
+    return _compact[location]
+
+def dispose(location=None):
+    '''
+    Close the pooled connections of cached engines and forget them, and
+    remove the write ahead log left by a sqlite database file that was
+    removed. Runs at exit for every engine.
+
+    Args
+    ------
+    location : str, connection string, default is every engine
+
+    '''
+
+    with _engines_lock:
+        if location is None:
+            locations = list(_engines.keys())
+        else:
+            locations = [location]
+
+        for loc in locations:
+            engine = _engines.pop(loc, None)
+            _sessionmakers.pop(loc, None)
+            _schemas.discard(loc)
+            _unique_keys.pop(loc, None)
+            _compact.pop(loc, None)
+
+            for key in [k for k in _dimensions if k[0] == loc]:
+                _dimensions.pop(key)
+
+            if engine is not None:
+                engine.dispose()
+
+            # the write ahead log of a removed sqlite database is left
+            # behind by its last connection, and must not be replayed into
+            # a new database of the same name
+            if loc.startswith('sqlite:///'):
+                path = loc.replace('sqlite:///', '', 1)
+
+                if not os.path.isfile(path):
+                    for suffix in ['-wal', '-shm']:
+                        if os.path.isfile(path + suffix):
+                            os.remove(path + suffix)
+
+# pooled sqlite connections are closed, and their write ahead logs
+# checkpointed, at exit
+atexit.register(dispose)
+
 def make_session(location):
     '''
     Make database session for sqlalchemy for either mysql or sqlite database.
@@ -52,30 +308,38 @@ def make_session(location):
     '''
 
     try:
-        engine = create_engine(location)
-        Base.metadata.create_all(engine)
+        engine = get_engine(location)
+        create_schema(location)
 
     except:
         raise Exception('Failed to make database connection with '
                         '{}'.format(location))
 
-    DBSession = sessionmaker(bind=engine)
+    DBSession = _sessionmakers.get(location)
+
+    if DBSession is None:
+        DBSession = sessionmaker(bind=engine)
+        _sessionmakers[location] = DBSession
+
     session = DBSession()
 
     return session
 
-def create_sqlite_database(location):
+def create_sqlite_database(location, compact=False):
     '''
-    Create simple sqlite database.
+    Create simple sqlite database. The pooled connections, cached schema
+    and write ahead log of a database file that was removed are dropped
+    first, so they do not keep writing to the removed file.
 
     Args
     ------
     location : str, absolute path to database ending in .db
+    compact : bool, use the compact schema, see create_schema()
 
     '''
 
-    engine = create_engine(location)
-    Base.metadata.create_all(engine)
+    dispose(location)
+    create_schema(location, compact)
 
 def check_inputs_table(location):
     '''
@@ -93,13 +357,224 @@ def check_inputs_table(location):
 
     flag = False
 
-    engine = create_engine(location)
+    engine = get_engine(location)
 
-    if engine.dialect.has_table(engine,'Inputs'):
-        flag = True
+    with engine.connect() as connection:
+        if engine.dialect.has_table(connection, 'Inputs'):
+            flag = True
 
     return flag
 
+@contextmanager
+def write_transaction(location, rows=0):
+    '''
+    Transaction of one write, or the open transaction of a BulkLoad of
+    the database, which is committed in batches. Only the thread that
+    started the BulkLoad can write to the database while it is open.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+    rows : int, rows written, counted towards the BulkLoad batch
+
+    '''
+
+    bulk = _bulk_loads.get(location)
+
+    if bulk is not None and bulk.thread != threading.get_ident():
+        raise Exception('{} is bulk loading from another thread'.format(
+            location))
+
+    if bulk is None:
+        with get_engine(location).begin() as connection:
+            yield connection
+
+    else:
+        yield bulk.connection
+        bulk.add(rows)
+
+def is_bulk_loading(location):
+    '''
+    Check if a BulkLoad of a database is open.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+
+    Returns
+    ------
+    bool
+
+    '''
+
+    return location in _bulk_loads
+
+class BulkLoad():
+    '''
+    Context manager for loading many records into a database from one
+    writer. Writes share one transaction that is committed every
+    batch_rows rows, and the non-unique Inputs indexes are dropped and
+    made again at the end, instead of being updated for every row.
+
+    Indexes are only deferred with the unique natural key, which stays to
+    find the records that are overwritten. The connection belongs to the
+    thread that enters the BulkLoad, writes of other threads raise an
+    Exception until it exits.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+    batch_rows : int, rows per commit
+    defer_indexes : bool, drop and remake the non-unique indexes
+
+    '''
+
+    def __init__(self, location, batch_rows=1000000, defer_indexes=True):
+
+        self.location = location
+        self.batch_rows = batch_rows
+        self.defer_indexes = defer_indexes
+        self.connection = None
+        self.transaction = None
+        self.rows = 0
+        self.dropped = []
+        self.thread = None
+
+    def __enter__(self):
+
+        if self.location in _bulk_loads:
+            raise Exception('{} is already bulk loading'.format(self.location))
+
+        engine = get_engine(self.location)
+        create_schema(self.location)
+
+        if self.defer_indexes and has_unique_key(self.location):
+            table = (CompactInputs if is_compact(self.location)
+                     else Inputs).__table__
+            existing = [i['name'] for i in
+                        inspect(engine).get_indexes(table.name)]
+
+            for index in table.indexes:
+                if not index.unique and index.name in existing:
+                    index.drop(engine)
+                    self.dropped.append(index)
+
+        self.connection = engine.connect()
+        self.transaction = self.connection.begin()
+        self.thread = threading.get_ident()
+        _bulk_loads[self.location] = self
+
+        return self
+
+    def add(self, rows):
+        '''Count rows written, committing a full batch.'''
+
+        self.rows += rows
+
+        if self.rows >= self.batch_rows:
+            self.commit()
+
+    def commit(self):
+        '''Commit the rows written so far.'''
+
+        self.transaction.commit()
+        self.transaction = self.connection.begin()
+        self.rows = 0
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        _bulk_loads.pop(self.location, None)
+
+        try:
+            if exc_type is None:
+                self.transaction.commit()
+
+            else:
+                self.transaction.rollback()
+
+                # ids of names added in this batch are rolled back
+                for key in [k for k in _dimensions if k[0] == self.location]:
+                    _dimensions.pop(key)
+
+        finally:
+            self.connection.close()
+
+            engine = get_engine(self.location)
+
+            for index in self.dropped:
+                index.create(engine)
+
+def make_records(values, run_id, run_name, basin_id, date_time, variable,
+                 unit):
+    '''
+    Make Inputs rows for every value of every column of a DataFrame.
+
+    Args
+    ------
+    values : pd.DataFrame, columns = functions
+    run_id : int
+    run_name : str
+    basin_id : int
+    date_time : datetime
+    variable : str
+    unit : str
+
+    Returns
+    ------
+    records : list, dicts of Inputs fields, nan values are None (NULL)
+
+    '''
+
+    records = []
+
+    for function in values:
+        for val in values[function].values:
+
+            if pd.isnull(val):
+                val = None
+            else:
+                val = float(val)
+
+            records.append({'run_id': int(run_id),
+                            'run_name': run_name,
+                            'basin_id': int(basin_id),
+                            'date_time': date_time,
+                            'variable': variable,
+                            'function': function,
+                            'value': val,
+                            'unit': unit})
+
+    return records
+
+def insert_records(location, records, delete=None, table='Inputs'):
+    '''
+    Insert rows in one transaction, with a single executemany.
+
+    Args
+    ------
+    location : str, database connection
+    records : list, dicts of table fields
+    delete : sqlalchemy expression or list of them, rows matching them are
+        deleted first, in the same transaction
+    table : str ('Inputs'), database table
+
+    '''
+
+    dbtable = getattr(tablizer.inputs, table).__table__
+
+    if delete is None:
+        delete = []
+
+    elif type(delete) != list:
+        delete = [delete]
+
+    with write_transaction(location, len(records)) as connection:
+        for where in delete:
+            connection.execute(dbtable.delete().where(where))
+
+        if records:
+            connection.execute(dbtable.insert(), records)
+
 def insert(location, table, values):
     '''
     Inserts results in database.
@@ -126,34 +601,715 @@ def insert(location, table, values):
         if k not in values.keys():
             raise Exception('values must contain "{0}":{0}'.format(k))
 
-    session = make_session(location)
+    frame = pd.DataFrame({values['function']: np.atleast_1d(values['value'])})
+    records = make_records(frame, values['run_id'], values['run_name'],
+                           values['basin_id'], values['date_time'],
+                           values['variable'], values['unit'])
+
+    insert_records(location, records, table=table)
+
+def record_filter(run_name, basin_id, date_time, variable, functions=None):
+    '''
+    Filter for the Inputs records of one run, basin, date and variable.
+
+    Args
+    ------
+    run_name : str
+    basin_id : int
+    date_time : datetime
+    variable : str
+    functions : list, only the records of these functions, default is every
+        function
+
+    Returns
+    ------
+    expression : sqlalchemy expression
+
+    '''
+
+    expression = and_((Inputs.run_name == run_name),
+                      (Inputs.basin_id == basin_id),
+                      (Inputs.date_time == date_time),
+                      (Inputs.variable == variable))
+
+    if functions is not None:
+        expression = and_(expression, Inputs.function.in_(list(functions)))
+
+    return expression
+
+def has_unique_key(location):
+    '''
+    Check if the Inputs table has the unique natural key index, databases
+    made before it was added need migrate_unique_key().
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
 
-    for val in values['value']:
+    Returns
+    ------
+    bool
+
+    '''
+
+    if is_compact(location):
+        return True
+
+    if location not in _unique_keys:
+        indexes = inspect(get_engine(location)).get_indexes('Inputs')
+        _unique_keys[location] = any(
+            i['unique'] and sorted(i['column_names']) == sorted(KEY_FIELDS)
+            for i in indexes)
+
+    return _unique_keys[location]
+
+def migrate_unique_key(location):
+    '''
+    Add the unique natural key index to the Inputs table of an existing
+    database. Duplicate records of a run_name, basin_id, date_time, variable
+    and function are deleted first, keeping the last one inserted.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+
+    Returns
+    ------
+    deleted : int, duplicate records deleted
 
-        if np.isnan(val):
-            val = None
+    '''
+
+    table = Inputs.__table__
+    engine = get_engine(location)
+    create_schema(location)
+
+    if has_unique_key(location):
+        return 0
+
+    # derived table, mysql can not select from the table it deletes from
+    keep = select([func.max(table.c.id).label('id')]).group_by(
+        *[table.c[k] for k in KEY_FIELDS]).alias('keep')
+
+    with engine.begin() as connection:
+        deleted = connection.execute(
+            table.delete().where(table.c.id.notin_(select([keep.c.id])))
+            ).rowcount
+
+        for index in table.indexes:
+            if index.name == 'uq_inputs_key':
+                index.create(connection)
+
+    _unique_keys[location] = True
+
+    return deleted
+
+def create_indexes(location):
+    '''
+    Add the indexes of the Inputs table that an existing database is
+    missing, in place. The unique natural key is added by
+    migrate_unique_key(), since duplicates must be deleted first.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+
+    Returns
+    ------
+    created : list, names of the indexes created
+
+    '''
+
+    engine = get_engine(location)
+
+    # compact tables are always made with their indexes
+    if is_compact(location):
+        return []
+
+    existing = [i['name'] for i in inspect(engine).get_indexes('Inputs')]
+    created = []
+
+    for index in Inputs.__table__.indexes:
+        if index.name in existing or index.unique:
+            continue
+
+        index.create(engine)
+        created.append(index.name)
+
+    return created
+
+def upsert_statement(location, overwrite=True, table=None):
+    '''
+    Dialect native insert of records that conflict with the unique key of a
+    table, overwriting them or keeping the existing records.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+    overwrite : bool, update existing records, otherwise keep them
+    table : sqlalchemy Table, default is Inputs
+
+    Returns
+    ------
+    statement : sqlalchemy insert statement
+
+    '''
+
+    if table is None:
+        table = Inputs.__table__
+
+    key = [c.name for i in table.indexes if i.unique for c in i.columns]
+    fields = [c.name for c in table.columns
+              if not c.primary_key and c.name not in key]
+    dialect = get_engine(location).dialect.name
+
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+
+        if not overwrite:
+            return insert(table).prefix_with('IGNORE')
+
+        statement = insert(table)
+
+        return statement.on_duplicate_key_update(
+            **{f: statement.inserted[f] for f in fields})
+
+    if not overwrite:
+        return table.insert().prefix_with('OR IGNORE')
+
+    try:
+        from sqlalchemy.dialects.sqlite import insert
+
+    except ImportError:
+        # sqlalchemy < 1.4 can not write ON CONFLICT DO UPDATE, sqlite
+        # replaces the conflicting row instead
+        return table.insert().prefix_with('OR REPLACE')
+
+    statement = insert(table)
+
+    return statement.on_conflict_do_update(
+        index_elements=key,
+        set_={f: statement.excluded[f] for f in fields})
+
+def record_statements(location, records, overwrite=True, delete=None):
+    '''
+    Statements that store Inputs records. With the unique natural key
+    records are upserted, otherwise records matching delete are deleted
+    first when overwriting.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+    records : list, dicts of Inputs fields
+    overwrite : bool, overwrite existing records
+    delete : sqlalchemy expression or list of them, existing records of
+        databases without the unique natural key
+
+    Returns
+    ------
+    statements : list, (statement, parameters) to execute in turn in one
+        transaction, parameters are a list of dicts or None
+
+    '''
+
+    table = Inputs.__table__
+
+    if not has_unique_key(location):
+        if delete is None or not overwrite:
+            delete = []
+
+        elif type(delete) != list:
+            delete = [delete]
+
+        statements = [(table.delete().where(where), None) for where in delete]
+
+        if records:
+            statements.append((table.insert(), records))
+
+        return statements
+
+    if is_compact(location):
+        records = compact_records(location, records)
+        table = CompactInputs.__table__
+
+    if not records:
+        return []
+
+    return [(upsert_statement(location, overwrite, table), records)]
+
+def write_statements(location, statements, rows=0):
+    '''
+    Execute statements from record_statements() in one write transaction.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+    statements : list, (statement, parameters)
+    rows : int, rows written, counted towards a BulkLoad batch
+
+    '''
+
+    if not statements:
+        return
+
+    with write_transaction(location, rows) as connection:
+        for statement, parameters in statements:
+            if parameters is None:
+                connection.execute(statement)
+            else:
+                connection.execute(statement, parameters)
+
+def store_records(location, records, overwrite=True, delete=None):
+    '''
+    Store Inputs records in one transaction, see record_statements().
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+    records : list, dicts of Inputs fields
+    overwrite : bool, overwrite existing records
+    delete : sqlalchemy expression or list of them, existing records of
+        databases without the unique natural key
+
+    '''
+
+    write_statements(location, record_statements(location, records,
+                                                 overwrite, delete),
+                     len(records))
+
+def dimension_ids(location, table, names):
+    '''
+    Ids of names in a compact dimension table, adding the missing names.
+    Ids are cached, dimension rows are never deleted.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+    table : sqlalchemy Table, for example RunNames.__table__
+    names : set, names
+
+    Returns
+    ------
+    ids : dict, {name: id}
+
+    '''
+
+    ids = _dimensions.setdefault((location, table.name), {})
+    missing = [n for n in names if n not in ids]
+
+    if missing:
+        with write_transaction(location) as connection:
+            connection.execute(upsert_statement(location, False, table),
+                               [{'name': n} for n in missing])
+
+            rows = connection.execute(select([table.c.name, table.c.id]).where(
+                table.c.name.in_(missing)))
+            ids.update(dict(rows.fetchall()))
+
+    return ids
+
+def compact_records(location, records):
+    '''
+    Convert Inputs records to CompactInputs records.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+    records : list, dicts of Inputs fields
+
+    Returns
+    ------
+    records : list, dicts of CompactInputs fields
+
+    '''
+
+    ids = {}
+
+    for field, dimension in DIMENSIONS.items():
+        names = set(r[field] for r in records if r[field] is not None)
+        ids[field] = dimension_ids(location, dimension.__table__, names)
+
+    compact = []
+
+    for r in records:
+        c = {'run_id': r['run_id'],
+             'basin_id': r['basin_id'],
+             'date_time': r['date_time'],
+             'value': r['value']}
+
+        for field in DIMENSIONS:
+            c[field + '_id'] = (None if r[field] is None
+                                else ids[field][r[field]])
+
+        compact.append(c)
+
+    return compact
+
+def inputs_select(location, columns=None, run_name=None, basin_id=None,
+                  variable=None, function=None, start_date=None,
+                  end_date=None):
+    '''
+    Select of the Inputs records of a database, with the columns of the
+    Inputs table for either schema. Filters are lists or single values.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+    columns : list, Inputs fields to select, default is every field
+    run_name : str or list
+    basin_id : int or list
+    variable : str or list
+    function : str or list
+    start_date : datetime, first date_time, inclusive
+    end_date : datetime, last date_time, inclusive
+
+    Returns
+    ------
+    select : sqlalchemy Select
+
+    '''
+
+    fields = [c.name for c in Inputs.__table__.columns]
+
+    if columns is None:
+        columns = fields
+
+    for c in columns:
+        if c not in fields:
+            raise Exception('column "{}" must be one of {}'.format(c, fields))
+
+    filters = {'run_name': run_name, 'basin_id': basin_id,
+               'variable': variable, 'function': function}
+    filters = {k: v for k, v in filters.items() if v is not None}
+
+    if is_compact(location):
+        table = CompactInputs.__table__
+        joins = table
+        expressions = {c.name: c for c in table.columns}
+
+        # only join the dimension tables that are selected or filtered
+        for field, dimension in DIMENSIONS.items():
+            if field not in columns and field not in filters:
+                continue
+
+            names = dimension.__table__
+            on = table.c[field + '_id'] == names.c.id
+            joins = joins.outerjoin(names, on) if field == 'unit' else \
+                joins.join(names, on)
+            expressions[field] = names.c.name
+
+    else:
+        table = Inputs.__table__
+        joins = table
+        expressions = {c.name: c for c in table.columns}
+
+    statement = select([expressions[c].label(c) for c in columns]
+                       ).select_from(joins)
+
+    for field, value in filters.items():
+        if type(value) in [list, tuple, set]:
+            statement = statement.where(expressions[field].in_(list(value)))
         else:
-            val = float(val)
+            statement = statement.where(expressions[field] == value)
 
-        output = {'run_id': int(values['run_id']),
-                  'run_name': values['run_name'],
-                  'basin_id': int(values['basin_id']),
-                  'date_time': values['date_time'],
-                  'variable': values['variable'],
-                  'function':values['function'],
-                  'value': val,
-                  'unit': values['unit']}
+    date_time = expressions['date_time']
 
-        dbtable = getattr(tablizer.inputs, table)
-        my_dbtable = dbtable()
+    if start_date is not None:
+        start_date = pd.Timestamp(start_date).to_pydatetime()
+        statement = statement.where(date_time >= start_date)
 
-        for k,v in output.items():
-            setattr(my_dbtable, k, v)
+    if end_date is not None:
+        end_date = pd.Timestamp(end_date).to_pydatetime()
+        statement = statement.where(date_time <= end_date)
 
-        session.add(my_dbtable)
-        session.commit()
+    return statement
 
-    session.close()
+def read_records(location, statement, chunksize=None, categorical=False,
+                 value_dtype=None):
+    '''
+    Read a select into a DataFrame, or a generator of DataFrames.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+    statement : sqlalchemy Select
+    chunksize : int, rows per DataFrame, returns a generator when given
+    categorical : bool, return compact DataFrames, see compact_frame()
+    value_dtype : str or dtype, dtype of the value column
+
+    Returns
+    ------
+    results : pd.DataFrame, or generator of DataFrames
+
+    '''
+
+    if chunksize is not None:
+        return read_chunks(location, statement, chunksize, categorical,
+                           value_dtype)
+
+    if not categorical:
+        with get_engine(location).connect() as connection:
+            results = pd.read_sql(statement, connection)
+
+        if value_dtype is not None and 'value' in results:
+            results['value'] = results['value'].astype(value_dtype)
+
+        return results
+
+    # compact chunks, so the object columns of every row are never held
+    frames = list(read_chunks(location, statement, READ_CHUNK_SIZE, True,
+                              value_dtype))
+
+    if not frames:
+        with get_engine(location).connect() as connection:
+            frames = [compact_frame(pd.read_sql(statement, connection),
+                                    value_dtype)]
+
+    return concat_frames(frames)
+
+def read_chunks(location, statement, chunksize, categorical=False,
+                value_dtype=None):
+    '''Generator of DataFrames, the connection is held while iterating.'''
+
+    with get_engine(location).connect() as connection:
+        connection = connection.execution_options(stream_results=True)
+
+        for chunk in pd.read_sql(statement, connection, chunksize=chunksize):
+            if categorical:
+                chunk = compact_frame(chunk, value_dtype)
+
+            elif value_dtype is not None and 'value' in chunk:
+                chunk['value'] = chunk['value'].astype(value_dtype)
+
+            yield chunk
+
+def read_timeseries(location, statement, basins=False):
+    '''
+    Read a select of (date_time, [basin_id,] function, value) rows ordered
+    by date_time into a wide DataFrame.
+
+    Args
+    ------
+    location : str, connection string from make_cnx_string()
+    statement : sqlalchemy Select
+    basins : bool, the select has a basin_id column
+
+    Returns
+    ------
+    results : pd.DataFrame, index = date_time, columns = functions, or
+        (basin_id, function) when basins
+
+    '''
+
+    with get_engine(location).connect() as connection:
+        rows = connection.execute(statement).fetchall()
+
+    columns = ['date_time', 'basin_id', 'function', 'value']
+
+    if not basins:
+        columns.remove('basin_id')
+
+    # one conversion of the row tuples, date_time becomes datetime64
+    return wide_frame(pd.DataFrame.from_records(rows, columns=columns),
+                      basins)
+
+def wide_frame(rows, basins=False):
+    '''
+    Wide DataFrame of long (date_time, [basin_id,] function, value) rows
+    ordered by date_time.
+
+    Args
+    ------
+    rows : pd.DataFrame, columns = ['date_time', 'basin_id', 'function',
+        'value']
+    basins : bool, columns are (basin_id, function)
+
+    Returns
+    ------
+    results : pd.DataFrame, index = date_time, columns = functions, or
+        (basin_id, function) when basins
+
+    '''
+
+    # rows are ordered by date_time, so the dates factorize in order
+    date_codes, index = pd.factorize(pd.to_datetime(rows['date_time']))
+    function_codes, functions = pd.factorize(rows['function'], sort=True)
+
+    if basins:
+        basin_codes, basin_ids = pd.factorize(rows['basin_id'], sort=True)
+        keys, key_codes = np.unique(basin_codes * len(functions) +
+                                    function_codes, return_inverse=True)
+        keys = pd.MultiIndex.from_arrays(
+            [basin_ids[keys // len(functions)],
+             functions[keys % len(functions)]],
+            names=['basin_id', 'function'])
+
+    else:
+        key_codes = function_codes
+        keys = pd.Index(functions, name='function')
+
+    data = np.full((len(index), len(keys)), np.nan)
+    data[date_codes, key_codes] = rows['value'].values.astype(float)
+
+    index = pd.DatetimeIndex(index, name='date_time')
+
+    return pd.DataFrame(data, index=index, columns=keys)
+
+def compact_frame(frame, value_dtype=None):
+    '''
+    Reduce the memory of an Inputs DataFrame. Name columns become
+    categoricals, date_time datetime64 and integer columns the smallest
+    integer dtype.
+
+    Args
+    ------
+    frame : pd.DataFrame, Inputs columns
+    value_dtype : str or dtype, dtype of the value column, such as float32
+
+    Returns
+    ------
+    frame : pd.DataFrame
+
+    '''
+
+    for c in frame.columns:
+        if c in DIMENSIONS:
+            frame[c] = frame[c].astype('category')
+
+        elif c == 'date_time':
+            frame[c] = pd.to_datetime(frame[c])
+
+        elif c in ['id', 'run_id', 'basin_id']:
+            frame[c] = pd.to_numeric(frame[c], downcast='integer')
+
+        elif c == 'value' and value_dtype is not None:
+            frame[c] = frame[c].astype(value_dtype)
+
+    return frame
+
+def shape_records(frame, categorical=False, value_dtype=None):
+    '''
+    DataFrame of records as asked for by get_existing_records().
+
+    Args
+    ------
+    frame : pd.DataFrame, Inputs columns
+    categorical : bool, return a compact DataFrame, see compact_frame()
+    value_dtype : str or dtype, dtype of the value column
+
+    Returns
+    ------
+    frame : pd.DataFrame
+
+    '''
+
+    if categorical:
+        return compact_frame(frame, value_dtype)
+
+    if value_dtype is not None and 'value' in frame:
+        frame['value'] = frame['value'].astype(value_dtype)
+
+    return frame
+
+def concat_frames(frames):
+    '''
+    Concatenate DataFrames from compact_frame(), keeping categoricals with
+    the union of their categories.
+
+    Args
+    ------
+    frames : list, DataFrames with the same columns
+
+    Returns
+    ------
+    frame : pd.DataFrame
+
+    '''
+
+    columns = frames[0].columns
+    categories = [c for c in columns if frames[0][c].dtype.name == 'category']
+
+    results = pd.concat([f.drop(columns=categories) for f in frames],
+                        ignore_index=True)
+
+    for c in categories:
+        results[c] = union_categoricals([f[c] for f in frames])
+
+    # integer columns are downcast per chunk
+    for c in ['id', 'run_id', 'basin_id']:
+        if c in results:
+            results[c] = pd.to_numeric(results[c], downcast='integer')
+
+    return results[columns]
+
+def frame_records(frame, run_id, run_name, units):
+    '''
+    Make Inputs rows from a long DataFrame.
+
+    Args
+    ------
+    frame : pd.DataFrame, columns = ['date_time', 'variable', 'basin_id',
+        'function', 'value']
+    run_id : int
+    run_name : str
+    units : dict, {variable: unit}
+
+    Returns
+    ------
+    records : list, dicts of Inputs fields, nan values are None (NULL)
+
+    '''
+
+    unit = {v: units[v] for v in frame['variable'].unique()}
+    dates = pd.to_datetime(frame['date_time']).dt.to_pydatetime()
+    value = frame['value'].astype(float).values
+
+    return [{'run_id': int(run_id),
+             'run_name': run_name,
+             'basin_id': int(b),
+             'date_time': d,
+             'variable': v,
+             'function': f,
+             'value': None if np.isnan(x) else float(x),
+             'unit': unit[v]}
+            for d, v, b, f, x in zip(dates, frame['variable'].values,
+                                     frame['basin_id'].values,
+                                     frame['function'].values, value)]
+
+def record_filters(run_name, frame, chunk=500):
+    '''
+    Filters for the Inputs records of every date, variable, basin and
+    function of a long DataFrame, one per variable, basin and function and at
+    most chunk dates.
+
+    Args
+    ------
+    run_name : str
+    frame : pd.DataFrame, columns include ['date_time', 'variable',
+        'basin_id', 'function']
+    chunk : int, dates per filter, keeps statements under the bound
+        parameter limit of sqlite
+
+    Returns
+    ------
+    expressions : list, sqlalchemy expressions
+
+    '''
+
+    fields = ['variable', 'basin_id', 'function']
+    keys = frame[fields + ['date_time']].drop_duplicates()
+    expressions = []
+
+    for (variable, basin_id, function), group in keys.groupby(fields):
+        dates = list(pd.to_datetime(group['date_time']).dt.to_pydatetime())
+
+        for i in range(0, len(dates), chunk):
+            expressions.append(and_((Inputs.run_name == run_name),
+                                    (Inputs.basin_id == int(basin_id)),
+                                    (Inputs.variable == variable),
+                                    (Inputs.function == function),
+                                    Inputs.date_time.in_(dates[i:i + chunk])))
+
+    return expressions
 
 def check_existing_records(location, run_name, basin_id, date_time, variable):
     '''
@@ -182,6 +1338,7 @@ def check_existing_records(location, run_name, basin_id, date_time, variable):
                                             (Inputs.variable == variable)))
 
     df = pd.read_sql(qry.statement, qry.session.connection())
+    session.close()
 
     if not df.empty:
         flag = True
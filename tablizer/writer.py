@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from tablizer.tablizer import DATABASES, long_frame, long_columns, \
+    store_many
+
+# unique key of a record of a run
+KEY_FIELDS = ['date_time', 'variable', 'basin_id', 'function']
+
+# columns of the long frame of a batch
+COLUMNS = KEY_FIELDS + ['value']
+
+# queue markers, a batch is written when the background thread gets one
+_FLUSH = object()
+_CLOSE = object()
+
+
+class StoreWriter():
+    '''
+    Store results of a run from a background thread, so that computing the
+    next results overlaps writing the last ones.
+
+    put() adds results to a bounded queue and blocks while it is full. The
+    background thread coalesces the pending results into one store_many()
+    transaction once batch_rows records are pending, or batch_seconds after
+    the first of them was queued. An error of a write is raised by the next
+    put(), flush() or close(), and later results are dropped.
+
+        with StoreWriter(location, 'sqlite', run_name, rid) as writer:
+            for date, grid in grids:
+                results = summarize(grid, date, methods)
+                writer.put(results, value, bid)
+
+    Args
+    ------
+    location : str
+        mysql database: user:pwd@host/database
+        sqlite database: /<path>/database.db
+        parquet or csv database: /<path>/directory
+    database : str, options are 'sql', 'sqlite', 'parquet' or 'csv'
+    run_name : str
+    run_id : int
+    overwrite : bool, overwrite existing records if they exist
+    units : dict, default supplied by defaults.py, check there for format
+    compact : bool, make new databases with the compact schema, see store()
+    max_pending : int, results queued at most before put() blocks
+    batch_rows : int, records per transaction, at most one put() more
+    batch_seconds : float, longest time results wait for a batch to fill
+
+    '''
+
+    def __init__(self, location, database, run_name, run_id, overwrite=True,
+                 units=None, compact=False, max_pending=1000,
+                 batch_rows=100000, batch_seconds=1.0):
+
+        if database not in DATABASES:
+            raise Exception('database must be "sql", "sqlite", "parquet" or '
+                            '"csv"')
+
+        if type(run_name) != str:
+            raise Exception('run_name must be type string')
+
+        if type(run_id) != int:
+            raise Exception('run_id must be type int')
+
+        self.location = location
+        self.database = database
+        self.run_name = run_name
+        self.run_id = run_id
+        self.overwrite = overwrite
+        self.units = units
+        self.compact = compact
+        self.batch_rows = batch_rows
+        self.batch_seconds = batch_seconds
+
+        self.rows = 0
+        self.batches = 0
+        self.error = None
+        self.closed = False
+
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name='StoreWriter')
+        self.thread.start()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        # an error in the block is not hidden by an error of a write
+        if exc_type is None:
+            self.close()
+
+        else:
+            try:
+                self.close()
+            except Exception:
+                pass
+
+    def check(self):
+        '''Raise the error of a failed write, or when closed.'''
+
+        if self.error is not None:
+            raise Exception('StoreWriter failed to store results: {}'.format(
+                self.error)) from self.error
+
+        if self.closed:
+            raise Exception('StoreWriter is closed')
+
+    def put(self, values, variable=None, basin_id=None, date_time=None,
+            timeout=None):
+        '''
+        Queue results to store, blocking while the queue is full.
+
+        Args
+        ------
+        values : pd.DataFrame, results as for store() or store_many(), every
+            basin of summarize_zones() results is stored
+        variable : str ('air_temp'), when values has no variable level or
+            column
+        basin_id : int, when values has no basin_id level or column
+        date_time : datetime, date of every row of values, as for store(),
+            default is the date_time of the index
+        timeout : float, seconds to wait for room in the queue, default is
+            waiting until there is room
+
+        '''
+
+        self.check()
+
+        if type(values) != pd.core.frame.DataFrame:
+            raise Exception('values must be pandas.DataFrame')
+
+        if variable is not None and type(variable) != str:
+            raise Exception('variable must be type string')
+
+        if date_time is not None:
+            values = values.copy(deep=False)
+            dates = pd.DatetimeIndex(np.full(
+                len(values), pd.Timestamp(date_time).to_datetime64()),
+                name='date_time')
+
+            if isinstance(values.index, pd.MultiIndex):
+                names = list(values.index.names)
+                level = names.index('date_time') if 'date_time' in names else 0
+                values.index = pd.MultiIndex.from_arrays(
+                    [dates if i == level else values.index.get_level_values(i)
+                     for i in range(len(names))])
+
+            else:
+                values.index = dates
+
+        try:
+            self.queue.put((values, variable, basin_id), timeout=timeout)
+
+        except queue.Full:
+            raise Exception('StoreWriter queue is full, {} results are '
+                            'pending'.format(self.queue.maxsize))
+
+    def flush(self):
+        '''Write the pending results and wait until they are stored.'''
+
+        self.check()
+        self.queue.put(_FLUSH)
+        self.queue.join()
+        self.check()
+
+    def close(self):
+        '''Write the pending results and stop the background thread.'''
+
+        if self.closed:
+            if self.error is not None:
+                self.check()
+
+            return
+
+        self.closed = True
+        self.queue.put(_CLOSE)
+        self.thread.join()
+
+        if self.error is not None:
+            self.check()
+
+    def run(self):
+        '''Background thread, writes batches of the queued results.'''
+
+        pending = []
+        rows = 0
+        deadline = None
+
+        while True:
+            timeout = None
+
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.monotonic())
+
+            try:
+                item = self.queue.get(timeout=timeout)
+
+            except queue.Empty:
+                # batch_seconds passed since the first pending results
+                self.write(pending)
+                pending = []
+                rows = 0
+                deadline = None
+                continue
+
+            if item is _FLUSH or item is _CLOSE:
+                self.write(pending)
+                self.queue.task_done()
+
+                pending = []
+                rows = 0
+                deadline = None
+
+                if item is _CLOSE:
+                    return
+
+                continue
+
+            pending.append(item)
+            rows += item[0].size
+
+            if deadline is None:
+                deadline = time.monotonic() + self.batch_seconds
+
+            if rows >= self.batch_rows:
+                self.write(pending)
+                pending = []
+                rows = 0
+                deadline = None
+
+    def write(self, pending):
+        '''Store queued results in one transaction.'''
+
+        try:
+            if pending and self.error is None:
+                columns = [batch_columns(*item) for item in pending]
+                frame = pd.DataFrame({
+                    c: np.concatenate([a[c] for a in columns])
+                    for c in COLUMNS})
+
+                # as with one store() each, the last results of a key win,
+                # or the first ones without overwrite
+                frame = frame.drop_duplicates(
+                    KEY_FIELDS, keep='last' if self.overwrite else 'first')
+
+                self.rows += store_many(frame, self.database, self.location,
+                                        self.run_name, self.run_id,
+                                        overwrite=self.overwrite,
+                                        units=self.units, compact=self.compact)
+                self.batches += 1
+
+        except Exception as e:
+            self.error = e
+
+        finally:
+            for item in pending:
+                self.queue.task_done()
+
+
+def batch_columns(values, variable, basin_id):
+    '''Long columns of queued results, see long_frame().'''
+
+    # summarize() results of one variable and basin, the common case
+    if (type(values.index) == pd.DatetimeIndex and variable is not None and
+            basin_id is not None and
+            not any(c in COLUMNS for c in values.columns)):
+        return long_columns(values, variable, basin_id, values.index.values)
+
+    frame = long_frame(values, variable, basin_id)
+
+    return {c: frame[c].values for c in COLUMNS}
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the `tablizer` asyncio functions."""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import numpy as np
+import pandas as pd
+
+from tablizer import aio
+from tablizer.aio import astore, astore_many, aget_existing_records
+
+
+class TestAio(unittest.TestCase):
+    """Tests for astore, astore_many and aget_existing_records."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.location = os.path.join(self.tmp, 'results.db')
+        self.values = pd.DataFrame(
+            {'mean': np.arange(4.0), 'max': np.arange(4.0) + 1},
+            index=pd.date_range('2019-01-01', periods=4, freq='H'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_concurrent_basins(self):
+        """Concurrent writes of many basins to one sqlite database."""
+
+        async def main():
+            date = self.values.index[0].to_pydatetime()
+
+            await asyncio.gather(*[
+                astore(self.values.iloc[:1] * bid, 'air_temp', 'sqlite',
+                       self.location, 'run', bid, 1, date)
+                for bid in range(1, 21)])
+
+            counts = await asyncio.gather(*[
+                astore_many(self.values * bid, 'sqlite', self.location,
+                            'run', 1, 'precip', bid)
+                for bid in range(1, 21)])
+
+            return counts, await aget_existing_records(
+                self.location, 'sqlite', run_name='run', basin_id=[3, 4])
+
+        counts, df = asyncio.run(main())
+
+        self.assertEqual(counts, [8] * 20)
+        self.assertEqual(len(df), 20)
+
+        df = df[(df['variable'] == 'air_temp') & (df['function'] == 'mean')]
+        self.assertEqual(sorted(df['basin_id']), [3, 4])
+
+    def test_first_use(self):
+        """Concurrent first use of new databases."""
+
+        async def main(path):
+            date = self.values.index[0].to_pydatetime()
+            reads = [aget_existing_records(path, 'sqlite') for i in range(8)]
+            writes = [astore(self.values.iloc[:1], 'air_temp', 'sqlite', path,
+                             'run', bid, 1, date) for bid in range(1, 5)]
+
+            await asyncio.gather(*(reads + writes))
+
+            return await aget_existing_records(path, 'sqlite')
+
+        for trial in range(5):
+            path = os.path.join(self.tmp, 'new{}.db'.format(trial))
+            df = asyncio.run(main(path))
+            self.assertEqual(sorted(df['basin_id'].unique()), [1, 2, 3, 4])
+
+    @unittest.skipIf(aio.create_async_engine is None or aio.aiosqlite is None,
+                     'sqlalchemy>=1.4 and aiosqlite are not installed')
+    def test_native(self):
+        """sqlite records are written and read by the async engine."""
+
+        self.assertEqual(aio.async_url('sqlite:///' + self.location),
+                         'sqlite+aiosqlite:///' + self.location)
+
+        blocking = [unittest.mock.patch('tablizer.aio.' + name,
+                                        side_effect=Exception)
+                    for name in ['store', 'store_many',
+                                 'get_existing_records']]
+
+        with blocking[0], blocking[1], blocking[2]:
+            self.test_concurrent_basins()
+
+            # compact databases, and a new event loop
+            path = os.path.join(self.tmp, 'compact.db')
+            count = asyncio.run(astore_many(self.values, 'sqlite', path, 'run',
+                                            1, 'precip', 1, compact=True))
+            df = asyncio.run(aget_existing_records(path, 'sqlite',
+                                                   categorical=True))
+
+        self.assertEqual(count, 8)
+        self.assertEqual(len(df), 8)
+        self.assertEqual(set(df['function']), {'mean', 'max'})
+
+    def test_fallback(self):
+        """Without an async driver the blocking calls run on the pool."""
+
+        with unittest.mock.patch('tablizer.aio.create_async_engine', None):
+            self.assertIsNone(aio.async_url('sqlite:///' + self.location))
+            self.test_concurrent_basins()
+
+    def test_database(self):
+        """Unknown databases raise before anything runs."""
+
+        self.assertRaises(Exception, asyncio.run, astore(
+            self.values, 'air_temp', 'nosql', self.location, 'run', 1, 1,
+            self.values.index[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `tablizer` batch driver."""
+
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import numpy as np
+import pandas as pd
+
+from tablizer.batch import summarize_files, main
+from tablizer.tablizer import summarize, get_existing_records
+from tablizer.tools import dispose
+from tablizer import csvstore
+
+methods = ['nanmean', 'nanmax', 'nanpercentile']
+
+
+class TestBatch(unittest.TestCase):
+    """Tests for summarize_files and the console script."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dates = pd.date_range('2019-01-01', periods=6, freq='H')
+        self.grids = []
+        self.files = []
+        rng = np.random.RandomState(1)
+
+        for i, date in enumerate(self.dates):
+            grid = rng.normal(size=(20, 30))
+            path = os.path.join(self.tmp,
+                                date.strftime('grid_%Y%m%d_%H%M') + '.npy')
+
+            if i % 2:
+                path = path.replace('.npy', '.npz')
+                np.savez(path, grid=grid)
+            else:
+                np.save(path, grid)
+
+            self.grids.append(grid)
+            self.files.append(path)
+
+        self.mask = np.ones((20, 30))
+        self.mask[:5] = 0
+        np.save(os.path.join(self.tmp, 'mask.npy'), self.mask)
+
+    def tearDown(self):
+        dispose()
+        shutil.rmtree(self.tmp)
+
+    def test_summarize_files(self):
+        """Process pool results match summarize."""
+
+        result, report = summarize_files(
+            self.files, methods, masks=[self.mask], processes=2,
+            date_format='grid_%Y%m%d_%H%M')
+
+        self.assertEqual(report['grids'], len(self.files))
+        self.assertGreater(report['grids_per_second'], 0)
+        self.assertTrue((result.index == self.dates).all())
+
+        expected = pd.concat([summarize(g, d, methods, masks=[self.mask])
+                              for g, d in zip(self.grids, self.dates)])
+        np.testing.assert_array_equal(result.values,
+                                      expected.values.astype(float))
+
+    def test_main(self):
+        """Console script stores the results."""
+
+        location = os.path.join(self.tmp, 'batch.db')
+        main(self.files + ['-m'] + methods +
+             ['--mask', os.path.join(self.tmp, 'mask.npy'),
+              '--date-format', 'grid_%Y%m%d_%H%M', '-n', '1',
+              '--database', 'sqlite', '--location', location,
+              '--variable', 'air_temp', '--run-name', 'batch',
+              '--run-id', '1', '--basin-id', '3'])
+
+        records = get_existing_records(location, 'sqlite')
+        self.assertEqual(len(records), len(self.files) * 4)
+        self.assertEqual(sorted(records['date_time'].unique()),
+                         list(self.dates.values))
+
+        # every database option, which needs where and what to store
+        main(self.files + ['-m'] + methods +
+             ['--date-format', 'grid_%Y%m%d_%H%M', '-n', '1',
+              '--database', 'csv', '--location',
+              os.path.join(self.tmp, 'batch'), '--variable', 'air_temp',
+              '--run-name', 'batch', '--run-id', '1', '--basin-id', '3'])
+        csvstore.close()
+
+        records = get_existing_records(os.path.join(self.tmp, 'batch'), 'csv')
+        self.assertEqual(len(records), len(self.files) * 4)
+
+        with unittest.mock.patch('sys.stderr'):
+            self.assertRaises(SystemExit, main, self.files + [
+                '-m', 'nanmean', '--database', 'sqlite', '--location',
+                location])
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the `tablizer` csv database."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from tablizer import csvstore
+from tablizer.tablizer import store, store_many, get_existing_records, \
+    get_timeseries
+
+
+class TestCsvStore(unittest.TestCase):
+    """Tests for the csv database."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.location = os.path.join(self.tmp, 'results')
+        self.values = pd.DataFrame(
+            {'mean': np.arange(4.0), 'max': [1.0, np.nan, 3.0, 4.0]},
+            index=pd.date_range('2019-01-01', periods=4, freq='H'))
+
+    def tearDown(self):
+        csvstore.close()
+        shutil.rmtree(self.tmp)
+
+    def test_store(self):
+        """Records are appended, overwritten and read back."""
+
+        for basin_id in [1, 2]:
+            store_many(self.values * basin_id, 'csv', self.location,
+                       'run/1', 1, 'air_temp', basin_id)
+
+        path = csvstore.file_path(self.location, 'run/1', 'air_temp')
+        self.assertTrue(path.endswith(os.path.join('run%2F1',
+                                                   'air_temp.csv')))
+
+        date = self.values.index[0].to_pydatetime()
+        store(self.values.iloc[:1] * 10, 'air_temp', 'csv', self.location,
+              'run/1', 1, 1, date)
+        self.assertEqual(store_many(self.values * 100, 'csv', self.location,
+                                    'run/1', 1, 'air_temp', 1,
+                                    overwrite=False), 0)
+
+        # overwritten lines are indexed, not rewritten
+        self.assertEqual(len(csvstore.deleted_lines(path)), 2)
+
+        # keys are found again after the file is closed
+        csvstore.close()
+        store(self.values.iloc[:1] * 20, 'air_temp', 'csv', self.location,
+              'run/1', 1, 1, date)
+
+        df = get_existing_records(self.location, 'csv')
+        self.assertEqual(len(df), 16)
+        self.assertEqual(list(df.columns), csvstore.FIELDS)
+        self.assertEqual(set(df['run_name']), {'run/1'})
+        self.assertEqual(df['value'].isnull().sum(), 2)
+
+        ts = get_timeseries(self.location, 'csv', 'run/1', 1, 'air_temp')
+        self.assertEqual(ts.loc[date, 'max'], 20.0)
+        np.testing.assert_array_equal(ts['mean'][1:],
+                                      self.values['mean'][1:])
+
+        # a key twice in one write, as two stores of it
+        long = pd.DataFrame({'date_time': [date, date], 'variable': 'precip',
+                             'function': 'mean', 'value': [1.0, 5.0]})
+
+        for basin_id, overwrite, value in [(3, False, 1.0), (4, True, 5.0)]:
+            self.assertEqual(store_many(long, 'csv', self.location, 'run/1',
+                                        1, basin_id=basin_id,
+                                        overwrite=overwrite), 1)
+            df = get_existing_records(self.location, 'csv',
+                                      basin_id=basin_id)
+            self.assertEqual(df['value'].tolist(), [value])
+
+    def test_removed_files(self):
+        """Files removed or appended to by another process are reopened."""
+
+        date = self.values.index[0].to_pydatetime()
+        values = self.values.iloc[[3]]
+        store(values, 'air_temp', 'csv', self.location, 'run', 1, 1,
+              date)
+        store(values * 2, 'air_temp', 'csv', self.location, 'run', 1,
+              1, date)
+        path = csvstore.file_path(self.location, 'run', 'air_temp')
+        self.assertTrue(os.path.isfile(path + '.deleted'))
+
+        # the directory, and then the file alone, is removed
+        shutil.rmtree(self.location)
+
+        for i in range(2):
+            store(values, 'air_temp', 'csv', self.location, 'run', 2, 1,
+                  date)
+
+        os.remove(path)
+        store(values, 'air_temp', 'csv', self.location, 'run', 1, 1,
+              date)
+        store(values * 3, 'air_temp', 'csv', self.location, 'run', 1,
+              1, date)
+
+        df = get_existing_records(self.location, 'csv')
+        self.assertEqual(df['value'].tolist(), [9.0, 12.0])
+
+        # lines appended by another process
+        with open(path, 'a') as f:
+            f.write('1,2,2019-01-01 00:00:00,mean,7.0,C\n')
+
+        store(values * 4, 'air_temp', 'csv', self.location, 'run', 2,
+              1, date)
+        df = get_existing_records(self.location, 'csv').set_index(
+            ['basin_id', 'function'])
+        self.assertEqual(len(df), 4)
+        self.assertEqual(df.loc[(2, 'mean'), 'value'], 12.0)
+        self.assertEqual(df.loc[(2, 'max'), 'value'], 16.0)
+
+    def test_filters(self):
+        """Filters, columns and chunks."""
+
+        for variable in ['air_temp', 'precip']:
+            store_many(self.values, 'csv', self.location, 'run', 1,
+                       variable, 1)
+
+        df = get_existing_records(
+            self.location, 'csv', {'Inputs': ['date_time', 'value']},
+            variable='precip', function='mean',
+            start_date='2019-01-01 02:00')
+        self.assertEqual(list(df.columns), ['date_time', 'value'])
+        self.assertEqual(list(df['value']), [2.0, 3.0])
+
+        # columns that are not in the files
+        df = get_existing_records(
+            self.location, 'csv', {'Inputs': ['id', 'variable']},
+            variable='precip')
+        self.assertEqual(list(df.columns), ['id', 'variable'])
+        self.assertEqual(list(df['id']), list(range(1, 9)))
+
+        chunks = list(get_existing_records(self.location, 'csv',
+                                           chunksize=3))
+        self.assertEqual(sum(len(c) for c in chunks), 16)
+        self.assertTrue(all(len(c) <= 3 for c in chunks))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the `tablizer` parquet database."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from tablizer import parquet
+from tablizer.tablizer import store, store_many, get_existing_records, \
+    get_timeseries
+
+
+@unittest.skipIf(parquet.pa is None, 'pyarrow is not installed')
+class TestParquet(unittest.TestCase):
+    """Tests for the parquet database."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.location = os.path.join(self.tmp, 'results')
+        self.values = pd.DataFrame(
+            {'mean': np.arange(4.0), 'max': [1.0, np.nan, 3.0, 4.0]},
+            index=pd.date_range('2019-12-31 22:00', periods=4, freq='H'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_store(self):
+        """Records are partitioned, overwritten and read back."""
+
+        for basin_id in [1, 2]:
+            store_many(self.values * basin_id, 'parquet', self.location,
+                       'run', 1, 'air_temp', basin_id)
+
+        # one partition per run, variable and year
+        years = os.listdir(os.path.join(self.location, 'run_name=run',
+                                        'variable=air_temp'))
+        self.assertEqual(sorted(years), ['year=2019', 'year=2020'])
+
+        date = self.values.index[0].to_pydatetime()
+        store(self.values.iloc[:1] * 10, 'air_temp', 'parquet',
+              self.location, 'run', 1, 1, date)
+        self.assertEqual(store_many(self.values * 100, 'parquet',
+                                    self.location, 'run', 1, 'air_temp', 1,
+                                    overwrite=False), 0)
+
+        df = get_existing_records(self.location, 'parquet')
+        self.assertEqual(len(df), 16)
+        self.assertEqual(list(df.columns), parquet.FIELDS)
+        self.assertEqual(df['value'].isnull().sum(), 2)
+
+        ts = get_timeseries(self.location, 'parquet', 'run', 1, 'air_temp')
+        self.assertEqual(ts.loc[date, 'mean'], 0.0)
+        self.assertEqual(ts.loc[date, 'max'], 10.0)
+        np.testing.assert_array_equal(ts['mean'], self.values['mean'])
+
+        # merged files read the same records
+        self.assertEqual(parquet.consolidate(self.location), 2)
+        pd.testing.assert_frame_equal(
+            get_existing_records(self.location, 'parquet'), df)
+
+        # a key twice in one write, as two stores of it
+        long = pd.DataFrame({'date_time': [date, date], 'variable': 'precip',
+                             'function': 'mean', 'value': [1.0, 5.0]})
+
+        for basin_id, overwrite, value in [(3, False, 1.0), (4, True, 5.0)]:
+            self.assertEqual(store_many(long, 'parquet', self.location, 'run',
+                                        1, basin_id=basin_id,
+                                        overwrite=overwrite), 1)
+            df = get_existing_records(self.location, 'parquet',
+                                      basin_id=basin_id)
+            self.assertEqual(df['value'].tolist(), [value])
+
+    def test_filters(self):
+        """Filters, columns and chunks."""
+
+        for variable in ['air_temp', 'precip']:
+            store_many(self.values, 'parquet', self.location, 'run', 1,
+                       variable, 1)
+
+        df = get_existing_records(
+            self.location, 'parquet', {'Inputs': ['date_time', 'value']},
+            variable='precip', function='mean', start_date='2020-01-01')
+        self.assertEqual(list(df.columns), ['date_time', 'value'])
+        self.assertEqual(list(df['value']), [2.0, 3.0])
+
+        chunks = list(get_existing_records(self.location, 'parquet',
+                                           chunksize=3, categorical=True))
+        self.assertEqual(sum(len(c) for c in chunks), 16)
+        self.assertTrue(all(len(c) <= 3 for c in chunks))
+        self.assertEqual(chunks[0]['variable'].dtype.name, 'category')
+
+        df = get_existing_records(os.path.join(self.tmp, 'none'), 'parquet')
+        self.assertEqual(len(df), 0)
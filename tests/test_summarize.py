@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `tablizer` summary calculations."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from tablizer.tablizer import summarize, summarize_stack, \
+    summarize_zones, resample_sketches
+from tablizer.summarizer import Summarizer
+from tablizer.stats import order_statistics, Moments, QuantileSketch
+from tablizer.masks import MaskCache
+import numpy as np
+import pandas as pd
+
+dates = pd.date_range('2019-01-01 00:00', periods=4, freq='H')
+methods = ['nanmean', 'nanmin', 'nanmax', 'std', 'nanstd', 'nanmedian',
+           'nanpercentile']
+
+
+def make_stack():
+    """Stack of small grids with nan values and zeros."""
+
+    rng = np.random.RandomState(7)
+    stack = rng.gamma(2.0, 3.0, size=(len(dates), 6, 5))
+    stack[0, 1, 2] = np.nan
+    stack[2, :, 0] = 0
+    stack[3] = np.nan
+
+    return stack
+
+
+class TestSummarize(unittest.TestCase):
+    """Tests for summarize and its batched variants."""
+
+    def assert_frame_matches(self, result, expected):
+        """Compare to summarize() results, column by column."""
+
+        for col in expected.columns:
+            np.testing.assert_array_equal(
+                result[col].values.astype(float),
+                expected[col].values.astype(float), err_msg=col)
+
+    def test_summarize_stack(self):
+        """summarize_stack matches summarize for every time step."""
+
+        stack = make_stack()
+        mask = np.ones(stack.shape[1:])
+        mask[:, 3:] = 0
+
+        for kwargs in [{}, {'masks': [mask], 'mask_zero_values': True}]:
+            result = summarize_stack(stack, dates, methods, [25, 75], 3,
+                                     **kwargs)
+            expected = pd.concat([summarize(stack[i].copy(), d, methods,
+                                            [25, 75], 3, **kwargs)
+                                  for i, d in enumerate(dates)])
+
+            self.assertEqual(list(result.columns), list(expected.columns))
+            self.assertTrue((result.index == expected.index).all())
+            self.assert_frame_matches(result, expected)
+
+    def test_summarize_stack_dates(self):
+        """Number of dates must match the stack."""
+
+        with self.assertRaises(Exception):
+            summarize_stack(make_stack(), dates[:2], methods)
+
+    def test_summarize_zones(self):
+        """summarize_zones matches summarize with one mask per zone."""
+
+        array = make_stack()[0]
+        labels = np.zeros(array.shape, dtype=int)
+        labels[:3, :] = 4
+        labels[3:, 2:] = 9
+        labels[5, 4] = 11
+
+        result = summarize_zones(array, dates[0], labels, methods,
+                                 [25, 75], 3, basin_ids={4: 1, 9: 2, 11: 3})
+
+        self.assertEqual(result.index.names, ['date_time', 'basin_id'])
+        self.assertEqual(list(result.index.get_level_values('basin_id')),
+                         [1, 2, 3])
+
+        for label, bid in [(4, 1), (9, 2), (11, 3)]:
+            expected = summarize(array.copy(), dates[0], methods, [25, 75],
+                                 3, masks=[labels == label])
+            nan_methods = [c for c in expected.columns if c.startswith('nan')]
+            self.assert_frame_matches(
+                result.xs(bid, level='basin_id')[nan_methods],
+                expected[nan_methods])
+
+        # plain methods use the zone cells only, nan present in zone 4
+        self.assertTrue(np.isnan(result.loc[(dates[0], 1), 'std']))
+        self.assertEqual(result.loc[(dates[0], 2), 'std'],
+                         np.std(array[labels == 9]).round(3))
+
+    def test_summarizer(self):
+        """Summarizer matches summarize over repeated calls."""
+
+        stack = make_stack()
+        mask = np.ones(stack.shape[1:])
+        mask[0, :] = 0
+        order = ['nanpercentile', 'std', 'nanmean', 'max']
+
+        summarizer = Summarizer(order, [10, 90], 2, masks=[mask],
+                                capacity=2)
+
+        for i, d in enumerate(dates):
+            row = summarizer(stack[i], d)
+            self.assertEqual(len(row), 5)
+
+        result = summarizer.to_frame()
+        self.assertEqual(len(summarizer), len(dates))
+        self.assertEqual(list(result.columns), ['std', 'nanmean', 'max',
+                                                'nanpercentile_10',
+                                                'nanpercentile_90'])
+
+        expected = pd.concat([summarize(stack[i], d, order, [10, 90], 2,
+                                        masks=[mask])
+                              for i, d in enumerate(dates)])
+        self.assert_frame_matches(result, expected)
+
+        summarizer.reset()
+        self.assertTrue(summarizer.to_frame().empty)
+
+        # equal low and high percentiles fill both columns
+        summarizer = Summarizer(['nanpercentile'], [50, 50], 2)
+        row = summarizer(stack[0], dates[0])
+        self.assertEqual(row[0], row[1])
+        self.assertEqual(row[0], np.round(np.nanpercentile(stack[0], 50), 2))
+
+    def test_bad_date(self):
+        """Dates that can not be parsed raise a clear Exception."""
+
+        stack = make_stack()
+        labels = np.ones(stack.shape[1:], dtype=int)
+
+        for call in [lambda: summarize(stack[0], 'not a date', methods),
+                     lambda: summarize_stack(stack, ['x'] * len(dates),
+                                             methods),
+                     lambda: summarize_zones(stack[0], 'not a date', labels,
+                                             ['nanmean'])]:
+            with self.assertRaisesRegex(Exception, 'to_datetime'):
+                call()
+
+    def test_order_statistics(self):
+        """One partition gives the same order statistics as numpy."""
+
+        rng = np.random.RandomState(3)
+
+        for size in [1, 2, 7, 10, 1001]:
+            values = rng.normal(size=size)
+            values[::5] = np.nan
+
+            for percentiles in [[25, 75], [0, 100], [33, 50]]:
+                stats = order_statistics(values, percentiles, median=True)
+
+                if np.isnan(values).all():
+                    self.assertEqual(stats['count'], 0)
+                    self.assertTrue(np.isnan(stats['median']))
+                    continue
+
+                self.assertEqual(stats['min'], np.nanmin(values))
+                self.assertEqual(stats['max'], np.nanmax(values))
+                self.assertEqual(stats['median'], np.nanmedian(values))
+
+                for p in percentiles:
+                    self.assertEqual(stats['percentile_{}'.format(p)],
+                                     np.nanpercentile(values, p))
+
+        stats = order_statistics(np.arange(10), [25], median=True)
+        self.assertFalse(stats['has_nan'])
+        self.assertEqual(stats['percentile_25'], 2.25)
+        self.assertEqual(stats['median'], 4.5)
+
+    def test_moments(self):
+        """Chunked moments match numpy, and merge like one pass."""
+
+        rng = np.random.RandomState(5)
+        values = rng.normal(10, 3, size=(300, 70)).astype(np.float32)
+        values[rng.random_sample(values.shape) < 0.1] = np.nan
+
+        stats = Moments(values, chunk_size=1000).result()
+        self.assertFalse(np.isnan(values).all())
+        self.assertTrue(stats['has_nan'])
+        self.assertEqual(stats['count'], np.count_nonzero(~np.isnan(values)))
+        wide = values.astype(float)
+        np.testing.assert_allclose(stats['mean'], np.nanmean(wide),
+                                   rtol=1e-12)
+        np.testing.assert_allclose(stats['std'], np.nanstd(wide), rtol=1e-12)
+
+        merged = Moments(values[:100], chunk_size=1000)
+        merged.merge(Moments(values[100:], chunk_size=1000))
+        np.testing.assert_allclose(merged.result()['std'], stats['std'],
+                                   rtol=1e-12)
+
+        empty = Moments(np.full(5, np.nan)).result()
+        self.assertEqual(empty['count'], 0)
+        self.assertTrue(np.isnan(empty['mean']))
+
+    def test_masks(self):
+        """Masks are cached and arrays are not changed in place."""
+
+        array = make_stack()[2]
+        original = array.copy()
+        mask = np.ones(array.shape, dtype=bool)
+        mask[4:, :] = False
+
+        result = summarize(array, dates[2], methods, masks=[mask],
+                           mask_zero_values=True)
+        np.testing.assert_array_equal(array, original)
+
+        values = array[:4].ravel()
+        values = values[values != 0]
+        self.assertEqual(result['nanmean'].values[0],
+                         np.nanmean(values).round(3))
+        self.assertTrue(np.isnan(result['std'].values[0]))
+
+        cache = MaskCache(maxsize=2)
+        compiled = cache.get([mask])
+        self.assertIs(cache.get([mask]), compiled)
+        self.assertIs(cache.get([mask.copy()]), compiled)
+        self.assertEqual(compiled.count, 4 * array.shape[1])
+
+        cache.get([~mask])
+        cache.get([np.ones(array.shape)])
+        self.assertEqual(len(cache), 2)
+        self.assertIsNot(cache.get([mask]), compiled)
+
+        # one mask buffer refilled in place for every basin
+        labels = np.zeros(array.shape, dtype=int)
+        labels[3:, :] = 1
+        buffer = np.zeros(array.shape, dtype=bool)
+
+        for label in [0, 1]:
+            buffer[:] = labels == label
+            result = summarize(array, dates[2], ['nanmean'], masks=[buffer])
+            self.assertEqual(result['nanmean'].values[0],
+                             np.nanmean(array[labels == label]).round(3))
+
+        # read only masks are hashed once
+        frozen = mask.copy()
+        frozen.flags.writeable = False
+        cache.get([frozen])
+        self.assertIn(id(frozen), cache._keys)
+        self.assertNotIn(id(mask), cache._keys)
+
+    def test_float32(self):
+        """float32 arrays give the same results as float64 arrays."""
+
+        stack = make_stack()
+        mask = np.ones(stack.shape[1:])
+        mask[:2, :] = 0
+        order = ['nanmean', 'nanstd', 'nanmin', 'nanmedian', 'nanpercentile']
+
+        for kwargs in [{}, {'masks': [mask]}]:
+            single = stack.astype(np.float32)
+            expected = summarize_stack(single.astype(float), dates, order,
+                                       **kwargs)
+
+            self.assert_frame_matches(
+                summarize_stack(single, dates, order, **kwargs), expected)
+            self.assert_frame_matches(
+                pd.concat([summarize(single[i], d, order, **kwargs)
+                           for i, d in enumerate(dates)]), expected)
+
+        # values far from zero, where float32 deviations lose digits
+        rng = np.random.RandomState(1)
+        many = pd.date_range('2019-01-01', periods=600, freq='H')
+        single = rng.normal(1e4, 1000, (600, 10, 10)).astype(np.float32)
+        single[:, 0, 0] = np.nan
+        order = ['nanmean', 'nanstd', 'mean', 'std']
+
+        self.assert_frame_matches(
+            summarize_stack(single, many, order),
+            summarize_stack(single.astype(float), many, order))
+
+    def test_tiles(self):
+        """Memory mapped arrays and row tiles match arrays in memory."""
+
+        array = make_stack()[0]
+        mask = np.ones(array.shape)
+        mask[:, 0] = 0
+        tmp = tempfile.mkdtemp()
+
+        try:
+            path = os.path.join(tmp, 'grid.npy')
+            np.save(path, array)
+            mapped = np.load(path, mmap_mode='r')
+
+            for kwargs in [{}, {'masks': [mask], 'mask_zero_values': True}]:
+                expected = summarize(array, dates[0], methods, **kwargs)
+
+                self.assert_frame_matches(
+                    summarize(mapped, dates[0], methods, tile_rows=2,
+                              **kwargs), expected)
+                self.assert_frame_matches(
+                    summarize((array[r:r + 4] for r in range(0, 6, 4)),
+                              dates[0], methods, **kwargs), expected)
+
+            del mapped
+
+        finally:
+            shutil.rmtree(tmp)
+
+        with self.assertRaises(Exception):
+            summarize(iter([array[:2]]), dates[0], methods, masks=[mask])
+
+    def test_approximate(self):
+        """Approximate percentiles are within the sketch accuracy."""
+
+        rng = np.random.RandomState(11)
+        array = rng.lognormal(1, 1, size=(200, 150))
+        order = ['nanmin', 'nanmedian', 'nanpercentile']
+
+        result = summarize(array, dates[0], order, [10, 90], 6,
+                           tile_rows=32, approximate=True)
+        expected = summarize(array, dates[0], order, [10, 90], 6)
+
+        self.assertEqual(result['nanmin'].values[0],
+                         expected['nanmin'].values[0])
+
+        for col in ['nanmedian', 'nanpercentile_10', 'nanpercentile_90']:
+            np.testing.assert_allclose(result[col].values,
+                                       expected[col].values, rtol=0.0101)
+
+    def test_quantile_sketch(self):
+        """Sketches merge and resample within their accuracy."""
+
+        rng = np.random.RandomState(13)
+        stack = rng.normal(5, 4, size=(48, 30, 30))
+        hours = pd.date_range('2019-01-01', periods=48, freq='H')
+
+        summarizer = Summarizer(['nanmean', 'approx_percentile'], [5, 95], 6,
+                                alpha=0.005, keep_sketches=True)
+
+        for i, d in enumerate(hours):
+            summarizer(stack[i], d)
+
+        result = summarizer.to_frame()
+        exact = np.nanpercentile(stack.reshape(48, -1), [5, 95], axis=1)
+        spread = np.abs(stack).max()
+        np.testing.assert_allclose(result['approx_percentile_5'], exact[0],
+                                   atol=0.005 * spread)
+
+        daily = resample_sketches(summarizer.sketches(), 'D', [5, 95], 6)
+        self.assertEqual(len(daily), 2)
+        exact = np.nanpercentile(stack[24:], 95)
+        self.assertLess(abs(daily['approx_percentile_95'].values[1] - exact),
+                        0.005 * abs(exact) + 1e-6)
+
+        sketch = QuantileSketch(np.arange(1, 1001), alpha=0.01)
+        other = QuantileSketch(np.arange(-1000, 1), alpha=0.01)
+        sketch.merge(other)
+        self.assertEqual(len(sketch), 2001)
+        self.assertEqual(sketch.percentile(0), -1000)
+        self.assertEqual(sketch.percentile(100), 1000)
+        self.assertLess(abs(sketch.percentile(75) - 500), 5.0)
+
+    def test_threads(self):
+        """Threaded reduction is identical to the serial path."""
+
+        rng = np.random.RandomState(17)
+        array = rng.normal(3, 2, size=(700, 500)).astype(np.float32)
+        array[rng.random_sample(array.shape) < 0.05] = np.nan
+        mask = np.ones(array.shape)
+        mask[:100] = 0
+        order = ['nanmean', 'nanstd', 'nanmin', 'nanmax', 'nanmedian',
+                 'approx_percentile', 'nanpercentile']
+
+        for kwargs in [{}, {'masks': [mask]}, {'tile_rows': 300}]:
+            serial = Summarizer(order, [25, 75], 12, **kwargs)
+            threaded = Summarizer(order, [25, 75], 12, n_threads=4, **kwargs)
+            np.testing.assert_array_equal(serial(array, dates[0]),
+                                          threaded(array, dates[0]))
+
+        # one pool for every call, dropped when a tile fails
+        threaded = Summarizer(order, [25, 75], 12, n_threads=4)
+        threaded(array, dates[0])
+        pool = threaded._pool
+        threaded(array, dates[1])
+        self.assertIs(threaded._pool, pool)
+
+        self.assertRaises(Exception, threaded, [array, array[0]], dates[2])
+        self.assertIsNone(threaded._pool)
+        self.assertEqual(len(threaded), 2)
+
+        np.testing.assert_array_equal(serial(array, dates[0]),
+                                      threaded(array, dates[0]))
+        threaded.close()
+        self.assertIsNone(threaded._pool)
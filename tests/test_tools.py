@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `tablizer` database tools."""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event, select, and_, inspect
+
+from tablizer.inputs import Inputs
+from tablizer.tablizer import store, store_many, get_existing_records, \
+    get_timeseries, summarize_zones, bulk_load
+from tablizer.tools import make_cnx_string, get_engine, make_session, \
+    check_inputs_table, dispose, create_schema, insert_records, \
+    has_unique_key, migrate_unique_key, create_indexes, record_filter, \
+    set_sqlite_profile
+from tablizer import tools, parquet
+
+
+class TestTools(unittest.TestCase):
+    """Tests for the database tools."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.location = make_cnx_string(os.path.join(self.tmp, 'tools.db'),
+                                        'sqlite')
+
+    def tearDown(self):
+        dispose()
+        shutil.rmtree(self.tmp)
+
+    def test_engine_cache(self):
+        """One engine, session factory and schema per location."""
+
+        engine = get_engine(self.location)
+        self.assertIs(get_engine(self.location), engine)
+
+        session = make_session(self.location)
+        session.close()
+        self.assertIn(self.location, tools._schemas)
+        factory = tools._sessionmakers[self.location]
+        make_session(self.location).close()
+        self.assertIs(tools._sessionmakers[self.location], factory)
+        self.assertTrue(check_inputs_table(self.location))
+
+        dispose(self.location)
+        self.assertNotIn(self.location, tools._engines)
+        self.assertNotIn(self.location, tools._schemas)
+        self.assertIsNot(get_engine(self.location), engine)
+
+    def test_concurrent_schema(self):
+        """Threads using a new database make its tables once."""
+
+        for trial in range(5):
+            path = os.path.join(self.tmp, 'new{}.db'.format(trial))
+            barrier = threading.Barrier(8)
+            errors = []
+
+            def read():
+                barrier.wait()
+
+                try:
+                    get_existing_records(path, 'sqlite')
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=read) for i in range(8)]
+
+            for t in threads:
+                t.start()
+
+            for t in threads:
+                t.join()
+
+            self.assertEqual(errors, [])
+
+    def test_removed_database(self):
+        """A removed sqlite file is made again, not written to by the pool."""
+
+        values = pd.DataFrame({'mean': [1.5]},
+                              index=pd.to_datetime(['2019-01-01']))
+        path = os.path.join(self.tmp, 'tools.db')
+        date = values.index[0].to_pydatetime()
+
+        store(values, 'air_temp', 'sqlite', path, 'run', 1, 1, date)
+        os.remove(path)
+        store(values, 'air_temp', 'sqlite', path, 'run', 2, 1, date)
+
+        self.assertTrue(os.path.isfile(path))
+        df = get_existing_records(path, 'sqlite')
+        self.assertEqual(df['basin_id'].tolist(), [2])
+
+    def test_store_bulk(self):
+        """store writes every column in one transaction, nan as NULL."""
+
+        values = pd.DataFrame({'mean': [1.5], 'max': [np.nan]},
+                              index=pd.to_datetime(['2019-01-01']))
+        path = os.path.join(self.tmp, 'tools.db')
+
+        store(values, 'air_temp', 'sqlite', path, 'run', 1, 1,
+              values.index[0].to_pydatetime())
+
+        commits = []
+        event.listen(get_engine(self.location), 'commit',
+                     lambda conn: commits.append(conn))
+        store(values * 2, 'air_temp', 'sqlite', path, 'run', 1, 1,
+              values.index[0].to_pydatetime())
+        self.assertEqual(len(commits), 1)
+
+        df = get_existing_records(path, 'sqlite')
+        self.assertEqual(len(df), 2)
+        df = df.set_index('function')
+        self.assertEqual(df.loc['mean', 'value'], 3.0)
+        self.assertTrue(pd.isnull(df.loc['max', 'value']))
+
+    def test_store_many(self):
+        """Many dates, variables and basins are stored and overwritten."""
+
+        path = os.path.join(self.tmp, 'tools.db')
+        labels = np.array([[1, 1, 2], [1, 2, 2]])
+        dates = pd.date_range('2019-01-01', periods=3, freq='H')
+        frames = []
+
+        for variable in ['air_temp', 'precip']:
+            for i, date in enumerate(dates):
+                array = np.full(labels.shape, float(i))
+                df = summarize_zones(array, date, labels, ['mean', 'max'])
+                df['variable'] = variable
+                frames.append(df.set_index('variable', append=True))
+
+        values = pd.concat(frames)
+        self.assertEqual(store_many(values, 'sqlite', path, 'run', 1), 24)
+        store_many(values * 2, 'sqlite', path, 'run', 1)
+
+        df = get_existing_records(path, 'sqlite')
+        self.assertEqual(len(df), 24)
+        self.assertEqual(sorted(df['variable'].unique()),
+                         ['air_temp', 'precip'])
+        self.assertEqual(df['value'].max(), 4.0)
+        self.assertEqual(set(df['unit']), {'C', 'mm'})
+
+        # long DataFrames with a basin_id argument
+        long = pd.DataFrame({'date_time': dates, 'variable': 'precip',
+                             'function': 'mean', 'value': [1.0, np.nan, 3.0]})
+        store_many(long, 'sqlite', path, 'run', 1, basin_id=3)
+        df = get_existing_records(path, 'sqlite')
+        self.assertEqual(len(df), 27)
+        self.assertEqual(df['value'].isnull().sum(), 1)
+
+    def test_unique_key(self):
+        """Duplicates are migrated away and records are upserted."""
+
+        path = os.path.join(self.tmp, 'tools.db')
+        values = pd.DataFrame({'mean': [1.0], 'max': [2.0]},
+                              index=pd.to_datetime(['2019-01-01']))
+        date = values.index[0].to_pydatetime()
+
+        # database made before the unique key, with duplicates
+        create_schema(self.location)
+        get_engine(self.location).execute('DROP INDEX uq_inputs_key')
+        dispose()
+        self.assertFalse(has_unique_key(self.location))
+        store(values, 'air_temp', 'sqlite', path, 'run', 1, 1, date)
+        records = [{'run_id': 1, 'run_name': 'run', 'basin_id': 1,
+                    'date_time': date, 'variable': 'air_temp',
+                    'function': 'mean', 'value': v, 'unit': 'C'}
+                   for v in [3.0, 4.0]]
+        insert_records(self.location, records)
+
+        self.assertEqual(migrate_unique_key(self.location), 2)
+        self.assertTrue(has_unique_key(self.location))
+        self.assertEqual(migrate_unique_key(self.location), 0)
+        df = get_existing_records(path, 'sqlite').set_index('function')
+        self.assertEqual(df.loc['mean', 'value'], 4.0)
+
+        store(values * 10, 'air_temp', 'sqlite', path, 'run', 1, 1, date)
+        store(values, 'air_temp', 'sqlite', path, 'run', 1, 1, date,
+              overwrite=False)
+        df = get_existing_records(path, 'sqlite').set_index('function')
+        self.assertEqual(len(df), 2)
+        self.assertEqual(df.loc['mean', 'value'], 10.0)
+        self.assertEqual(df.loc['max', 'value'], 20.0)
+
+    def test_overwrite_functions(self):
+        """Overwriting replaces only the functions stored again."""
+
+        values = pd.DataFrame({'mean': [1.0, 2.0], 'max': [3.0, 4.0]},
+                              index=pd.date_range('2019-01-01', periods=2))
+        date = values.index[0].to_pydatetime()
+        databases = [('legacy.db', 'sqlite'), ('unique.db', 'sqlite'),
+                     ('csv', 'csv')]
+
+        if parquet.pa is not None:
+            databases.append(('parquet', 'parquet'))
+
+        for name, database in databases:
+            path = os.path.join(self.tmp, name)
+
+            if name == 'legacy.db':
+                location = make_cnx_string(path, database)
+                create_schema(location)
+                get_engine(location).execute('DROP INDEX uq_inputs_key')
+                dispose()
+                self.assertFalse(has_unique_key(location))
+
+            store(values.iloc[:1], 'air_temp', database, path, 'run', 1, 1,
+                  date)
+            store(values.iloc[:1, :1] * 10, 'air_temp', database, path,
+                  'run', 1, 1, date)
+
+            store_many(values, database, path, 'run', 1, 'precip', 1)
+            store_many(values[['max']] * 10, database, path, 'run', 1,
+                       'precip', 1)
+
+            df = get_existing_records(path, database)
+            df = df.set_index(['variable', 'function', 'date_time'])
+            self.assertEqual(len(df), 6, name)
+            self.assertEqual(df.loc[('air_temp', 'mean'), 'value'].tolist(),
+                             [10.0], name)
+            self.assertEqual(df.loc[('air_temp', 'max'), 'value'].tolist(),
+                             [3.0], name)
+            self.assertEqual(df.loc[('precip', 'mean'), 'value'].tolist(),
+                             [1.0, 2.0], name)
+            self.assertEqual(df.loc[('precip', 'max'), 'value'].tolist(),
+                             [30.0, 40.0], name)
+
+    def test_create_indexes(self):
+        """Lookups search the composite index after adding it in place."""
+
+        engine = get_engine(self.location)
+        create_schema(self.location)
+        engine.execute('DROP INDEX ix_inputs_lookup')
+        self.assertEqual(create_indexes(self.location), ['ix_inputs_lookup'])
+        self.assertEqual(create_indexes(self.location), [])
+
+        table = Inputs.__table__
+        date = pd.Timestamp('2019-01-01').to_pydatetime()
+        filters = [record_filter('run', 1, date, 'air_temp'),
+                   and_(table.c.run_name == 'run',
+                        table.c.variable == 'air_temp',
+                        table.c.date_time.between(date, date))]
+
+        for where in filters:
+            sql = select([table]).where(where).compile(
+                engine, compile_kwargs={'literal_binds': True})
+            plan = engine.execute('EXPLAIN QUERY PLAN {}'.format(sql))
+            detail = ' '.join(row[-1] for row in plan)
+            self.assertIn('USING INDEX ix_inputs_lookup', detail)
+
+    def test_compact(self):
+        """The compact schema stores and reads the same records."""
+
+        plain = os.path.join(self.tmp, 'plain.db')
+        compact = os.path.join(self.tmp, 'compact.db')
+        values = pd.DataFrame({'mean': [1.0, 2.0], 'max': [np.nan, 4.0]},
+                              index=pd.date_range('2019-01-01', periods=2))
+
+        for path, kwargs in [(plain, {}), (compact, {'compact': True})]:
+            for variable in ['air_temp', 'precip']:
+                store_many(values, 'sqlite', path, 'run', 1, variable, 1,
+                           **kwargs)
+
+            # overwrites, and the compact schema is found again
+            store(values * 2, 'air_temp', 'sqlite', path, 'run', 1, 1,
+                  values.index[0].to_pydatetime())
+
+        dispose()
+        columns = ['run_id', 'run_name', 'basin_id', 'date_time', 'variable',
+                   'function', 'value', 'unit']
+        order = ['date_time', 'variable', 'function']
+        expected = get_existing_records(plain, 'sqlite')[columns]
+        result = get_existing_records(compact, 'sqlite')[columns]
+        self.assertEqual(len(result), 8)
+        pd.testing.assert_frame_equal(
+            result.sort_values(order).reset_index(drop=True),
+            expected.sort_values(order).reset_index(drop=True))
+
+        location = make_cnx_string(compact, 'sqlite')
+        names = get_engine(location).table_names()
+        self.assertIn('CompactInputs', names)
+        self.assertNotIn('Inputs', names)
+
+        # a plain database keeps its schema, so no records are hidden
+        store(values, 'air_temp', 'sqlite', plain, 'run', 1, 1,
+              values.index[0].to_pydatetime(), compact=True)
+        store_many(values, 'sqlite', plain, 'b', 1, 'precip', 1, compact=True)
+        dispose()
+
+        location = make_cnx_string(plain, 'sqlite')
+        self.assertNotIn('CompactInputs', get_engine(location).table_names())
+        self.assertEqual(len(get_existing_records(plain, 'sqlite')), 12)
+
+    def test_get_existing_records_filters(self):
+        """Filters, columns and chunks for both schemas."""
+
+        values = pd.DataFrame({'mean': np.arange(4.0), 'max': np.arange(4.0)},
+                              index=pd.date_range('2019-01-01', periods=4))
+
+        for name, kwargs in [('plain.db', {}), ('compact.db',
+                                                {'compact': True})]:
+            path = os.path.join(self.tmp, name)
+
+            for run_name in ['a', 'b']:
+                for variable in ['air_temp', 'precip']:
+                    store_many(values, 'sqlite', path, run_name, 1, variable,
+                               1, **kwargs)
+
+            df = get_existing_records(
+                path, 'sqlite', {'Inputs': ['date_time', 'value']},
+                run_name='a', variable=['precip'], function='mean',
+                start_date='2019-01-02', end_date='2019-01-03')
+            self.assertEqual(list(df.columns), ['date_time', 'value'])
+            self.assertEqual(sorted(df['value']), [1.0, 2.0])
+
+            chunks = get_existing_records(path, 'sqlite', run_name='b',
+                                          chunksize=5)
+            lengths = [len(c) for c in chunks]
+            self.assertEqual(lengths, [5, 5, 5, 1])
+
+            self.assertRaises(Exception, get_existing_records, path,
+                              'sqlite', {'Inputs': ['bad']})
+
+    def test_get_existing_records_categorical(self):
+        """Categorical records hold the same values."""
+
+        path = os.path.join(self.tmp, 'tools.db')
+        values = pd.DataFrame({'mean': np.arange(3.0), 'max': np.nan},
+                              index=pd.date_range('2019-01-01', periods=3))
+
+        for variable in ['air_temp', 'precip']:
+            store_many(values, 'sqlite', path, 'run', 1, variable, 1)
+
+        expected = get_existing_records(path, 'sqlite')
+        result = get_existing_records(path, 'sqlite', categorical=True,
+                                      value_dtype='float32')
+
+        self.assertEqual(result['variable'].dtype.name, 'category')
+        self.assertEqual(result['value'].dtype, np.float32)
+        self.assertEqual(list(result.columns), list(expected.columns))
+        self.assertEqual(list(result['variable'].astype(str)),
+                         list(expected['variable']))
+        np.testing.assert_array_equal(result['value'], expected['value'])
+
+        with unittest.mock.patch('tablizer.tools.READ_CHUNK_SIZE', 4):
+            chunked = get_existing_records(path, 'sqlite', categorical=True)
+
+        self.assertEqual(list(chunked['function'].cat.categories),
+                         ['max', 'mean'])
+        pd.testing.assert_frame_equal(chunked.astype(expected.dtypes),
+                                      expected)
+
+    def test_get_timeseries(self):
+        """Wide time series match a pivot of the long records."""
+
+        path = os.path.join(self.tmp, 'tools.db')
+        values = pd.DataFrame({'mean': np.arange(4.0),
+                               'max': [1.0, np.nan, 3.0, 4.0]},
+                              index=pd.date_range('2019-01-01', periods=4,
+                                                  freq='H'))
+
+        for basin_id in [1, 2]:
+            store_many(values * basin_id, 'sqlite', path, 'run', 1,
+                       'air_temp', basin_id)
+
+        df = get_timeseries(path, 'sqlite', 'run', 1, 'air_temp')
+        expected = values.rename_axis('date_time').rename_axis(
+            'function', axis=1)[['max', 'mean']]
+        pd.testing.assert_frame_equal(df, expected, check_freq=False)
+
+        df = get_timeseries(path, 'sqlite', 'run', [1, 2], 'air_temp',
+                            'mean', start='2019-01-01 01:00')
+        records = get_existing_records(path, 'sqlite', function='mean')
+        expected = records.pivot_table(
+            'value', 'date_time', ['basin_id', 'function'])[1:]
+        pd.testing.assert_frame_equal(df, expected, check_freq=False,
+                                      check_names=False)
+        self.assertEqual(df.columns.names, ['basin_id', 'function'])
+
+    def test_sqlite_profile(self):
+        """Pragmas are applied to every new connection."""
+
+        engine = get_engine(self.location)
+        self.assertEqual(engine.execute('PRAGMA journal_mode').scalar(),
+                         'wal')
+        self.assertEqual(engine.execute('PRAGMA synchronous').scalar(), 1)
+
+        set_sqlite_profile(self.location, journal_mode='DELETE',
+                           synchronous='FULL')
+        engine = get_engine(self.location)
+        self.assertEqual(engine.execute('PRAGMA journal_mode').scalar(),
+                         'delete')
+        self.assertEqual(engine.execute('PRAGMA synchronous').scalar(), 2)
+        self.assertRaises(Exception, set_sqlite_profile, self.location,
+                          bad=1)
+        set_sqlite_profile(self.location)
+
+    def test_bulk_load(self):
+        """Batched commits, deferred indexes and rollback."""
+
+        path = os.path.join(self.tmp, 'tools.db')
+        values = pd.DataFrame({'mean': [1.0], 'max': [2.0]},
+                              index=pd.to_datetime(['2019-01-01']))
+        dates = pd.date_range('2019-01-01', periods=5)
+        commits = []
+
+        with bulk_load(path, 'sqlite', batch_rows=4):
+            inspector = inspect(get_engine(self.location))
+            indexes = [i['name'] for i in inspector.get_indexes('Inputs')]
+            self.assertNotIn('ix_inputs_lookup', indexes)
+            self.assertIn('uq_inputs_key', indexes)
+            event.listen(get_engine(self.location), 'commit',
+                         lambda conn: commits.append(conn))
+
+            for date in dates:
+                store(values, 'air_temp', 'sqlite', path, 'run', 1, 1,
+                      date.to_pydatetime())
+
+            # 10 rows in batches of 4
+            self.assertEqual(len(commits), 2)
+
+            # other threads do not join the bulk transaction
+            errors = []
+
+            def write():
+                try:
+                    store(values, 'air_temp', 'sqlite', path, 'run', 2, 1,
+                          dates[0].to_pydatetime())
+                except Exception as e:
+                    errors.append(e)
+
+            thread = threading.Thread(target=write)
+            thread.start()
+            thread.join()
+            self.assertIn('another thread', str(errors[0]))
+        self.assertEqual(create_indexes(self.location), [])
+        self.assertEqual(len(get_existing_records(path, 'sqlite')), 10)
+
+        with self.assertRaises(ValueError):
+            with bulk_load(path, 'sqlite'):
+                store(values * 2, 'air_temp', 'sqlite', path, 'run', 1, 1,
+                      dates[0].to_pydatetime())
+                raise ValueError()
+
+        df = get_existing_records(path, 'sqlite')
+        self.assertEqual(df['value'].max(), 2.0)
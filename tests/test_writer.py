@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the `tablizer` background store writer."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from tablizer.tablizer import get_existing_records
+from tablizer.writer import StoreWriter
+
+
+class TestStoreWriter(unittest.TestCase):
+    """Tests for StoreWriter."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.location = os.path.join(self.tmp, 'results.db')
+        self.dates = pd.date_range('2019-01-01', periods=24, freq='H')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def results(self, value):
+        """One summarize() result row."""
+
+        return pd.DataFrame({'mean': [value], 'max': [value + 1.0]},
+                            index=[self.dates[0]])
+
+    def test_batches(self):
+        """Results of many puts are stored in a few transactions."""
+
+        with StoreWriter(self.location, 'sqlite', 'run', 1,
+                         batch_rows=20, batch_seconds=60) as writer:
+            for i, date in enumerate(self.dates):
+                writer.put(self.results(float(i)), 'air_temp', 1, date)
+
+            # the same key again, the last results win
+            writer.put(self.results(100.0), 'air_temp', 1, self.dates[0])
+            writer.flush()
+
+            self.assertEqual(writer.batches, 3)
+            self.assertEqual(writer.rows, 50)
+
+            writer.put(self.results(-1.0), 'air_temp', 2, self.dates[0])
+
+        df = get_existing_records(self.location, 'sqlite', basin_id=1,
+                                  function='mean')
+        df = df.sort_values('date_time')
+        self.assertEqual(len(df), 24)
+        np.testing.assert_allclose(df['value'].values,
+                                   [100.0] + list(range(1, 24)))
+
+        df = get_existing_records(self.location, 'sqlite', basin_id=2)
+        self.assertEqual(len(df), 2)
+
+        # closing again does nothing, putting after close raises
+        writer.close()
+        self.assertRaises(Exception, writer.put, self.results(0.0),
+                          'air_temp', 1)
+
+    def test_overwrite(self):
+        """Without overwrite the first results of a key are kept."""
+
+        with StoreWriter(self.location, 'sqlite', 'run', 1,
+                         overwrite=False) as writer:
+            writer.put(self.results(1.0), 'air_temp', 1, self.dates[0])
+            writer.put(self.results(5.0), 'air_temp', 1, self.dates[0])
+
+        df = get_existing_records(self.location, 'sqlite', function='mean')
+        self.assertEqual(df['value'].tolist(), [1.0])
+
+    def test_batch_seconds(self):
+        """Pending results are written after batch_seconds."""
+
+        writer = StoreWriter(self.location, 'sqlite', 'run', 1,
+                             batch_seconds=0.01)
+        writer.put(self.results(1.0), 'air_temp', 1, self.dates[0])
+        writer.queue.join()
+
+        self.assertEqual(writer.batches, 1)
+        writer.close()
+
+    def test_error(self):
+        """Errors of the background thread are raised to the caller."""
+
+        writer = StoreWriter(self.location, 'sqlite', 'run', 1)
+        writer.put(self.results(1.0), 'not_a_variable', 1, self.dates[0])
+
+        self.assertRaises(Exception, writer.flush)
+        self.assertRaises(Exception, writer.put, self.results(1.0),
+                          'air_temp', 1)
+        self.assertRaises(Exception, writer.close)
+
+
+if __name__ == '__main__':
+    unittest.main()